@@ -13,4 +13,19 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up, as it reads the settings and models.
+from core import events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Stream change events ourselves, Django handles everything else.
+
+    Django 3.2 serves a streaming response from a thread, which would
+    take one per idle client.
+    """
+    if scope['type'] == 'http' and scope['path'] == events.PATH:
+        return await events.stream(scope, receive, send)
+
+    return await django_application(scope, receive, send)
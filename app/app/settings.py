@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -33,6 +34,10 @@ ALLOWED_HOSTS = []
 # Enabling apps
 # To create app, use python manage.py startapp {app_name}
 
+# The schema and docs need drf_spectacular, which is slow to import. Turn
+# them off on workers which only serve the API, so they start faster.
+ENABLE_API_DOCS = os.environ.get('ENABLE_API_DOCS', '1') == '1'
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -43,12 +48,20 @@ INSTALLED_APPS = [
     'core',
     'rest_framework',
     'rest_framework.authtoken',
-    'drf_spectacular',
     'user',
     'recipe',
+    'monitoring',
 ]
 
+if ENABLE_API_DOCS:
+    INSTALLED_APPS.append('drf_spectacular')
+
 MIDDLEWARE = [
+    # Outermost, so the totals cover the whole request.
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    # Before anything else touching the body.
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,6 +103,55 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
+        # Seconds connections are kept open between requests, 0 closes
+        # them after each request.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+    }
+}
+
+# Read replicas are given as a comma separated list of hosts and share the
+# credentials of the primary. In tests they mirror 'default' so no extra
+# test databases are created.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))
+):
+    alias = f'replica_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# How long a user keeps reading from the primary after a write,
+# so they always see their own changes.
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.environ.get('DB_REPLICA_STICKY_SECONDS', 5)
+)
+
+
+# Seconds a readiness probe result is reused before the
+# databases are queried again.
+HEALTH_CHECK_CACHE_SECONDS = float(
+    os.environ.get('HEALTH_CHECK_CACHE_SECONDS', 5)
+)
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# The local memory cache is per process. Point CACHE_BACKEND and
+# CACHE_LOCATION at a shared cache when running several workers.
+CACHE_BACKEND = os.environ.get(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
@@ -136,6 +198,39 @@ MEDIA_URL = '/static/media/'
 MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = '/vol/web/static'
 
+# collectstatic writes .br and .gz versions of compressible static files,
+# for the web server to send as they are.
+STATICFILES_STORAGE = 'core.storage.CompressedStaticFilesStorage'
+
+# Responses are compressed on the fly when at least MIN_SIZE bytes long.
+# Quality and level trade size for CPU time, from 0 or 1 up to 11 or 9.
+COMPRESSION = {
+    'MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+    'BROTLI_QUALITY': 4,
+    'GZIP_LEVEL': 6,
+}
+
+# Uploaded recipe images are shrunk to fit in a square of this many pixels.
+RECIPE_IMAGE_MAX_SIZE = int(os.environ.get('RECIPE_IMAGE_MAX_SIZE', 2048))
+
+# Bulk image uploads are refused above this many bytes or images, and
+# that many are checked and stored at once. Images above
+# FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to disk instead of memory.
+RECIPE_BULK_UPLOAD_MAX_BYTES = int(
+    os.environ.get('RECIPE_BULK_UPLOAD_MAX_BYTES', 100 * 1024 * 1024)
+)
+RECIPE_BULK_UPLOAD_MAX_ITEMS = int(
+    os.environ.get('RECIPE_BULK_UPLOAD_MAX_ITEMS', 100)
+)
+RECIPE_BULK_UPLOAD_WORKERS = int(
+    os.environ.get('RECIPE_BULK_UPLOAD_WORKERS', 4)
+)
+
+# Rows deleted per transaction, and transactions per job, when purging the
+# data of a deleted user.
+USER_PURGE_BATCH_SIZE = int(os.environ.get('USER_PURGE_BATCH_SIZE', 1000))
+USER_PURGE_BATCHES_PER_JOB = 50
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -145,11 +240,105 @@ AUTH_USER_MODEL = 'core.User'
 
 # Tell Rest how to use this schema
 REST_FRAMEWORK = {
-    'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Without the docs, drf_spectacular isn't imported, see core.openapi.
+    'DEFAULT_SCHEMA_CLASS': (
+        'drf_spectacular.openapi.AutoSchema' if ENABLE_API_DOCS
+        else 'rest_framework.schemas.openapi.AutoSchema'
+    ),
+    # Views opt in with a throttle_scope. Set a rate to '' to disable it.
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.ScopedTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        # Signing up and logging in hash passwords, which is expensive.
+        'auth': os.environ.get('THROTTLE_RATE_AUTH', '20/min') or None,
+        'recipes': os.environ.get('THROTTLE_RATE_RECIPES', '600/min') or None,
+    },
+    # Proxies in front of the app, whose X-Forwarded-For entries are
+    # trusted to tell clients apart. Without any, only REMOTE_ADDR is.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
+# Tag and ingredient lists are cached per user until they change. A write
+# only invalidates the lists in the cache of its own process, so this is
+# off by default unless the cache is shared by every worker.
+LIST_CACHE_ENABLED = os.environ.get(
+    'LIST_CACHE_ENABLED', '0' if 'locmem' in CACHE_BACKEND else '1'
+) == '1'
+LIST_CACHE_SECONDS = int(os.environ.get('LIST_CACHE_SECONDS', 300))
+
+# Users whose recipe similarity index each process keeps in memory.
+SIMILARITY_CACHE_USERS = int(os.environ.get('SIMILARITY_CACHE_USERS', 32))
+
+# Deletions are kept in the change log of synced clients this many days.
+# Clients syncing less often have to download everything again.
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30))
+
+# Seconds between comments sent on idle event streams, which keep proxies
+# from closing them.
+EVENTS_HEARTBEAT_SECONDS = float(
+    os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15)
+)
+
+# Paginated lists count at most this many rows, larger counts are estimated.
+PAGINATION_EXACT_COUNT_THRESHOLD = int(
+    os.environ.get('PAGINATION_EXACT_COUNT_THRESHOLD', 1000)
+)
+
+# Token buckets are kept in an mmap'd table. Point THROTTLE_STORE_PATH at a
+# file to share it between the worker processes of a host.
+THROTTLE_STORE_PATH = os.environ.get('THROTTLE_STORE_PATH') or None
+THROTTLE_SLOTS = int(os.environ.get('THROTTLE_SLOTS', 65536))
+
 # We need this to enable image upload to work through the browser interface.
 # By default the image uploads were not working properly.
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
+
+# Workers warm up when loading app.wsgi, and report ready only afterwards.
+# Database connections opened then are kept with DB_CONN_MAX_AGE. Don't use
+# gunicorn's --preload, or the workers would share them.
+WARMUP_ON_STARTUP = os.environ.get('WARMUP_ON_STARTUP', '0') == '1'
+
+# The schema is generated once per code version and kept in this directory.
+# Set APP_VERSION, e.g. to the git commit, when building the image; without
+# it the version is a hash of the source files.
+APP_VERSION = os.environ.get('APP_VERSION', '')
+SCHEMA_CACHE_DIR = os.environ.get(
+    'SCHEMA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'api-schema')
+)
+
+# Per-request timings sent in a Server-Timing header.
+# ENDPOINT_SAMPLE_RATES overrides SAMPLE_RATE by URL name,
+# e.g. {'recipe:recipe-list': 0.1}.
+SERVER_TIMING = {
+    'ENABLED': os.environ.get('SERVER_TIMING_ENABLED', '1') == '1',
+    'SAMPLE_RATE': float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', 1.0)),
+    'ENDPOINT_SAMPLE_RATES': {},
+    'LOG': os.environ.get('SERVER_TIMING_LOG', '0') == '1',
+}
+
+# Prometheus metrics served at /api/metrics/. Set PROMETHEUS_MULTIPROC_DIR
+# to an empty directory to aggregate metrics of several worker processes.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Scrapers send it as 'Authorization: Bearer <token>'. Without one the
+# metrics are served to nobody.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['console'],
+            'level': os.environ.get('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -13,10 +13,6 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from drf_spectacular.views import (
-    SpectacularAPIView,
-    SpectacularSwaggerView,
-)
 from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
@@ -24,20 +20,30 @@ from django.conf import settings
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    # We add two url that would help us generate the schema for our API
-    # YAML file that describes the API
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
-    # Serve the Swagger docs that will use our schema to generate a GUI
-    # for our doc.
-    path(
-        'api/docs/',
-        SpectacularSwaggerView.as_view(url_name='api-schema'),
-        name='api-docs',
-    ),
     path('api/user/', include('user.urls')),
     path('api/recipes/', include('recipe.urls')),
+    path('api/', include('monitoring.urls')),
 ]
 
+if settings.ENABLE_API_DOCS:
+    # Imported here, drf_spectacular slows down starting a worker.
+    from drf_spectacular.views import SpectacularSwaggerView
+
+    from core.views import CachedSchemaView
+
+    urlpatterns += [
+        # We add two url that would help us generate the schema for our API
+        # YAML file that describes the API, built once per code version
+        path('api/schema/', CachedSchemaView.as_view(), name='api-schema'),
+        # Serve the Swagger docs that will use our schema to generate a GUI
+        # for our doc.
+        path(
+            'api/docs/',
+            SpectacularSwaggerView.as_view(url_name='api-schema'),
+            name='api-docs',
+        ),
+    ]
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL,
@@ -8,6 +8,7 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 
 from core import models
+from user.tasks import delete_user
 
 
 class UserAdmin(BaseUserAdmin):
@@ -29,9 +30,9 @@ class UserAdmin(BaseUserAdmin):
                 )
             }
         ),
-        (_('Important dates'), {'fields': ('last_login',)})
+        (_('Important dates'), {'fields': ('last_login', 'deleted_at')})
     )
-    readonly_fields = ['last_login']
+    readonly_fields = ['last_login', 'deleted_at']
     add_fieldsets = (
         (None, {
             # Make the page neater and tidier
@@ -48,9 +49,27 @@ class UserAdmin(BaseUserAdmin):
         }),
     )
 
+    # Users are deleted in the background, see user.tasks.purge_user.
+    def delete_model(self, request, obj):
+        delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            delete_user(user)
+
+    def get_deleted_objects(self, objs, request):
+        # Listing every recipe of a large account would be as slow as
+        # deleting it, so the confirmation page only names the users.
+        to_delete = [str(obj) for obj in objs]
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return to_delete, {}, perms_needed, []
+
 
 # Register models here.
 admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Recipe)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
+admin.site.register(models.Job)
@@ -0,0 +1,109 @@
+"""
+Caching of per-user lists, invalidated by bumping a version.
+
+Every cached list of a user is keyed with the current version of that
+user's data for the model. Changing the data bumps the version, so stale
+entries are never read again and simply expire.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.metrics import record_cache
+
+
+# How long a process computing a value keeps others waiting for it.
+LOCK_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+
+# Per-key locks of the threads of this process, with their user count.
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _version_key(model, user_id):
+    return f'list-version:{model._meta.label_lower}:{user_id}'
+
+
+def bump_version(model, user_id):
+    """Invalidate the cached lists of model for a user, once committed."""
+    # Bumping before commit would let a concurrent request cache the old
+    # rows under the new version.
+    transaction.on_commit(
+        lambda: cache.set(_version_key(model, user_id), uuid.uuid4().hex, None)
+    )
+
+
+def list_key(model, user_id, *parts):
+    """Return the cache key of a list of model for a user."""
+    version = cache.get(_version_key(model, user_id), 0)
+    suffix = ':'.join(str(part) for part in parts)
+    return f'list:{model._meta.label_lower}:{user_id}:{version}:{suffix}'
+
+
+class _KeyLock:
+    """Lock shared by the threads of this process working on one key."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        with _locks_guard:
+            entry = _locks.setdefault(self.key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def __exit__(self, *exc_info):
+        with _locks_guard:
+            entry = _locks[self.key]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[self.key]
+
+
+def get_or_compute(name, key, compute, timeout=None):
+    """Return the cached value of key, computing it once on a miss.
+
+    Concurrent misses for a key are single-flight: threads of a process
+    queue on a lock, and processes sharing the cache wait for whichever
+    one took the lock entry. name labels the cache in the metrics.
+    """
+    if timeout is None:
+        timeout = settings.LIST_CACHE_SECONDS
+    value = cache.get(key)
+    if value is not None:
+        record_cache(name, True)
+        return value
+
+    with _KeyLock(key):
+        # Another thread may have filled it while we waited.
+        value = cache.get(key)
+        if value is not None:
+            record_cache(name, True)
+            return value
+
+        record_cache(name, False)
+        lock_key = f'lock:{key}'
+        owner = cache.add(lock_key, True, LOCK_TIMEOUT)
+        if not owner:
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                value = cache.get(key)
+                if value is not None:
+                    return value
+            # The other process died or is stuck, so don't wait on it.
+
+        try:
+            value = compute()
+            cache.set(key, value, timeout)
+        finally:
+            if owner:
+                cache.delete(lock_key)
+
+        return value
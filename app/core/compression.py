@@ -0,0 +1,101 @@
+"""
+Brotli and gzip compression of responses and static files.
+
+Brotli is optional. Without the Brotli package installed, only gzip is
+offered.
+"""
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Content types worth compressing. Images, video and archives are
+# compressed already.
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/vnd.oai.openapi',
+    'image/svg+xml',
+)
+
+# Static file extensions compressed by collectstatic.
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.json', '.map', '.svg', '.html', '.txt', '.xml',
+)
+
+# File suffix of each encoding, also its order of preference.
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def available_encodings():
+    return [
+        encoding for encoding in SUFFIXES
+        if encoding != 'br' or brotli is not None
+    ]
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def choose_encoding(accept_encoding):
+    """Return the preferred encoding the client accepts, or None."""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    def quality(encoding):
+        return accepted.get(encoding, accepted.get('*', 0.0))
+
+    # The client's preference wins, ties go to the smaller output.
+    encodings = available_encodings()
+    best = max(encodings, key=lambda encoding: (
+        quality(encoding), -encodings.index(encoding)
+    ))
+    return best if quality(best) > 0 else None
+
+
+def compress(data, encoding, level):
+    """Compress bytes, level being the brotli quality or gzip level."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+
+    # mtime=0 makes the output depend on the data only.
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress an iterable of bytes chunk by chunk."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            # Flushing sends every chunk on, as streaming clients expect.
+            compressed = compressor.process(chunk) + compressor.flush()
+            if compressed:
+                yield compressed
+        yield compressor.finish()
+        return
+
+    # wbits 16 + MAX_WBITS writes the gzip header and trailer.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        compressed += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
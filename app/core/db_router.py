@@ -0,0 +1,94 @@
+"""
+Database routing for read replicas.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.permissions import SAFE_METHODS
+
+
+# Alias of the replica the current request reads from.
+# A ContextVar keeps this correct for both threaded and async servers.
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def _pin_key(user_id):
+    return f'db-primary-pin:{user_id}'
+
+
+def pin_to_primary(user):
+    """Keep the user on the primary for a short while after a write."""
+    cache.set(
+        _pin_key(user.pk),
+        True,
+        settings.DATABASE_REPLICA_STICKY_SECONDS,
+    )
+
+
+def replica_for(request):
+    """Return the replica alias a request should read from, or None."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or request.method not in SAFE_METHODS:
+        return None
+
+    user = request.user
+    if user.is_authenticated and cache.get(_pin_key(user.pk)):
+        return None
+
+    return random.choice(replicas)
+
+
+class ReplicaRouter:
+    """Send reads to the replica chosen for the request, writes to default."""
+
+    def db_for_read(self, model, **hints):
+        # None falls back to 'default'.
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaReadMixin:
+    """Serve safe requests of a view from a read replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        self._read_alias_token = None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Even when the view raised, or later requests on this thread
+            # would keep reading from the replica.
+            if self._read_alias_token is not None:
+                _read_alias.reset(self._read_alias_token)
+                self._read_alias_token = None
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication happens here, so the user is known afterwards.
+        super().initial(request, *args, **kwargs)
+        alias = replica_for(request)
+        if alias:
+            self._read_alias_token = _read_alias.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user)
+
+        return response
@@ -0,0 +1,229 @@
+"""
+Pushing change notifications to clients as Server-Sent Events.
+
+Every write to the change log of synced clients (core.models.Change)
+NOTIFYs a PostgreSQL channel through a trigger, when its transaction
+commits. Each ASGI process LISTENs on one connection of its own and fans
+the notifications out to the streams of the users they are about. An
+idle stream costs a coroutine and a queue, not a thread nor a database
+connection.
+
+A notification only names the kinds of objects which changed. Clients
+then read what changed from the change feed, see recipe.views.ChangesView.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from urllib.parse import urljoin
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.urls import reverse
+from psycopg2 import Error as Psycopg2Error
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+logger = logging.getLogger(__name__)
+
+# Served by app.asgi, next to the change feed: /api/recipes/events/.
+PATH = urljoin(reverse('recipe:changes'), '../events/')
+CHANNEL = 'recipe_changes'
+# Notifications a stream holds before dropping new ones. Any one makes
+# the client read the whole feed, so the dropped ones aren't missed.
+QUEUE_SIZE = 8
+RECONNECT_SECONDS = 5
+# Sent after reconnecting, as notifications may have been missed.
+EVERYTHING = {'kinds': ['ingredient', 'recipe', 'tag']}
+
+
+def _connect():
+    """Open a connection LISTENing on CHANNEL."""
+    wrapper = connections['default']
+    connection = wrapper.get_new_connection(wrapper.get_connection_params())
+    connection.autocommit = True
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {CHANNEL}')
+    return connection
+
+
+class Broker:
+    """Hands the notifications of one connection to the queues of users."""
+
+    def __init__(self):
+        self._queues = defaultdict(set)
+        self._connection = None
+        self._connecting = None
+
+    async def subscribe(self, user_id):
+        """Return a queue receiving the notifications of a user."""
+        if self._connection is None:
+            if self._connecting is None:
+                self._connecting = asyncio.ensure_future(self._listen())
+            # Streams opened meanwhile wait on the same connection.
+            await asyncio.shield(self._connecting)
+
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._queues[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue):
+        """Stop passing notifications to queue."""
+        queues = self._queues.get(user_id, set())
+        queues.discard(queue)
+        if not queues:
+            self._queues.pop(user_id, None)
+
+    def close(self):
+        """Close the connection, subscribers get nothing more."""
+        if self._connection is not None:
+            asyncio.get_event_loop().remove_reader(self._connection.fileno())
+            self._connection.close()
+            self._connection = None
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        try:
+            # Connecting blocks, the loop serves the other streams.
+            self._connection = await loop.run_in_executor(None, _connect)
+        finally:
+            self._connecting = None
+        loop.add_reader(self._connection.fileno(), self._read)
+
+    def _read(self):
+        try:
+            self._connection.poll()
+        except Psycopg2Error:
+            logger.warning('Lost the connection listening for changes.')
+            self.close()
+            asyncio.get_event_loop().call_later(
+                RECONNECT_SECONDS, self._reconnect
+            )
+            return
+
+        while self._connection.notifies:
+            notify = self._connection.notifies.pop(0)
+            event = json.loads(notify.payload)
+            self._publish(self._queues.get(event.pop('user'), ()), event)
+
+    def _reconnect(self):
+        if self._connection is not None or not self._queues:
+            return
+
+        def reconnected(task):
+            if task.exception() is not None:
+                asyncio.get_event_loop().call_later(
+                    RECONNECT_SECONDS, self._reconnect
+                )
+                return
+            for queues in list(self._queues.values()):
+                self._publish(queues, EVERYTHING)
+
+        self._connecting = asyncio.ensure_future(self._listen())
+        self._connecting.add_done_callback(reconnected)
+
+    def _publish(self, queues, event):
+        for queue in list(queues):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+
+broker = Broker()
+
+
+def _authenticate(headers):
+    """Return the id of the user whose token is in headers, or None."""
+    try:
+        keyword, key = headers.get(b'authorization', b'').decode().split()
+    except ValueError:
+        return None
+    if keyword != TokenAuthentication.keyword:
+        return None
+
+    try:
+        user, _ = TokenAuthentication().authenticate_credentials(key)
+        return user.id
+    except AuthenticationFailed:
+        return None
+    finally:
+        # Outside of Django's request cycle, which would do this.
+        close_old_connections()
+
+
+async def _respond(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'detail': body}).encode(),
+    })
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream(scope, receive, send):
+    """ASGI application streaming the change notifications of a user."""
+    if scope['method'] != 'GET':
+        return await _respond(
+            send, 405, f'Method "{scope["method"]}" not allowed.'
+        )
+
+    user_id = await sync_to_async(_authenticate)(dict(scope['headers']))
+    if user_id is None:
+        return await _respond(
+            send, 401, 'Invalid or missing token.',
+            [(b'www-authenticate', TokenAuthentication.keyword.encode())],
+        )
+
+    try:
+        queue = await broker.subscribe(user_id)
+    except Psycopg2Error:
+        logger.exception('Could not listen for changes.')
+        return await _respond(send, 503, 'Events are unavailable.')
+
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    notified = asyncio.ensure_future(queue.get())
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                # Let nginx pass events on as they come.
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        # How long clients wait before reconnecting, in milliseconds.
+        body = f'retry: {RECONNECT_SECONDS * 1000}\n\n'.encode()
+        while not disconnected.done():
+            await send({
+                'type': 'http.response.body', 'body': body, 'more_body': True,
+            })
+            await asyncio.wait(
+                {disconnected, notified},
+                timeout=settings.EVENTS_HEARTBEAT_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if notified.done():
+                data = json.dumps(notified.result())
+                body = f'event: changes\ndata: {data}\n\n'.encode()
+                notified = asyncio.ensure_future(queue.get())
+            else:
+                # A comment, so proxies don't close idle streams.
+                body = b': ping\n\n'
+    finally:
+        broker.unsubscribe(user_id, queue)
+        disconnected.cancel()
+        notified.cancel()
@@ -0,0 +1,147 @@
+"""
+A durable job queue kept in the main PostgreSQL database.
+
+Functions registered with @task are queued with enqueue() and run by the
+run_jobs command. Enqueueing inside a transaction makes the job visible
+to workers only once that transaction commits. Workers claim jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, so they never wait on each other.
+"""
+import logging
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core import metrics
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 3600
+
+_registry = {}
+
+
+def task(func=None, *, name=None):
+    """Register a function as a job, usable as @task or @task(name=...)."""
+    def register(func):
+        func.job_name = name or f'{func.__module__}.{func.__qualname__}'
+        _registry[func.job_name] = func
+        return func
+
+    if func is None:
+        return register
+
+    return register(func)
+
+
+def autodiscover():
+    """Import the tasks module of every installed app."""
+    autodiscover_modules('tasks')
+
+
+def enqueue(func, delay=0, max_attempts=5, **payload):
+    """Queue a registered function to be called with payload."""
+    return Job.objects.create(
+        name=getattr(func, 'job_name', func),
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts,
+    )
+
+
+def enqueue_many(func, payloads, delay=0, max_attempts=5):
+    """Queue a registered function once per payload, in one INSERT."""
+    run_at = timezone.now() + timedelta(seconds=delay)
+    return Job.objects.bulk_create([
+        Job(
+            name=getattr(func, 'job_name', func),
+            payload=payload,
+            run_at=run_at,
+            max_attempts=max_attempts,
+        )
+        for payload in payloads
+    ])
+
+
+def retry_delay(attempts):
+    """Return seconds before retrying a job that failed attempts times."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    # Jitter keeps jobs that failed together from retrying together.
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+@transaction.atomic
+def claim():
+    """Lock the next due job and mark it running, or return None."""
+    job = Job.objects.select_for_update(skip_locked=True).filter(
+        status=Job.QUEUED, run_at__lte=timezone.now(),
+    ).order_by('run_at').first()
+    if job is None:
+        return None
+
+    job.status = Job.RUNNING
+    job.attempts += 1
+    job.locked_at = timezone.now()
+    job.save(update_fields=['status', 'attempts', 'locked_at'])
+    return job
+
+
+def run(job):
+    """Run a claimed job, then delete it or schedule its retry."""
+    func = _registry.get(job.name)
+    start = time.perf_counter()
+    try:
+        if func is None:
+            raise LookupError(f'No task registered as {job.name}.')
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed:\n%s', job.pk, job.name, error)
+        job.last_error = error
+        job.locked_at = None
+        # Unknown names won't become known by retrying.
+        if func is None or job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+            result = 'failed'
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+            result = 'retried'
+        job.save(update_fields=['status', 'run_at', 'locked_at', 'last_error'])
+    else:
+        job.delete()
+        result = 'done'
+
+    metrics.JOBS.labels(job.name, result).inc()
+    metrics.JOB_DURATION.labels(job.name).observe(time.perf_counter() - start)
+    return result
+
+
+def heartbeat(job_ids):
+    """Mark running jobs as still alive, however long they have run."""
+    if not job_ids:
+        return 0
+
+    return Job.objects.filter(pk__in=job_ids, status=Job.RUNNING).update(
+        locked_at=timezone.now()
+    )
+
+
+def requeue_stale(seconds):
+    """Queue again running jobs without a heartbeat for seconds.
+
+    Their worker went away. See heartbeat().
+    """
+    return Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=seconds),
+    ).update(status=Job.QUEUED, locked_at=None, run_at=timezone.now())
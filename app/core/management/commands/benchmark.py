@@ -0,0 +1,494 @@
+"""
+Django command to load test a running API server
+"""
+import http.client
+import io
+import json
+import math
+import random
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Relative frequency of each operation in the mixed workload.
+WORKLOAD = {
+    'recipe_list': 20,
+    'recipe_list_filtered': 10,
+    'recipe_detail': 20,
+    'recipe_create': 8,
+    'recipe_patch': 8,
+    'recipe_upload_image': 3,
+    'recipe_delete': 2,
+    'tag_list': 6,
+    'tag_list_assigned': 2,
+    'tag_patch': 2,
+    'ingredient_list': 6,
+    'ingredient_patch': 2,
+    'user_me': 5,
+    'user_me_patch': 1,
+    'user_token': 2,
+    'user_create': 1,
+}
+
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(sorted_values, pct):
+    """Return the nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, duration):
+    """Summarize latencies in seconds, grouped by operation."""
+    operations = {}
+    total = 0
+    for name in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies.get(name, []))
+        total += len(values)
+        summary = {
+            'count': len(values),
+            'errors': errors.get(name, 0),
+            'throughput': len(values) / duration if duration else 0,
+        }
+        if values:
+            summary['mean_ms'] = sum(values) / len(values) * 1000
+            summary['max_ms'] = values[-1] * 1000
+            for pct in PERCENTILES:
+                summary[f'p{pct}_ms'] = percentile(values, pct) * 1000
+        operations[name] = summary
+
+    all_values = sorted(
+        value for values in latencies.values() for value in values
+    )
+    overall = {
+        'count': total,
+        'errors': sum(errors.values()),
+        'throughput': total / duration if duration else 0,
+    }
+    for pct in PERCENTILES:
+        value = percentile(all_values, pct)
+        overall[f'p{pct}_ms'] = value * 1000 if value is not None else None
+
+    return {'overall': overall, 'operations': operations}
+
+
+def jpeg_bytes():
+    """Return a small JPEG image."""
+    # Imported here so the command doesn't load Pillow unless it runs.
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 120, 40)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+class Client:
+    """A keep-alive HTTP client for one worker thread."""
+
+    def __init__(self, base_url, token=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.token = token
+        self.conn = http.client.HTTPConnection(
+            self.host, self.port, timeout=30
+        )
+
+    def request(self, method, path, data=None, files=None):
+        """Send a request, returning the status and decoded JSON body."""
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        body = None
+        if files is not None:
+            boundary = uuid.uuid4().hex
+            headers['Content-Type'] = (
+                f'multipart/form-data; boundary={boundary}'
+            )
+            body = b''.join(
+                f'--{boundary}\r\nContent-Disposition: form-data; '
+                f'name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: image/jpeg\r\n\r\n'.encode() + content +
+                b'\r\n'
+                for name, (filename, content) in files.items()
+            ) + f'--{boundary}--\r\n'.encode()
+        elif data is not None:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(data)
+
+        try:
+            self.conn.request(
+                method, self.prefix + path, body=body, headers=headers
+            )
+            res = self.conn.getresponse()
+            content = res.read()
+        except (http.client.HTTPException, OSError):
+            # Reconnect on the next request.
+            self.conn.close()
+            raise
+
+        try:
+            payload = json.loads(content) if content else None
+        except ValueError:
+            payload = None
+
+        return res.status, payload
+
+
+class Workload:
+    """Operations of the mixed workload, sharing the benchmark user."""
+
+    def __init__(self, base_url, token, credentials, image):
+        self.base_url = base_url
+        self.token = token
+        self.credentials = credentials
+        self.image = image
+        self.lock = threading.Lock()
+        self.recipe_ids = []
+        self.tag_ids = []
+        self.ingredient_ids = []
+
+    def prepare(self, client, rng, recipes):
+        """Make sure the user has recipes, tags and ingredients."""
+        for _ in range(recipes):
+            self.recipe_create(client, rng)
+
+        status, data = client.request('GET', '/api/recipes/recipes/')
+        self.recipe_ids = [recipe['id'] for recipe in data or []]
+        status, data = client.request('GET', '/api/recipes/tags/')
+        self.tag_ids = [tag['id'] for tag in data or []]
+        status, data = client.request('GET', '/api/recipes/ingredients/')
+        self.ingredient_ids = [item['id'] for item in data or []]
+        if not self.recipe_ids:
+            raise CommandError('Unable to prepare recipes for benchmark.')
+
+    def _recipe_id(self, rng):
+        with self.lock:
+            return rng.choice(self.recipe_ids)
+
+    def recipe_list(self, client, rng):
+        return client.request('GET', '/api/recipes/recipes/')[0]
+
+    def recipe_list_filtered(self, client, rng):
+        params = {}
+        if self.tag_ids:
+            params['tags'] = ','.join(
+                str(tag_id) for tag_id in rng.sample(
+                    self.tag_ids, min(2, len(self.tag_ids))
+                )
+            )
+        if self.ingredient_ids and rng.random() < 0.5:
+            params['ingredients'] = str(rng.choice(self.ingredient_ids))
+        path = f'/api/recipes/recipes/?{urlencode(params)}'
+
+        return client.request('GET', path)[0]
+
+    def recipe_detail(self, client, rng):
+        recipe_id = self._recipe_id(rng)
+        return client.request('GET', f'/api/recipes/recipes/{recipe_id}/')[0]
+
+    def recipe_create(self, client, rng):
+        payload = {
+            'title': f'Benchmark recipe {rng.randint(1, 10 ** 6)}',
+            'time_minutes': rng.randint(5, 120),
+            'price': f'{rng.uniform(1, 50):.2f}',
+            'tags': [
+                {'name': f'bench tag {rng.randint(1, 20)}'}
+                for _ in range(rng.randint(1, 3))
+            ],
+            'ingredients': [
+                {'name': f'bench ingredient {rng.randint(1, 50)}'}
+                for _ in range(rng.randint(1, 6))
+            ],
+        }
+        status, data = client.request(
+            'POST', '/api/recipes/recipes/', data=payload
+        )
+        if status == 201:
+            with self.lock:
+                self.recipe_ids.append(data['id'])
+
+        return status
+
+    def recipe_patch(self, client, rng):
+        recipe_id = self._recipe_id(rng)
+        payload = {'time_minutes': rng.randint(5, 120)}
+        if rng.random() < 0.3:
+            payload['tags'] = [{'name': f'bench tag {rng.randint(1, 20)}'}]
+
+        return client.request(
+            'PATCH', f'/api/recipes/recipes/{recipe_id}/', data=payload
+        )[0]
+
+    def recipe_upload_image(self, client, rng):
+        recipe_id = self._recipe_id(rng)
+        return client.request(
+            'POST',
+            f'/api/recipes/recipes/{recipe_id}/upload-image/',
+            files={'image': ('bench.jpg', self.image)},
+        )[0]
+
+    def recipe_delete(self, client, rng):
+        with self.lock:
+            # Keep enough recipes around for the other operations.
+            recipe_id = None
+            if len(self.recipe_ids) >= 20:
+                recipe_id = self.recipe_ids.pop(
+                    rng.randrange(len(self.recipe_ids))
+                )
+        if recipe_id is None:
+            return self.recipe_create(client, rng)
+
+        return client.request(
+            'DELETE', f'/api/recipes/recipes/{recipe_id}/'
+        )[0]
+
+    def tag_list(self, client, rng):
+        return client.request('GET', '/api/recipes/tags/')[0]
+
+    def tag_list_assigned(self, client, rng):
+        return client.request('GET', '/api/recipes/tags/?assigned_only=1')[0]
+
+    def _rename(self, client, rng, path, ids):
+        if not ids:
+            return client.request('GET', path)[0]
+        attr_id = rng.choice(ids)
+        return client.request(
+            'PATCH', f'{path}{attr_id}/', data={'name': f'renamed {attr_id}'}
+        )[0]
+
+    def tag_patch(self, client, rng):
+        return self._rename(client, rng, '/api/recipes/tags/', self.tag_ids)
+
+    def ingredient_list(self, client, rng):
+        return client.request('GET', '/api/recipes/ingredients/')[0]
+
+    def ingredient_patch(self, client, rng):
+        return self._rename(
+            client, rng, '/api/recipes/ingredients/', self.ingredient_ids
+        )
+
+    def user_me(self, client, rng):
+        return client.request('GET', '/api/user/me/')[0]
+
+    def user_me_patch(self, client, rng):
+        return client.request(
+            'PATCH', '/api/user/me/', data={'name': 'Benchmark user'}
+        )[0]
+
+    def user_token(self, client, rng):
+        anonymous = Client(self.base_url)
+        try:
+            return anonymous.request(
+                'POST', '/api/user/token/', data=self.credentials
+            )[0]
+        finally:
+            anonymous.conn.close()
+
+    def user_create(self, client, rng):
+        anonymous = Client(self.base_url)
+        try:
+            return anonymous.request('POST', '/api/user/create/', data={
+                'email': f'bench-{uuid.uuid4().hex}@example.com',
+                'password': 'benchpass123',
+                'name': 'Benchmark user',
+            })[0]
+        finally:
+            anonymous.conn.close()
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the recipe and user APIs"""
+    help = (
+        'Drive a mixed workload against a running server (for example '
+        '"manage.py runserver" or gunicorn on a seeded local database) '
+        'and report throughput and latency percentiles. Start the server '
+        'with THROTTLE_RATE_AUTH= and THROTTLE_RATE_RECIPES= so requests '
+        'are not throttled.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument(
+            '--warmup', type=float, default=5,
+            help='Seconds of load excluded from the results.',
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--email',
+            help='Benchmark as an existing user, e.g. one from seed_data.',
+        )
+        parser.add_argument('--password', default='password123')
+        parser.add_argument(
+            '--recipes', type=int, default=20,
+            help='Recipes to create before the run starts.',
+        )
+        parser.add_argument('--output', help='Write results as JSON here.')
+        parser.add_argument(
+            '--compare', help='Results JSON of an earlier run to compare.',
+        )
+
+    def _token(self, base_url, credentials, create):
+        client = Client(base_url)
+        if create:
+            client.request('POST', '/api/user/create/', data={
+                **credentials, 'name': 'Benchmark user',
+            })
+        status, data = client.request(
+            'POST', '/api/user/token/', data=credentials
+        )
+        client.conn.close()
+        if status != 200:
+            raise CommandError(f'Unable to get a token: {status} {data}')
+
+        return data['token']
+
+    def _worker(self, workload, index, options, start, end):
+        rng = random.Random(options['seed'] * 1000 + index)
+        client = Client(options['base_url'], workload.token)
+        names = list(WORKLOAD)
+        weights = list(WORKLOAD.values())
+        latencies = {}
+        errors = {}
+        try:
+            while True:
+                name = rng.choices(names, weights=weights)[0]
+                began = time.perf_counter()
+                if began >= end:
+                    break
+                try:
+                    status = getattr(workload, name)(client, rng)
+                except (http.client.HTTPException, OSError):
+                    status = None
+                elapsed = time.perf_counter() - began
+                if began < start:
+                    continue
+                if status is None or status >= 400:
+                    errors[name] = errors.get(name, 0) + 1
+                else:
+                    latencies.setdefault(name, []).append(elapsed)
+        finally:
+            client.conn.close()
+
+        return latencies, errors
+
+    def _compare(self, summary, path):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['results']['operations']
+
+        self.stdout.write('\nChange in p95 against ' + path)
+        for name, current in summary['operations'].items():
+            before = previous.get(name, {}).get('p95_ms')
+            if before and current.get('p95_ms'):
+                change = (current['p95_ms'] - before) / before * 100
+                self.stdout.write(f'  {name:24} {change:+7.1f}%')
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        started_at = datetime.now(timezone.utc).isoformat()
+        base_url = options['base_url']
+        credentials = {
+            'email': options['email'] or
+            f'bench-{uuid.uuid4().hex}@example.com',
+            'password': options['password'],
+        }
+        token = self._token(base_url, credentials, not options['email'])
+        workload = Workload(base_url, token, credentials, jpeg_bytes())
+        client = Client(base_url, token)
+        workload.prepare(
+            client, random.Random(options['seed']), options['recipes']
+        )
+        client.conn.close()
+
+        self.stdout.write(
+            f'Running for {options["duration"]:g}s after '
+            f'{options["warmup"]:g}s warm-up with '
+            f'{options["concurrency"]} workers...'
+        )
+        start = time.perf_counter() + options['warmup']
+        end = start + options['duration']
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            futures = [
+                pool.submit(
+                    self._worker, workload, index, options, start, end
+                )
+                for index in range(options['concurrency'])
+            ]
+
+        results = []
+        for future in futures:
+            # A worker which crashed would leave its share out of the
+            # results, which would still look like a valid run.
+            try:
+                results.append(future.result())
+            except Exception as error:
+                raise CommandError(
+                    f'A benchmark worker failed: {error!r}'
+                ) from error
+
+        latencies = {}
+        errors = {}
+        for worker_latencies, worker_errors in results:
+            for name, values in worker_latencies.items():
+                latencies.setdefault(name, []).extend(values)
+            for name, count in worker_errors.items():
+                errors[name] = errors.get(name, 0) + count
+        summary = summarize(latencies, errors, options['duration'])
+
+        self.stdout.write(
+            f'{"operation":24} {"count":>7} {"errors":>6} {"req/s":>8} '
+            f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+        )
+        rows = list(summary['operations'].items())
+        rows.append(('overall', summary['overall']))
+        for name, row in rows:
+            self.stdout.write(
+                f'{name:24} {row["count"]:7} {row["errors"]:6} '
+                f'{row["throughput"]:8.1f} ' + ' '.join(
+                    f'{row.get(f"p{pct}_ms") or 0:8.1f}'
+                    for pct in PERCENTILES
+                )
+            )
+
+        if options['compare']:
+            self._compare(summary, options['compare'])
+
+        if options['output']:
+            report = {
+                'commit': self._commit(),
+                'started_at': started_at,
+                'options': {
+                    key: options[key] for key in [
+                        'base_url', 'duration', 'warmup', 'concurrency',
+                        'seed', 'email', 'recipes',
+                    ]
+                },
+                'workload': WORKLOAD,
+                'results': summary,
+            }
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
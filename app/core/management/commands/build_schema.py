@@ -0,0 +1,33 @@
+"""
+Django command to build the OpenAPI schema files
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import schema
+
+
+class Command(BaseCommand):
+    """Django command to generate the schema of the current code version"""
+    help = (
+        'Generate the OpenAPI schema into SCHEMA_CACHE_DIR, so no request '
+        'has to.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format', action='append', dest='formats',
+            choices=sorted(schema.RENDERERS),
+            help='Only build this format. Repeatable, default all.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        version = schema.code_version()
+        for fmt in options['formats'] or sorted(schema.RENDERERS):
+            path = schema.build(version, settings.LANGUAGE_CODE, fmt)
+            self.stdout.write(f'Wrote {path}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built the schema of version {version}.'
+        ))
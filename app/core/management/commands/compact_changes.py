@@ -0,0 +1,39 @@
+"""
+Django command to compact the change log of synced clients
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Change
+
+
+class Command(BaseCommand):
+    """Django command to delete the changes no client needs any more"""
+    help = (
+        'Keep only the last change of each recipe, tag and ingredient, and '
+        'drop tombstones older than SYNC_TOMBSTONE_DAYS. Run it daily.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.SYNC_TOMBSTONE_DAYS,
+            help='Keep tombstones of deletions this many days.',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        tombstones_before = timezone.now() - timedelta(days=options['days'])
+        users = Change.objects.filter(
+            seq__isnull=False
+        ).order_by().values_list('user_id', flat=True).distinct()
+        deleted = 0
+        # One transaction per user, so writers are only held up briefly.
+        for user_id in users.iterator():
+            deleted += Change.objects.compact(user_id, tombstones_before)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} changes.'
+        ))
@@ -0,0 +1,127 @@
+"""
+Django command to profile the imports of a cold worker start
+"""
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter, so nothing is imported yet. Loading the URL
+# configuration imports the views, which the first request would do.
+STARTUP = '''
+import time
+start = time.perf_counter()
+import {module}
+if {load_urls}:
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+print(time.perf_counter() - start)
+'''
+
+
+def parse_importtime(output):
+    """Parse -X importtime output into (module, self_us, cumulative_us)."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            # The header line.
+            continue
+        imports.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    return imports
+
+
+class Command(BaseCommand):
+    """Django command to break down the import time of a worker"""
+    help = (
+        'Import app.wsgi in a new interpreter and report how long each '
+        'module took to import.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--module', default='app.wsgi',
+            help='Module started by the worker.',
+        )
+        parser.add_argument(
+            '--skip-urls', action='store_true',
+            help='Do not load the URL configuration after the module.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=5,
+            help='Hide modules taking fewer milliseconds, in total.',
+        )
+        parser.add_argument(
+            '--sort', choices=['cumulative', 'self'], default='cumulative',
+            help='Order modules by their time with or without imports.',
+        )
+        parser.add_argument(
+            '--forbid', action='append', default=[], metavar='MODULE',
+            help='Fail if this module, or one in its package, is '
+                 'imported. Repeatable.',
+        )
+        parser.add_argument(
+            '--max-total', type=float,
+            help='Fail if starting takes more milliseconds.',
+        )
+
+    def _start(self, options):
+        """Return the import times and total seconds of a cold start."""
+        code = STARTUP.format(
+            module=options['module'], load_urls=not options['skip_urls'],
+        )
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(
+                f'Importing {options["module"]} failed:\n{result.stderr}'
+            )
+
+        return parse_importtime(result.stderr), float(result.stdout)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        imports, total = self._start(options)
+        key = 2 if options['sort'] == 'cumulative' else 1
+        threshold_us = options['threshold'] * 1000
+
+        self.stdout.write(f'{"total ms":>10} {"self ms":>10}  module')
+        for name, self_us, cumulative_us in sorted(
+            imports, key=lambda row: row[key], reverse=True
+        ):
+            if cumulative_us < threshold_us:
+                continue
+            self.stdout.write(
+                f'{cumulative_us / 1000:10.1f} {self_us / 1000:10.1f}  {name}'
+            )
+
+        total_ms = total * 1000
+        self.stdout.write(
+            f'Imported {len(imports)} modules, starting took '
+            f'{total_ms:.0f}ms (slowed down by -X importtime).'
+        )
+
+        forbidden = sorted(
+            name for name, *_ in imports
+            for package in options['forbid']
+            if name == package or name.startswith(f'{package}.')
+        )
+        if forbidden:
+            raise CommandError(
+                f'Imported on startup: {", ".join(forbidden)}'
+            )
+        if options['max_total'] and total_ms > options['max_total']:
+            raise CommandError(
+                f'Starting took {total_ms:.0f}ms, more than '
+                f'{options["max_total"]:.0f}ms.'
+            )
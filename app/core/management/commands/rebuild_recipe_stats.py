@@ -0,0 +1,33 @@
+"""
+Django command to rebuild per-user recipe statistics
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import RecipeStats
+
+
+class Command(BaseCommand):
+    """Django command to recompute RecipeStats from the recipes"""
+    help = 'Recompute recipe statistics, for all users or the given ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='emails', metavar='EMAIL',
+            help='Only rebuild the stats of this user. Repeatable.',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        users = None
+        if options['emails']:
+            users = get_user_model().objects.filter(
+                email__in=options['emails']
+            )
+
+        rebuilt = RecipeStats.objects.rebuild(users=users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt recipe stats for {len(rebuilt)} users.'
+        ))
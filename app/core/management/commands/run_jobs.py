@@ -0,0 +1,104 @@
+"""
+Django command to run queued background jobs
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """Django command to work through the job queue"""
+    help = 'Run background jobs from the database queue until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help='Jobs run at the same time, each in its own thread.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help='Seconds an idle worker waits before looking again.',
+        )
+        # Workers send a heartbeat every 10 poll intervals for the jobs
+        # they run, so jobs may run for any time. This only needs to be
+        # well above the time between heartbeats.
+        parser.add_argument(
+            '--stale-after', type=float, default=600,
+            help='Requeue running jobs without a heartbeat for longer, '
+                 'their worker is gone.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is due instead of waiting for more.',
+        )
+
+    def _work(self, stop, running, options):
+        """Claim and run jobs until stopped, in a worker thread."""
+        try:
+            while not stop.is_set():
+                # Drop connections the database or a failed job broke.
+                close_old_connections()
+                job = jobs.claim()
+                if job is None:
+                    if options['once']:
+                        return
+                    stop.wait(options['poll_interval'])
+                    continue
+
+                # Deleting a job which is done clears its pk.
+                job_id = job.pk
+                running.add(job_id)
+                try:
+                    result = jobs.run(job)
+                finally:
+                    running.discard(job_id)
+                self.stdout.write(f'Job {job_id} ({job.name}): {result}')
+        finally:
+            # Every thread has its own connection.
+            connection.close()
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        jobs.autodiscover()
+        stop = threading.Event()
+        previous = {
+            signum: signal.signal(signum, lambda *args: stop.set())
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+
+        # Ids of the jobs being run, updated by the worker threads.
+        running = set()
+        workers = [
+            threading.Thread(target=self._work, args=(stop, running, options))
+            for _ in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+
+        self.stdout.write(f'Running jobs with {len(workers)} workers.')
+        interval = options['poll_interval'] * 10
+        try:
+            if options['once']:
+                for worker in workers:
+                    while worker.is_alive():
+                        worker.join(interval)
+                        jobs.heartbeat(list(running))
+            else:
+                # Meanwhile, keep our jobs alive and hand jobs of crashed
+                # workers to the live ones.
+                while not stop.wait(interval):
+                    jobs.heartbeat(list(running))
+                    jobs.requeue_stale(options['stale_after'])
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS('Stopped running jobs.'))
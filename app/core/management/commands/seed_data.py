@@ -0,0 +1,208 @@
+"""
+Django command to seed the database with realistic benchmark data
+"""
+import io
+import itertools
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Recipe, RecipeStats, Tag, Ingredient
+
+
+WORDS = [
+    'spicy', 'roasted', 'garlic', 'lemon', 'chicken', 'beef', 'tofu',
+    'noodle', 'rice', 'curry', 'salad', 'soup', 'bread', 'honey', 'chili',
+    'ginger', 'basil', 'tomato', 'mushroom', 'cheese', 'pork', 'salmon',
+    'bean', 'potato', 'pepper', 'coconut', 'sesame', 'butter', 'onion',
+    'egg', 'apple', 'berry', 'chocolate', 'vanilla', 'smoky', 'crispy',
+]
+
+
+def zipf_cum_weights(count, exponent):
+    """Return cumulative Zipf weights, rank 1 being the most popular."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def pick_distinct(rng, population, cum_weights, count):
+    """Pick up to count distinct items, favouring popular ones."""
+    # Drawing twice as many and deduplicating is cheaper than
+    # sampling without replacement for skewed weights.
+    picked = rng.choices(population, cum_weights=cum_weights, k=count * 2)
+    return list(dict.fromkeys(picked))[:count]
+
+
+class Command(BaseCommand):
+    """Django command to generate users, recipes, tags and ingredients"""
+    help = 'Seed the database with skewed, deterministic benchmark data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument(
+            '--recipes', type=int, default=1000,
+            help='Total recipes, spread over users by a Zipf distribution.',
+        )
+        parser.add_argument(
+            '--tags', type=int, default=50, help='Tags per user.',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=200,
+            help='Ingredients per user.',
+        )
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Skew of user activity and tag/ingredient popularity.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--email-prefix', default='seed',
+            help='Users are created as <prefix><n>@example.com.',
+        )
+
+    def _create_users(self, options):
+        # Hashing is slow, so every seeded user shares one password hash.
+        password = make_password('password123')
+        prefix = options['email_prefix']
+        users = [
+            get_user_model()(
+                email=f'{prefix}{index}@example.com',
+                name=f'Seed user {index}',
+                password=password,
+            )
+            for index in range(options['users'])
+        ]
+        return get_user_model().objects.bulk_create(
+            users, batch_size=options['batch_size']
+        )
+
+    def _create_attrs(self, model, users, count, batch_size):
+        """Create count attrs per user, returning their ids per user."""
+        objs = [
+            model(user=user, name=f'{model.__name__.lower()} {index}')
+            for user in users
+            for index in range(count)
+        ]
+        objs = model.objects.bulk_create(objs, batch_size=batch_size)
+        ids = {user.id: [] for user in users}
+        for obj in objs:
+            ids[obj.user_id].append(obj.id)
+
+        return ids
+
+    def _copy_links(self, through, column, rows):
+        """Insert many-to-many rows, with COPY when on PostgreSQL."""
+        if not rows:
+            return
+
+        if connection.vendor != 'postgresql':
+            through.objects.bulk_create(
+                through(recipe_id=recipe_id, **{column: attr_id})
+                for recipe_id, attr_id in rows
+            )
+            return
+
+        buffer = io.StringIO(''.join(
+            f'{recipe_id}\t{attr_id}\n' for recipe_id, attr_id in rows
+        ))
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {through._meta.db_table} (recipe_id, {column}) '
+                'FROM STDIN',
+                buffer,
+            )
+
+    def _recipe(self, rng, user_id):
+        words = rng.sample(WORDS, 3)
+        return Recipe(
+            user_id=user_id,
+            title=' '.join(words).capitalize(),
+            description=f'A {words[0]} dish with {words[1]} and {words[2]}.',
+            # Cooking times and prices are long tailed.
+            time_minutes=max(1, min(600, int(rng.lognormvariate(3.3, 0.7)))),
+            price=Decimal(
+                min(999.99, round(rng.lognormvariate(2.2, 0.6), 2))
+            ).quantize(Decimal('0.01')),
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        exponent = options['zipf']
+
+        users = self._create_users(options)
+        self.stdout.write(f'Created {len(users)} users.')
+        if not users:
+            return
+
+        tag_ids = self._create_attrs(
+            Tag, users, options['tags'], batch_size
+        )
+        ingredient_ids = self._create_attrs(
+            Ingredient, users, options['ingredients'], batch_size
+        )
+        self.stdout.write('Created tags and ingredients.')
+
+        user_ids = [user.id for user in users]
+        user_weights = zipf_cum_weights(len(user_ids), exponent)
+        tag_weights = zipf_cum_weights(options['tags'], exponent)
+        ingredient_weights = zipf_cum_weights(
+            options['ingredients'], exponent
+        )
+        tag_through = Recipe.tags.through
+        ingredient_through = Recipe.ingredients.through
+
+        remaining = options['recipes']
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            owners = rng.choices(user_ids, cum_weights=user_weights, k=count)
+            recipes = Recipe.objects.bulk_create(
+                [self._recipe(rng, user_id) for user_id in owners]
+            )
+
+            tag_rows = []
+            ingredient_rows = []
+            for recipe in recipes:
+                if tag_weights:
+                    tag_rows.extend(
+                        (recipe.id, tag_id) for tag_id in pick_distinct(
+                            rng, tag_ids[recipe.user_id], tag_weights,
+                            rng.randint(0, options['tags_per_recipe'] * 2),
+                        )
+                    )
+                if ingredient_weights:
+                    ingredient_rows.extend(
+                        (recipe.id, ing_id) for ing_id in pick_distinct(
+                            rng,
+                            ingredient_ids[recipe.user_id],
+                            ingredient_weights,
+                            rng.randint(
+                                1, options['ingredients_per_recipe'] * 2
+                            ),
+                        )
+                    )
+
+            self._copy_links(tag_through, 'tag_id', tag_rows)
+            self._copy_links(ingredient_through, 'ingredient_id',
+                             ingredient_rows)
+            remaining -= count
+            self.stdout.write(
+                f'Created {options["recipes"] - remaining} recipes...'
+            )
+
+        # Bulk inserts bypass the code keeping counts and stats current.
+        Tag.objects.filter(user__in=users).recount()
+        Ingredient.objects.filter(user__in=users).recount()
+        RecipeStats.objects.rebuild(users=users)
+
+        self.stdout.write(self.style.SUCCESS('Seeding complete!'))
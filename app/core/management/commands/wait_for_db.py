@@ -1,27 +1,84 @@
 """
 Django command to wait for the database to be available
 """
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from psycopg2 import OperationalError as Psycopg2Error
 
+from django.conf import settings
+from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Backoff between attempts grows from BASE_DELAY up to MAX_DELAY seconds.
+BASE_DELAY = 0.5
+MAX_DELAY = 10
 
 
 class Command(BaseCommand):
     """Django command to wait for database"""
+    help = 'Wait until every configured database accepts connections.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-wait',
+            type=float,
+            default=60,
+            help='Give up after this many seconds. 0 waits forever.',
+        )
+
+    def _is_up(self, alias):
+        """Return whether the database behind alias is available."""
+        try:
+            self.check(databases=[alias])
+        except (Psycopg2Error, OperationalError):
+            return False
+        finally:
+            # Probes run in worker threads, which own their connections.
+            connections[alias].close()
+
+        return True
 
     def handle(self, *args, **options):
         """Entrypoint for command."""
         self.stdout.write('Waiting for database...')
-        db_up = False
-        while db_up is False:
-            try:
-                self.check(databases=['default'])
-                db_up = True
-            except (Psycopg2Error, OperationalError):
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+        max_wait = options['max_wait']
+        deadline = time.monotonic() + max_wait if max_wait else None
+        pending = list(settings.DATABASES)
+        attempt = 0
+
+        # Every alias is checked at the same time, so waiting for
+        # replicas doesn't add up their start times.
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            while True:
+                results = list(pool.map(self._is_up, pending))
+                pending = [
+                    alias for alias, up in zip(pending, results) if not up
+                ]
+                if not pending:
+                    break
+
+                # Full jitter keeps many containers from retrying in step.
+                delay = random.uniform(
+                    0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt)
+                )
+                attempt += 1
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise CommandError(
+                            'Database unavailable after '
+                            f'{max_wait:g} seconds: {", ".join(pending)}'
+                        )
+                    delay = min(delay, remaining)
+
+                self.stdout.write(
+                    f'Database unavailable ({", ".join(pending)}), '
+                    f'waiting {delay:.1f} seconds...'
+                )
+                time.sleep(delay)
 
         self.stdout.write(self.style.SUCCESS('Database available!'))
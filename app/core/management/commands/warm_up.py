@@ -0,0 +1,24 @@
+"""
+Django command to warm up the caches of the app
+"""
+from django.core.management.base import BaseCommand
+
+from core.warmup import warm_up
+
+
+class Command(BaseCommand):
+    """Django command to run the warm-up steps and time them"""
+    help = (
+        'Run the steps a worker warms up with, and report how long each '
+        'one took. Workers run them themselves with WARMUP_ON_STARTUP=1.'
+    )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        timings = warm_up()
+        for step, seconds in timings.items():
+            self.stdout.write(f'{step}: {seconds * 1000:.0f}ms')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Warmed up in {sum(timings.values()) * 1000:.0f}ms.'
+        ))
@@ -0,0 +1,78 @@
+"""
+Prometheus metrics for the app.
+
+With PROMETHEUS_MULTIPROC_DIR set before start-up, every worker process
+writes its values to mmap'd files in that directory and the metrics
+endpoint aggregates them. The directory must be emptied on deploy.
+"""
+from prometheus_client import Counter, Histogram
+
+
+REQUESTS = Counter(
+    'api_requests',
+    'API requests served.',
+    ['view', 'action', 'method', 'status'],
+)
+
+LATENCY = Histogram(
+    'api_request_duration_seconds',
+    'Time spent serving API requests.',
+    ['view', 'action'],
+    buckets=(
+        0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+        1.0, 2.5, 5.0, 10.0,
+    ),
+)
+
+DB_QUERIES = Histogram(
+    'api_request_db_queries',
+    'Database queries made per API request sampled for Server-Timing.',
+    ['view', 'action'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+
+CACHE_REQUESTS = Counter(
+    'cache_requests',
+    'Lookups of in-app caches, by result.',
+    ['cache', 'result'],
+)
+
+IMAGE_UPLOAD_BYTES = Histogram(
+    'recipe_image_upload_bytes',
+    'Size of uploaded recipe images.',
+    buckets=tuple(2 ** power for power in range(14, 26)),
+)
+
+THROTTLED_REQUESTS = Counter(
+    'api_throttled_requests',
+    'Requests refused by a throttle, by throttle scope.',
+    ['scope'],
+)
+
+JOBS = Counter(
+    'background_jobs',
+    'Background job runs, by result.',
+    ['job', 'result'],
+)
+
+JOB_DURATION = Histogram(
+    'background_job_duration_seconds',
+    'Time spent running background jobs.',
+    ['job'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+
+def record_cache(cache, hit):
+    """Count a lookup of the named cache."""
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def view_labels(view_func, method):
+    """Return the (view, action) labels for a resolved view."""
+    cls = getattr(view_func, 'cls', None)
+    view = cls.__name__ if cls else view_func.__name__
+    # Viewsets map each HTTP method to an action such as 'list'.
+    actions = getattr(view_func, 'actions', None) or {}
+
+    return view, actions.get(method.lower(), method.lower())
@@ -0,0 +1,211 @@
+"""
+Middleware for the app.
+"""
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from core import compression, metrics, timing
+
+
+logger = logging.getLogger('core.timing')
+
+
+class MetricsMiddleware:
+    """Record Prometheus request metrics labeled by view and action."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        request._metrics_labels = None
+        response = self.get_response(request)
+        labels = request._metrics_labels
+        if labels is None:
+            # Not found before reaching a view; keep label values bounded.
+            labels = ('unmatched', request.method.lower())
+
+        metrics.REQUESTS.labels(
+            *labels, request.method, response.status_code
+        ).inc()
+        metrics.LATENCY.labels(*labels).observe(time.perf_counter() - start)
+        # Queries are only counted in requests sampled for Server-Timing.
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            metrics.DB_QUERIES.labels(*labels).observe(timings.sql_count)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if settings.METRICS_ENABLED:
+            request._metrics_labels = metrics.view_labels(
+                view_func, request.method
+            )
+
+        return None
+
+
+class ServerTimingMiddleware:
+    """Report SQL, serialization and render time of sampled requests.
+
+    The timings are sent in a Server-Timing header, and optionally
+    logged as one JSON line per request. Requests left out of the
+    sample aren't instrumented at all.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _sample_rate(self, request):
+        config = settings.SERVER_TIMING
+        rates = config['ENDPOINT_SAMPLE_RATES']
+        match = request.resolver_match
+        if match is not None and match.view_name in rates:
+            return rates[match.view_name]
+
+        return config['SAMPLE_RATE']
+
+    def __call__(self, request):
+        request.timings = None
+        # Filled by process_view() once the view is known.
+        request._timing_stack = ExitStack()
+        try:
+            response = self.get_response(request)
+        finally:
+            request._timing_stack.close()
+
+        timings = request.timings
+        if timings is not None:
+            self._report(request, response, timings)
+
+        return response
+
+    def _sampled(self, request):
+        if not settings.SERVER_TIMING['ENABLED']:
+            return False
+
+        rate = self._sample_rate(request)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self._sampled(request):
+            return None
+
+        timings = timing.RequestTimings()
+        request.timings = timings
+        stack = request._timing_stack
+        token = timing.activate(timings)
+        stack.callback(timing.deactivate, token)
+        for alias in connections:
+            stack.enter_context(
+                connections[alias].execute_wrapper(timings.execute_wrapper)
+            )
+
+        return None
+
+    def process_template_response(self, request, response):
+        timings = request.timings
+        if timings is None:
+            return response
+
+        start = time.perf_counter()
+
+        def rendered(response):
+            timings.render_time += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def _report(self, request, response, timings):
+        total = timings.elapsed()
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings.sql_time * 1000:.1f};'
+            f'desc="{timings.sql_count} queries"',
+            f'ser;dur={timings.serialize_time * 1000:.1f}',
+            f'render;dur={timings.render_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        if settings.SERVER_TIMING['LOG']:
+            match = request.resolver_match
+            logger.info(json.dumps({
+                'method': request.method,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'sql_count': timings.sql_count,
+                'sql_ms': round(timings.sql_time * 1000, 2),
+                'serialize_ms': round(timings.serialize_time * 1000, 2),
+                'render_ms': round(timings.render_time * 1000, 2),
+                'total_ms': round(total * 1000, 2),
+            }))
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip, as the client accepts.
+
+    Bodies smaller than COMPRESSION['MIN_SIZE'] and content which is
+    compressed already are sent as they are. Static files are compressed
+    by collectstatic instead, see core.storage.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _skip(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return True
+        if request.path.startswith((settings.STATIC_URL, settings.MEDIA_URL)):
+            return True
+
+        return not compression.is_compressible(
+            response.get('Content-Type', '')
+        )
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if self._skip(request, response):
+            return response
+
+        # Caches must key compressed and plain bodies apart.
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = compression.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if encoding is None:
+            return response
+
+        config = settings.COMPRESSION
+        level = config['BROTLI_QUALITY' if encoding == 'br' else 'GZIP_LEVEL']
+        if response.streaming:
+            response.streaming_content = compression.compress_stream(
+                response.streaming_content, encoding, level
+            )
+            # The length isn't known until the stream ends.
+            del response['Content-Length']
+        else:
+            if len(response.content) < config['MIN_SIZE']:
+                return response
+            compressed = compression.compress(
+                response.content, encoding, level
+            )
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The bytes differ from the uncompressed ones now.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
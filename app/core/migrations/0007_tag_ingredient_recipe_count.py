@@ -0,0 +1,43 @@
+# Generated by Django 3.2.25 on 2026-10-19 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_rename_context_tag_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_ingred_user_id_de1121_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'recipe_count'], name='core_tag_user_id_699afc_idx'),
+        ),
+        migrations.RunSQL(
+            sql=[
+                'UPDATE core_tag SET recipe_count = ('
+                'SELECT COUNT(*) FROM core_recipe_tags '
+                'WHERE core_recipe_tags.tag_id = core_tag.id)',
+                'UPDATE core_ingredient SET recipe_count = ('
+                'SELECT COUNT(*) FROM core_recipe_ingredients '
+                'WHERE core_recipe_ingredients.ingredient_id = '
+                'core_ingredient.id)',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-19 08:02
+
+import core.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Bucket bounds as of this migration, see core.models.TIME_BUCKETS.
+TIME_BUCKETS = (10, 20, 30, 45, 60, 90, 120)
+
+
+def histogram_sql():
+    lower = 0
+    counts = []
+    for bound in TIME_BUCKETS + (None,):
+        condition = f'time_minutes >= {lower}'
+        if bound is not None:
+            condition += f' AND time_minutes < {bound}'
+        counts.append(f'COUNT(*) FILTER (WHERE {condition})')
+        lower = bound
+
+    return 'jsonb_build_array(' + ', '.join(counts) + ')'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_tag_ingredient_recipe_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to='core.user')),
+                ('recipe_count', models.PositiveIntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('price_min', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('price_max', models.DecimalField(decimal_places=2, max_digits=5, null=True)),
+                ('time_histogram', models.JSONField(default=core.models.empty_time_histogram)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql=(
+                'INSERT INTO core_recipestats (user_id, recipe_count, '
+                'price_total, price_min, price_max, time_histogram) '
+                'SELECT user_id, COUNT(*), SUM(price), MIN(price), '
+                f'MAX(price), {histogram_sql()} '
+                'FROM core_recipe GROUP BY user_id'
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
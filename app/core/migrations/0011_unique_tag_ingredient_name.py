@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+def dedupe_sql(table, link, column):
+    """Merge rows of table with the same user and name into the oldest."""
+    return [
+        # Move the recipes of duplicates to the row that is kept.
+        f'''
+        WITH dupes AS (
+            SELECT id, MIN(id) OVER (
+                PARTITION BY user_id, lower(name)
+            ) AS keep
+            FROM {table}
+        ), moved AS (
+            DELETE FROM {link} USING dupes
+            WHERE {link}.{column} = dupes.id AND dupes.id <> dupes.keep
+            RETURNING {link}.recipe_id, dupes.keep
+        )
+        INSERT INTO {link} (recipe_id, {column})
+        SELECT DISTINCT recipe_id, keep FROM moved
+        ON CONFLICT (recipe_id, {column}) DO NOTHING
+        ''',
+        f'''
+        DELETE FROM {table} dupe USING {table} keep
+        WHERE keep.user_id = dupe.user_id
+            AND lower(keep.name) = lower(dupe.name)
+            AND keep.id < dupe.id
+        ''',
+        f'''
+        UPDATE {table} SET recipe_count = (
+            SELECT COUNT(*) FROM {link} WHERE {link}.{column} = {table}.id
+        )
+        ''',
+        # Foreign keys are checked at commit, and an index can't be built
+        # on a table with checks pending.
+        'SET CONSTRAINTS ALL IMMEDIATE',
+        f'''
+        CREATE UNIQUE INDEX {table}_user_lower_name_uniq
+        ON {table} (user_id, lower(name))
+        ''',
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_user_deleted_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=dedupe_sql('core_tag', 'core_recipe_tags', 'tag_id'),
+            reverse_sql='DROP INDEX core_tag_user_lower_name_uniq',
+        ),
+        migrations.RunSQL(
+            sql=dedupe_sql(
+                'core_ingredient', 'core_recipe_ingredients', 'ingredient_id'
+            ),
+            reverse_sql='DROP INDEX core_ingredient_user_lower_name_uniq',
+        ),
+    ]
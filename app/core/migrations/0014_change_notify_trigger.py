@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+# Tells listeners, see core.events, which kinds of objects of a user
+# changed. Notifications are sent on commit, and identical ones of a
+# transaction only once.
+NOTIFY_SQL = '''
+CREATE FUNCTION core_change_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('recipe_changes', json_build_object(
+        'user', user_id,
+        'kinds', array_agg(DISTINCT kind ORDER BY kind)
+    )::text)
+    FROM new_changes
+    GROUP BY user_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER core_change_notify
+AFTER INSERT ON core_change
+REFERENCING NEW TABLE AS new_changes
+FOR EACH STATEMENT EXECUTE PROCEDURE core_change_notify();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_sync_change_log'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=NOTIFY_SQL,
+            reverse_sql='''
+            DROP TRIGGER core_change_notify ON core_change;
+            DROP FUNCTION core_change_notify();
+            ''',
+        ),
+    ]
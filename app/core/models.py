@@ -2,6 +2,7 @@
 Database models.
 """
 import uuid
+from decimal import Decimal
 # Import os is for the path manipulation functions
 import os
 
@@ -9,13 +10,26 @@ import os
 # After testing, we need to register the model in django admin.
 # For this app, go to core/admin.py
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import (
+    Count,
+    Max,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
 
+from core.cache import bump_version
+
 
 def recipe_image_file_path(instance, filename):
     """Generate file path for new recipe image."""
@@ -58,6 +72,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Set when the account is deleted, its data is purged in the background.
+    deleted_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
 
@@ -90,9 +106,235 @@ class Recipe(models.Model):
     # This path generate method is documented in Django docs.
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    class Meta:
+        # Serve filtering and sorting the recipes of a user by price or
+        # time. The id breaks ties, so pages can resume after a row.
+        indexes = [
+            models.Index(fields=['user', 'price', 'id']),
+            models.Index(fields=['user', 'time_minutes', 'id']),
+        ]
+
     def __str__(self) -> str:
         return self.title
 
+    def save(self, *args, **kwargs):
+        # core.signals locks the row to read what the stats of the owner
+        # count, and moves them before the lock is released.
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+    def stats_values(self):
+        """Return the (price, time_minutes) counted in RecipeStats."""
+        return Decimal(str(self.price)), self.time_minutes
+
+
+def recipe_link(model):
+    """Return the Recipe through model and its column pointing to model."""
+    for field in Recipe._meta.many_to_many:
+        if field.related_model is model:
+            return field.remote_field.through, field.m2m_reverse_name()
+
+    raise ValueError(f'{model.__name__} is not linked to recipes.')
+
+
+class RecipeAttrQuerySet(models.QuerySet):
+    """QuerySet for tags and ingredients."""
+
+    def recount(self):
+        """Recompute recipe_count from the recipe links."""
+        through, column = recipe_link(self.model)
+        links = through.objects.filter(
+            **{column: OuterRef('pk')}
+        ).order_by().values(column).annotate(
+            count=Count('pk')
+        ).values('count')
+
+        return self.update(recipe_count=Coalesce(Subquery(links), 0))
+
+    # The bulk operations below each run one statement, however many rows
+    # they touch, and one more to log the changes. They keep recipe_count,
+    # cached lists and the change log current themselves, as raw SQL
+    # doesn't send signals.
+    def _execute(self, sql, params):
+        through, column = recipe_link(self.model)
+        sql = sql.format(
+            attr=self.model._meta.db_table,
+            link=through._meta.db_table,
+            column=column,
+            recipe=Recipe._meta.db_table,
+            fields=', '.join(
+                field.column for field in self.model._meta.concrete_fields
+            ),
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _links_changed(self, user_id, recipe_ids):
+        bump_version(self.model, user_id)
+        # Recipes list their tags and ingredients, so synced clients need
+        # the recipes again, as does their similarity index.
+        Change.objects.record(Recipe, user_id, recipe_ids)
+
+    def upsert(self, user, names):
+        """Return the user's objects named names, creating missing ones.
+
+        Names match case-insensitively, like the unique index on
+        (user, lower(name)). A single INSERT ... ON CONFLICT makes this
+        safe against concurrent writers without retries.
+        """
+        # A statement can't update the same row twice, so drop names
+        # differing only in case.
+        unique = {}
+        for name in names:
+            unique.setdefault(name.lower(), name)
+        names = list(unique.values())
+        if not names:
+            return []
+
+        # The no-op update locks and returns existing rows. Only inserted
+        # rows have no xmax.
+        rows = self._execute(
+            '''
+            INSERT INTO {attr} (user_id, name, recipe_count)
+            SELECT %(user)s, name, 0 FROM unnest(%(names)s::text[]) AS name
+            ON CONFLICT (user_id, lower(name))
+            DO UPDATE SET name = {attr}.name
+            RETURNING {fields}, xmax = 0
+            ''',
+            {'user': user.id, 'names': names},
+        )
+        fields = [field.attname for field in self.model._meta.concrete_fields]
+        objs = [self.model.from_db(self.db, fields, row[:-1]) for row in rows]
+        bump_version(self.model, user.id)
+        Change.objects.record(self.model, user.id, [
+            obj.id for obj, row in zip(objs, rows) if row[-1]
+        ])
+        return objs
+
+    @transaction.atomic
+    def merge(self, target, source_ids):
+        """Merge the user's objects in source_ids into target.
+
+        Recipes of the sources move to target and the sources are
+        deleted. Returns the new recipe_count of target.
+        """
+        rows = self._execute(
+            '''
+            WITH sources AS (
+                DELETE FROM {attr}
+                WHERE id = ANY(%(sources)s) AND user_id = %(user)s
+                    AND id <> %(target)s
+                RETURNING id
+            ), moved AS (
+                DELETE FROM {link}
+                WHERE {column} IN (SELECT id FROM sources)
+                RETURNING recipe_id
+            ), added AS (
+                INSERT INTO {link} (recipe_id, {column})
+                SELECT DISTINCT recipe_id, %(target)s FROM moved
+                ON CONFLICT (recipe_id, {column}) DO NOTHING
+                RETURNING 1
+            )
+            UPDATE {attr}
+            SET recipe_count = recipe_count + (SELECT COUNT(*) FROM added)
+            WHERE id = %(target)s
+            RETURNING
+                recipe_count,
+                ARRAY(SELECT id FROM sources),
+                ARRAY(SELECT DISTINCT recipe_id FROM moved)
+            ''',
+            {
+                'sources': source_ids,
+                'target': target.id,
+                'user': target.user_id,
+            },
+        )
+        target.recipe_count, deleted, recipe_ids = rows[0]
+        Change.objects.record(
+            self.model, target.user_id, deleted, deleted=True
+        )
+        self._links_changed(target.user_id, recipe_ids)
+        return target.recipe_count
+
+    @transaction.atomic
+    def bulk_delete(self, user, ids):
+        """Delete the user's objects in ids, returning how many there were."""
+        rows = self._execute(
+            '''
+            WITH deleted AS (
+                DELETE FROM {attr}
+                WHERE id = ANY(%(ids)s) AND user_id = %(user)s
+                RETURNING id
+            ), links AS (
+                DELETE FROM {link}
+                WHERE {column} IN (SELECT id FROM deleted)
+                RETURNING recipe_id
+            )
+            SELECT
+                ARRAY(SELECT id FROM deleted),
+                ARRAY(SELECT DISTINCT recipe_id FROM links)
+            ''',
+            {'ids': ids, 'user': user.id},
+        )
+        deleted, recipe_ids = rows[0]
+        Change.objects.record(self.model, user.id, deleted, deleted=True)
+        self._links_changed(user.id, recipe_ids)
+        return len(deleted)
+
+    @transaction.atomic
+    def assign(self, obj, recipe_ids):
+        """Link obj to the recipes of its user in recipe_ids.
+
+        Returns the new recipe_count of obj.
+        """
+        rows = self._execute(
+            '''
+            WITH added AS (
+                INSERT INTO {link} (recipe_id, {column})
+                SELECT id, %(obj)s FROM {recipe}
+                WHERE id = ANY(%(recipes)s) AND user_id = %(user)s
+                ON CONFLICT (recipe_id, {column}) DO NOTHING
+                RETURNING recipe_id
+            )
+            UPDATE {attr}
+            SET recipe_count = recipe_count + (SELECT COUNT(*) FROM added)
+            WHERE id = %(obj)s
+            RETURNING recipe_count, ARRAY(SELECT recipe_id FROM added)
+            ''',
+            {'obj': obj.id, 'recipes': recipe_ids, 'user': obj.user_id},
+        )
+        obj.recipe_count, recipe_ids = rows[0]
+        self._links_changed(obj.user_id, recipe_ids)
+        return obj.recipe_count
+
+    @transaction.atomic
+    def unassign(self, obj, recipe_ids):
+        """Unlink obj from the recipes in recipe_ids.
+
+        Returns the new recipe_count of obj.
+        """
+        rows = self._execute(
+            '''
+            WITH removed AS (
+                DELETE FROM {link}
+                WHERE {column} = %(obj)s AND recipe_id = ANY(%(recipes)s)
+                RETURNING recipe_id
+            )
+            UPDATE {attr}
+            SET recipe_count = recipe_count - (SELECT COUNT(*) FROM removed)
+            WHERE id = %(obj)s
+            RETURNING recipe_count, ARRAY(SELECT recipe_id FROM removed)
+            ''',
+            {'obj': obj.id, 'recipes': recipe_ids},
+        )
+        obj.recipe_count, recipe_ids = rows[0]
+        self._links_changed(obj.user_id, recipe_ids)
+        return obj.recipe_count
+
 
 class Tag(models.Model):
     """Tag object."""
@@ -102,6 +344,16 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
     name = models.CharField(max_length=255)
+    # Number of recipes using the tag, kept current by core.signals.
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        # Serves assigned_only filtering and sorting by popularity.
+        # Names are unique per user regardless of case, through a unique
+        # index on (user_id, lower(name)) created in migration 0011.
+        indexes = [models.Index(fields=['user', 'recipe_count'])]
 
     def __str__(self) -> str:
         return self.name
@@ -114,6 +366,372 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    recipe_count = models.PositiveIntegerField(default=0)
+
+    objects = RecipeAttrQuerySet.as_manager()
+
+    class Meta:
+        # Like tags, names are unique per user regardless of case.
+        indexes = [models.Index(fields=['user', 'recipe_count'])]
 
     def __str__(self):
         return self.name
+
+
+# Upper bounds (exclusive) of the cooking time buckets in RecipeStats.
+TIME_BUCKETS = (10, 20, 30, 45, 60, 90, 120)
+
+
+def time_bucket(time_minutes):
+    """Return the index of the time bucket for a cooking time."""
+    for index, bound in enumerate(TIME_BUCKETS):
+        if time_minutes < bound:
+            return index
+
+    return len(TIME_BUCKETS)
+
+
+class RecipeStatsManager(models.Manager):
+    """Manager for per-user recipe statistics."""
+
+    def _aggregate(self, recipes):
+        """Return one unsaved stats object per owner of recipes."""
+        buckets = {}
+        lower = 0
+        for index, bound in enumerate(TIME_BUCKETS + (None,)):
+            condition = Q(time_minutes__gte=lower)
+            if bound is not None:
+                condition &= Q(time_minutes__lt=bound)
+            buckets[f'bucket_{index}'] = Count('id', filter=condition)
+            lower = bound
+
+        rows = recipes.order_by().values('user_id').annotate(
+            count=Count('id'),
+            total=Sum('price'),
+            low=Min('price'),
+            high=Max('price'),
+            **buckets,
+        )
+        return [
+            self.model(
+                user_id=row['user_id'],
+                recipe_count=row['count'],
+                price_total=row['total'],
+                price_min=row['low'],
+                price_max=row['high'],
+                time_histogram=[
+                    row[f'bucket_{index}'] for index in range(len(buckets))
+                ],
+            )
+            for row in rows
+        ]
+
+    @transaction.atomic
+    def record(self, user_id, added=None, removed=None, deleting=None):
+        """Apply an added and/or removed (price, time_minutes) recipe.
+
+        Called by core.signals after a recipe is saved, or before one is
+        deleted, with its id as deleting. The stats row stays locked
+        until commit.
+        """
+        stats, created = self.select_for_update().get_or_create(
+            user_id=user_id
+        )
+        recipes = Recipe.objects.filter(user_id=user_id).exclude(pk=deleting)
+        if created:
+            # Recipes written before the row existed were never counted,
+            # so start from all of them. They already include this change.
+            fresh = self._aggregate(recipes)
+            if fresh:
+                fresh[0].save()
+                return fresh[0]
+            return stats
+
+        if removed is not None:
+            price, time_minutes = removed
+            stats._remove(Decimal(price), time_minutes, recipes)
+        if added is not None:
+            price, time_minutes = added
+            stats._add(Decimal(price), time_minutes)
+        stats.save()
+
+        return stats
+
+    def rebuild(self, users=None):
+        """Recompute statistics from the recipes of users, or everyone."""
+        recipes = Recipe.objects.all()
+        stats = self.all()
+        if users is not None:
+            recipes = recipes.filter(user__in=users)
+            stats = stats.filter(user__in=users)
+
+        stats.delete()
+        return self.bulk_create(self._aggregate(recipes), batch_size=1000)
+
+
+def empty_time_histogram():
+    return [0] * (len(TIME_BUCKETS) + 1)
+
+
+class RecipeStats(models.Model):
+    """Aggregates over the recipes of a user, kept current on writes."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats',
+    )
+    recipe_count = models.PositiveIntegerField(default=0)
+    price_total = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0
+    )
+    price_min = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True
+    )
+    price_max = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True
+    )
+    # Recipes per cooking time bucket, see TIME_BUCKETS.
+    time_histogram = models.JSONField(default=empty_time_histogram)
+
+    objects = RecipeStatsManager()
+
+    @property
+    def price_avg(self):
+        if not self.recipe_count:
+            return None
+
+        return (self.price_total / self.recipe_count).quantize(
+            Decimal('0.01')
+        )
+
+    def _add(self, price, time_minutes):
+        self.recipe_count += 1
+        self.price_total += price
+        self.time_histogram[time_bucket(time_minutes)] += 1
+        if self.price_min is None or price < self.price_min:
+            self.price_min = price
+        if self.price_max is None or price > self.price_max:
+            self.price_max = price
+
+    def _remove(self, price, time_minutes, recipes):
+        self.recipe_count -= 1
+        self.price_total -= price
+        self.time_histogram[time_bucket(time_minutes)] -= 1
+        if price in (self.price_min, self.price_max):
+            # Only losing an extreme needs a look at the other recipes.
+            extremes = recipes.aggregate(low=Min('price'), high=Max('price'))
+            self.price_min = extremes['low']
+            self.price_max = extremes['high']
+
+
+class Job(models.Model):
+    """A unit of background work, run by the run_jobs command."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    # Name of the function registered with core.jobs.task.
+    name = models.CharField(max_length=255)
+    # Keyword arguments of the function.
+    payload = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Finished jobs are deleted, so these partial indexes stay as
+        # small as the backlog.
+        indexes = [
+            models.Index(
+                fields=['run_at'],
+                condition=Q(status='queued'),
+                name='core_job_queued_run_at_idx',
+            ),
+            models.Index(
+                fields=['locked_at'],
+                condition=Q(status='running'),
+                name='core_job_running_locked_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class SyncState(models.Model):
+    """Where the change log of a user stands."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sync_state',
+    )
+    # Number of the last change sealed.
+    seq = models.BigIntegerField(default=0)
+    # Changes up to this number may have been compacted away.
+    horizon = models.BigIntegerField(default=0)
+
+
+class ChangeManager(models.Manager):
+    """Manager for the log of changed recipes, tags and ingredients."""
+
+    def record(self, model, user_id, ids, deleted=False):
+        """Log that the user's objects of model in ids changed or went.
+
+        Call inside the transaction making the change. Entries are only
+        numbered once committed, see seal().
+        """
+        self.bulk_create([
+            self.model(
+                user_id=user_id,
+                kind=model._meta.model_name,
+                object_id=object_id,
+                deleted=deleted,
+            )
+            for object_id in dict.fromkeys(ids)
+        ])
+
+    def _lock_state(self, user_id):
+        return SyncState.objects.select_for_update().get_or_create(
+            user_id=user_id
+        )[0]
+
+    @transaction.atomic
+    def seal(self, user_id):
+        """Number the committed changes of a user, returning its SyncState.
+
+        Writers never wait on each other to number their changes. Instead
+        readers number what is committed, in order, under a lock. A change
+        committed later gets a later number, so none lands behind a
+        number already read.
+        """
+        if not self.filter(user_id=user_id, seq__isnull=True).exists():
+            # Nothing to number, so readers polling needn't queue up. Read
+            # where the changes are, not from a replica lagging behind.
+            state = SyncState.objects.using(self.db).filter(
+                user_id=user_id
+            ).first()
+            return state or SyncState(user_id=user_id)
+
+        state = self._lock_state(user_id)
+        table = self.model._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'''
+                UPDATE {table} SET seq = numbered.seq
+                FROM (
+                    SELECT id, %(last)s + row_number() OVER (
+                        ORDER BY id
+                    ) AS seq
+                    FROM {table}
+                    WHERE user_id = %(user)s AND seq IS NULL
+                ) AS numbered
+                WHERE {table}.id = numbered.id
+                ''',
+                {'last': state.seq, 'user': user_id},
+            )
+            sealed = cursor.rowcount
+
+        if sealed:
+            state.seq += sealed
+            state.save(update_fields=['seq'])
+        return state
+
+    @transaction.atomic
+    def compact(self, user_id, tombstones_before):
+        """Delete the changes of a user no client needs any more.
+
+        Only the last change of each object is kept, and tombstones
+        logged before tombstones_before are dropped, moving the horizon
+        past them. Returns how many changes were deleted.
+        """
+        state = self._lock_state(user_id)
+        table = self.model._meta.db_table
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'''
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, row_number() OVER (
+                            PARTITION BY kind, object_id ORDER BY seq DESC
+                        ) AS rank
+                        FROM {table}
+                        WHERE user_id = %(user)s AND seq IS NOT NULL
+                    ) AS ranked
+                    WHERE rank > 1
+                )
+                ''',
+                {'user': user_id},
+            )
+            superseded = cursor.rowcount
+
+        expired = self.filter(
+            user_id=user_id,
+            deleted=True,
+            seq__isnull=False,
+            created_at__lt=tombstones_before,
+        )
+        horizon = expired.aggregate(Max('seq'))['seq__max']
+        if horizon is None:
+            return superseded
+
+        # Clients behind the horizon may have missed a deletion.
+        state.horizon = max(state.horizon, horizon)
+        state.save(update_fields=['horizon'])
+        return superseded + expired.delete()[0]
+
+
+class Change(models.Model):
+    """A recipe, tag or ingredient which changed or was deleted."""
+    KIND_CHOICES = [
+        ('recipe', 'Recipe'),
+        ('tag', 'Tag'),
+        ('ingredient', 'Ingredient'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    # Numbered in commit order per user once committed, see seal().
+    seq = models.BigIntegerField(null=True)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # A tombstone, left by a deletion.
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = ChangeManager()
+
+    class Meta:
+        constraints = [
+            # Also serves reading the changes after a number.
+            models.UniqueConstraint(
+                fields=['user', 'seq'], name='core_change_user_seq_uniq'
+            ),
+        ]
+        indexes = [
+            # Stays as small as the changes not read yet.
+            models.Index(
+                fields=['user'],
+                condition=Q(seq__isnull=True),
+                name='core_change_unsealed_idx',
+            ),
+        ]
+
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f'{self.kind} {self.object_id} {action}'
@@ -0,0 +1,36 @@
+"""
+Schema decorators for the API docs.
+
+drf_spectacular is only imported with the docs on. Otherwise the
+decorators leave views as they are, so workers serving just the API
+don't pay for importing it.
+"""
+from django.conf import settings
+
+
+if settings.ENABLE_API_DOCS:
+    from drf_spectacular.utils import (  # noqa: F401
+        OpenApiParameter,
+        OpenApiTypes,
+        extend_schema,
+        extend_schema_field,
+        extend_schema_view,
+    )
+else:
+    def extend_schema(*args, **kwargs):
+        return lambda view: view
+
+    extend_schema_view = extend_schema
+    extend_schema_field = extend_schema
+
+    class OpenApiParameter:
+        """Stands in for the parameters described in the schema."""
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+    class _Types:
+        def __getattr__(self, name):
+            return name
+
+    OpenApiTypes = _Types()
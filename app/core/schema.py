@@ -0,0 +1,132 @@
+"""
+OpenAPI schema generated once per code version and served from memory.
+
+Generating the schema introspects every view and serializer, which takes
+hundreds of milliseconds. The rendered schema is written to a file named
+after the code version, so it's generated again only after a deploy.
+"""
+import functools
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import django
+import drf_spectacular
+import rest_framework
+from django.conf import settings
+from django.utils import translation
+
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+
+from core import compression
+from core.storage import STATIC_LEVELS
+
+
+RENDERERS = {
+    'yaml': OpenApiYamlRenderer,
+    'json': OpenApiJsonRenderer,
+}
+
+# Rendered schemas of this process, by (version, language, format).
+_schemas = {}
+_lock = threading.Lock()
+
+
+class Schema:
+    """A rendered schema, with its ETag and compressed versions."""
+
+    def __init__(self, content):
+        self.content = content
+        self.etag = hashlib.sha256(content).hexdigest()[:32]
+        self._compressed = {}
+
+    def encoded(self, encoding):
+        """Return the content compressed with encoding, or as it is."""
+        if encoding is None:
+            return self.content
+        if encoding not in self._compressed:
+            # Compressed once, so the best ratio is worth it.
+            self._compressed[encoding] = compression.compress(
+                self.content, encoding, STATIC_LEVELS[encoding]
+            )
+        return self._compressed[encoding]
+
+
+@functools.lru_cache(maxsize=None)
+def source_version():
+    """Return a hash of the code and libraries the schema comes from."""
+    digest = hashlib.sha256()
+    for module in (django, rest_framework, drf_spectacular):
+        digest.update(module.__version__.encode())
+    for path in sorted(Path(settings.BASE_DIR).rglob('*.py')):
+        digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def code_version():
+    """Return APP_VERSION, falling back to a hash of the source."""
+    return settings.APP_VERSION or source_version()
+
+
+def schema_path(version, language, fmt):
+    name = f'schema-{version}-{language}.{fmt}'
+    return Path(settings.SCHEMA_CACHE_DIR) / name
+
+
+def generate(fmt):
+    """Generate and render the schema of the whole API."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(
+        request=None, public=spectacular_settings.SERVE_PUBLIC
+    )
+    return RENDERERS[fmt]().render(schema, renderer_context={})
+
+
+def _language():
+    # Commands run without an active language, requests with the default
+    # or the one asked for with ?lang=, which names the file. Anything but
+    # a known language gets the default, so clients can't pick file names.
+    language = translation.get_language()
+    if language not in dict(settings.LANGUAGES):
+        return settings.LANGUAGE_CODE
+    return language
+
+
+def build(version, language, fmt):
+    """Generate the schema and write it to its file, returning the path."""
+    path = schema_path(version, language, fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with translation.override(language):
+        content = generate(fmt)
+    # Written aside and renamed, so readers never see half a file.
+    temp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    temp.write_bytes(content)
+    os.replace(temp, path)
+    return path
+
+
+def get_schema(fmt):
+    """Return the Schema of the running code, generating it if needed."""
+    version = code_version()
+    key = (version, _language(), fmt)
+    schema = _schemas.get(key)
+    if schema is not None:
+        return schema
+
+    with _lock:
+        schema = _schemas.get(key)
+        if schema is None:
+            path = schema_path(*key)
+            if not path.exists():
+                build(*key)
+            schema = _schemas[key] = Schema(path.read_bytes())
+        return schema
+
+
+def clear():
+    """Forget the schemas held in memory, the files stay."""
+    with _lock:
+        _schemas.clear()
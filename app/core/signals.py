@@ -0,0 +1,196 @@
+"""
+Signal handlers keeping denormalized data current.
+"""
+from django.db.models import F, Subquery
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from core.cache import bump_version
+from core.models import (
+    Change,
+    Recipe,
+    RecipeStats,
+    Tag,
+    Ingredient,
+    recipe_link,
+)
+
+
+def _add_to_counts(queryset, delta):
+    if delta:
+        queryset.update(recipe_count=F('recipe_count') + delta)
+
+
+def _recipe_attr_changed(sender, instance, action, reverse, model, pk_set,
+                         **kwargs):
+    """Keep recipe_count current as recipes gain or lose tags/ingredients.
+
+    These run inside the transaction Django opens for the change.
+    """
+    attr_model = model if not reverse else type(instance)
+    column = recipe_link(attr_model)[1]
+
+    if not reverse:
+        # instance is a recipe and pk_set holds tag or ingredient ids.
+        links = sender.objects.filter(recipe_id=instance.pk)
+        if action == 'post_add':
+            _add_to_counts(attr_model.objects.filter(pk__in=pk_set), 1)
+        elif action in ('pre_remove', 'pre_clear'):
+            if action == 'pre_remove':
+                links = links.filter(**{f'{column}__in': pk_set})
+            # Only links that exist are removed.
+            _add_to_counts(attr_model.objects.filter(
+                pk__in=Subquery(links.values(column))
+            ), -1)
+        return
+
+    # instance is a tag or ingredient and pk_set holds recipe ids.
+    attr = attr_model.objects.filter(pk=instance.pk)
+    links = sender.objects.filter(**{column: instance.pk})
+    if action == 'post_add':
+        _add_to_counts(attr, len(pk_set))
+    elif action == 'pre_remove':
+        _add_to_counts(attr, -links.filter(recipe_id__in=pk_set).count())
+    elif action == 'pre_clear':
+        _add_to_counts(attr, -links.count())
+
+
+m2m_changed.connect(_recipe_attr_changed, sender=Recipe.tags.through)
+m2m_changed.connect(_recipe_attr_changed, sender=Recipe.ingredients.through)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Release the tags and ingredients of a deleted recipe."""
+    for attr_model in (Tag, Ingredient):
+        through, column = recipe_link(attr_model)
+        links = through.objects.filter(recipe_id=instance.pk)
+        _add_to_counts(attr_model.objects.filter(
+            pk__in=Subquery(links.values(column))
+        ), -1)
+
+
+# The stats of a user follow every write of their recipes, wherever it's
+# made: the API, the admin, the shell or a cascade.
+def _counted_stats(instance, using):
+    """Lock the stored row of a recipe, returning what the stats count.
+
+    Read from the database rather than the instance, which may have been
+    loaded before another write. The lock holds off any other until the
+    stats are moved.
+    """
+    return type(instance).objects.using(using).select_for_update().filter(
+        pk=instance.pk
+    ).values_list('price', 'time_minutes').first()
+
+
+def _moves_stats(update_fields):
+    return update_fields is None or not update_fields.isdisjoint(
+        ('price', 'time_minutes')
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_stats_loaded(sender, instance, using, update_fields, **kwargs):
+    instance._stats_counted = None
+    if instance.pk is not None and _moves_stats(update_fields):
+        instance._stats_counted = _counted_stats(instance, using)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_stats_saved(sender, instance, created, update_fields, **kwargs):
+    if not _moves_stats(update_fields):
+        return
+
+    new = instance.stats_values()
+    old = None if created else instance._stats_counted
+    # Most updates touch neither field, so skip locking the stats.
+    if new != old:
+        RecipeStats.objects.record(instance.user_id, added=new, removed=old)
+
+
+# Before the delete: deleting the owner removes their stats before the
+# recipes, and counting afterwards would create the row again.
+@receiver(pre_delete, sender=Recipe)
+def recipe_stats_deleted(sender, instance, using, **kwargs):
+    removed = _counted_stats(instance, using)
+    if removed is not None:
+        RecipeStats.objects.record(
+            instance.user_id, removed=removed, deleting=instance.pk
+        )
+
+
+# Cached tag and ingredient lists include recipe_count, so they change
+# with the links of recipes as well as with the objects themselves.
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def recipe_attr_changed(sender, instance, **kwargs):
+    bump_version(sender, instance.user_id)
+
+
+def _recipe_links_changed(sender, instance, action, reverse, model,
+                          **kwargs):
+    attr_model = type(instance) if reverse else model
+    if action == 'pre_clear' and reverse:
+        # Which recipes lose the tag or ingredient isn't known afterwards.
+        links = sender.objects.filter(
+            **{recipe_link(attr_model)[1]: instance.pk}
+        )
+        Change.objects.record(
+            Recipe, instance.user_id,
+            links.values_list('recipe_id', flat=True),
+        )
+
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version(attr_model, instance.user_id)
+        # pk_set is None when clearing the recipes of a tag or ingredient.
+        recipe_ids = kwargs['pk_set'] if reverse else [instance.pk]
+        if recipe_ids is not None:
+            Change.objects.record(Recipe, instance.user_id, recipe_ids)
+
+
+m2m_changed.connect(_recipe_links_changed, sender=Recipe.tags.through)
+m2m_changed.connect(_recipe_links_changed, sender=Recipe.ingredients.through)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_links_deleted(sender, instance, **kwargs):
+    for attr_model in (Tag, Ingredient):
+        bump_version(attr_model, instance.user_id)
+
+
+# Synced clients and the similarity index of recipes read the log of
+# changed objects, see Change.
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def synced_object_saved(sender, instance, **kwargs):
+    Change.objects.record(sender, instance.user_id, [instance.pk])
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def synced_links_deleted(sender, instance, **kwargs):
+    """Log the recipes losing a tag or ingredient about to be deleted."""
+    through, column = recipe_link(sender)
+    links = through.objects.filter(**{column: instance.pk})
+    Change.objects.record(
+        Recipe, instance.user_id, links.values_list('recipe_id', flat=True)
+    )
+
+
+# Before the delete: deleting the owner removes their changes before the
+# objects, and a tombstone logged afterwards would reference a deleted user.
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def synced_object_deleted(sender, instance, **kwargs):
+    Change.objects.record(
+        sender, instance.user_id, [instance.pk], deleted=True
+    )
@@ -0,0 +1,55 @@
+"""
+Storage classes for the app.
+"""
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import StaticFilesStorage
+
+from core import compression
+
+
+# Collecting static files runs once per build, so use the best ratio.
+STATIC_LEVELS = {'br': 11, 'gzip': 9}
+
+
+class CompressedStaticFilesStorage(StaticFilesStorage):
+    """Write brotli and gzip versions next to compressible static files.
+
+    A web server such as nginx with gzip_static and brotli_static on can
+    then send them without compressing anything per request.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+
+        for name in paths:
+            if not name.endswith(compression.COMPRESSIBLE_EXTENSIONS):
+                continue
+            if self._compress(name):
+                yield name, name, True
+
+    def _compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            data = source.read()
+        if len(data) < settings.COMPRESSION['MIN_SIZE']:
+            return False
+
+        written = False
+        for encoding in compression.available_encodings():
+            target = path + compression.SUFFIXES[encoding]
+            # Files unchanged since the last run keep their versions.
+            if (os.path.exists(target)
+                    and os.path.getmtime(target) >= os.path.getmtime(path)):
+                continue
+            compressed = compression.compress(
+                data, encoding, STATIC_LEVELS[encoding]
+            )
+            if len(compressed) < len(data):
+                with open(target, 'wb') as output:
+                    output.write(compressed)
+                written = True
+
+        return written
@@ -0,0 +1,63 @@
+"""
+Tests for the list cache.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from core.cache import bump_version, get_or_compute, list_key
+from core.models import Tag
+
+
+class ListCacheTests(TestCase):
+    """Test caching and invalidating lists."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_version_changes_key(self):
+        """Test bumping the version moves lists to a new key."""
+        before = list_key(Tag, 1, 0)
+
+        # Versions only change once the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(Tag, 1)
+            self.assertEqual(list_key(Tag, 1, 0), before)
+
+        self.assertNotEqual(list_key(Tag, 1, 0), before)
+        self.assertEqual(list_key(Tag, 2, 0), list_key(Tag, 2, 0))
+
+    def test_concurrent_misses_compute_once(self):
+        """Test a burst of misses on one key computes the value once."""
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return ['value']
+
+        def read():
+            results.append(get_or_compute('test', 'key', compute))
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['value']] * 8)
+
+    def test_waits_for_other_process(self):
+        """Test a miss waits for another process holding the lock."""
+        cache.add('lock:key', True)
+        timer = threading.Timer(0.1, cache.set, args=('key', ['theirs']))
+        timer.start()
+
+        value = get_or_compute('test', 'key', lambda: ['ours'])
+
+        timer.join()
+        self.assertEqual(value, ['theirs'])
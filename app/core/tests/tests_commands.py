@@ -2,6 +2,10 @@
 Test custom Django management commands.
 """
 
+import json
+import os
+import tempfile
+from io import StringIO
 # Mock the behavior of database.
 from unittest.mock import patch
 
@@ -9,9 +13,24 @@ from unittest.mock import patch
 from psycopg2 import OperationalError as Psycopg2Error
 
 # Provided by Django to simulate or actually call a command by the name.
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import (
+    LiveServerTestCase,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+
+from core import jobs
+from core.management.commands import benchmark
+from core.management.commands.benchmark import percentile, summarize
+from core.management.commands.profile_imports import parse_importtime
+from core.models import Change, Job, Recipe, RecipeStats, Tag, Ingredient
 
 
 # Django BaseCommand has a method: check, and we're going to mock it.
@@ -59,3 +78,304 @@ class CommandTest(SimpleTestCase):
         # 6 = 2 + 3 + 1
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=['default'])
+
+    @patch('time.sleep')
+    def test_wait_for_db_backoff(self, patched_sleep, patched_check):
+        """Test the delay between attempts grows with jitter."""
+        patched_check.side_effect = [OperationalError] * 4 + [True]
+
+        with patch('random.uniform', side_effect=lambda a, b: b):
+            call_command('wait_for_db')
+
+        delays = [c.args[0] for c in patched_sleep.call_args_list]
+        self.assertEqual(delays, [0.5, 1.0, 2.0, 4.0])
+
+    @patch('time.sleep')
+    @patch('time.monotonic')
+    def test_wait_for_db_timeout(
+        self, patched_monotonic, patched_sleep, patched_check
+    ):
+        """Test giving up once --max-wait has passed."""
+        patched_check.side_effect = OperationalError
+        patched_monotonic.side_effect = [0, 1, 6]
+
+        with self.assertRaises(CommandError):
+            call_command('wait_for_db', '--max-wait', '5')
+
+        self.assertEqual(patched_check.call_count, 2)
+
+    @override_settings(DATABASES={
+        'default': {'ENGINE': 'django.db.backends.postgresql'},
+        'replica_0': {'ENGINE': 'django.db.backends.postgresql'},
+    })
+    @patch('core.management.commands.wait_for_db.connections')
+    @patch('time.sleep')
+    def test_wait_for_db_all_aliases(
+        self, patched_sleep, patched_connections, patched_check
+    ):
+        """Test only unavailable databases are checked again."""
+        def check(databases):
+            if databases == ['replica_0'] and patched_check.call_count < 3:
+                raise OperationalError
+
+        patched_check.side_effect = check
+
+        call_command('wait_for_db')
+
+        checked = [c.kwargs['databases'] for c in patched_check.call_args_list]
+        self.assertCountEqual(
+            checked,
+            [['default'], ['replica_0'], ['replica_0']],
+        )
+
+
+class SeedDataTests(TestCase):
+    """Test the seed_data command."""
+
+    def seed(self, **options):
+        defaults = {
+            'users': 4,
+            'recipes': 60,
+            'tags': 6,
+            'ingredients': 10,
+            'batch_size': 25,
+            'seed': 1,
+            'stdout': StringIO(),
+        }
+        defaults.update(options)
+        call_command('seed_data', **defaults)
+
+    def test_seed_data_counts(self):
+        """Test the requested number of rows is created."""
+        self.seed()
+
+        self.assertEqual(get_user_model().objects.count(), 4)
+        self.assertEqual(Recipe.objects.count(), 60)
+        self.assertEqual(Tag.objects.count(), 4 * 6)
+        self.assertEqual(Ingredient.objects.count(), 4 * 10)
+        self.assertTrue(Recipe.ingredients.through.objects.exists())
+        self.assertEqual(
+            sum(Tag.objects.values_list('recipe_count', flat=True)),
+            Recipe.tags.through.objects.count(),
+        )
+        self.assertEqual(
+            sum(RecipeStats.objects.values_list('recipe_count', flat=True)),
+            60,
+        )
+
+    def test_seed_data_deterministic(self):
+        """Test the same seed generates the same data."""
+        self.seed(email_prefix='first')
+        self.seed(email_prefix='second')
+
+        first = Recipe.objects.filter(user__email__startswith='first')
+        second = Recipe.objects.filter(user__email__startswith='second')
+        fields = ['title', 'price', 'time_minutes']
+        self.assertEqual(
+            list(first.order_by('id').values_list(*fields)),
+            list(second.order_by('id').values_list(*fields)),
+        )
+
+    def test_seed_data_skewed(self):
+        """Test the first users own most recipes."""
+        self.seed(users=10, recipes=500)
+
+        counts = get_user_model().objects.annotate(
+            recipes=Count('recipe')
+        ).order_by('id').values_list('recipes', flat=True)
+        self.assertGreater(counts[0], counts[9] * 3)
+
+
+class RebuildRecipeStatsTests(TestCase):
+    """Test the rebuild_recipe_stats command."""
+
+    def test_rebuild_selected_users(self):
+        """Test only the stats of the given users are rebuilt."""
+        users = [
+            get_user_model().objects.create_user(f'user{i}@example.com')
+            for i in range(2)
+        ]
+        for user in users:
+            Recipe.objects.create(
+                user=user, title='Sample', time_minutes=5, price='1.00'
+            )
+        RecipeStats.objects.update(recipe_count=5)
+
+        call_command(
+            'rebuild_recipe_stats', user=['user0@example.com'],
+            stdout=StringIO(),
+        )
+
+        counts = dict(RecipeStats.objects.values_list('user', 'recipe_count'))
+        self.assertEqual(counts, {users[0].id: 1, users[1].id: 5})
+
+
+class CompactChangesTests(TestCase):
+    """Test compacting the change log of synced clients."""
+
+    def test_compact_changes(self):
+        """Test superseded changes and old tombstones are deleted."""
+        user = get_user_model().objects.create_user('user@example.com')
+        tag = Tag.objects.create(user=user, name='Quick')
+        tag.name = 'Fast'
+        tag.save()
+        Change.objects.seal(user.id)
+        out = StringIO()
+
+        call_command('compact_changes', stdout=out)
+
+        self.assertIn('Deleted 1 changes.', out.getvalue())
+        self.assertEqual(Change.objects.count(), 1)
+
+
+@jobs.task(name='tests.noop')
+def noop(value):
+    pass
+
+
+# Workers are threads with their own connections, which only see
+# committed rows.
+class RunJobsTests(TransactionTestCase):
+    """Test the run_jobs command."""
+
+    def test_run_jobs_once(self):
+        """Test --once runs the due jobs and exits."""
+        for value in range(5):
+            jobs.enqueue(noop, value=value)
+        jobs.enqueue(noop, delay=60, value=5)
+        out = StringIO()
+
+        call_command('run_jobs', concurrency=2, once=True, stdout=out)
+
+        self.assertEqual(out.getvalue().count(': done'), 5)
+        self.assertNotIn('Job None', out.getvalue())
+        self.assertEqual(Job.objects.count(), 1)
+
+
+class BenchmarkTests(SimpleTestCase):
+    """Test the benchmark result summary."""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_summarize(self):
+        """Test latencies are summarized per operation and overall."""
+        summary = summarize(
+            {'recipe_list': [0.01, 0.02, 0.03], 'user_me': [0.005]},
+            {'recipe_list': 1},
+            duration=2,
+        )
+
+        recipe_list = summary['operations']['recipe_list']
+        self.assertEqual(recipe_list['count'], 3)
+        self.assertEqual(recipe_list['errors'], 1)
+        self.assertEqual(recipe_list['throughput'], 1.5)
+        self.assertAlmostEqual(recipe_list['p50_ms'], 20)
+        self.assertEqual(summary['overall']['count'], 4)
+        self.assertAlmostEqual(summary['overall']['p99_ms'], 30)
+
+
+class BenchmarkLiveServerTests(LiveServerTestCase):
+    """Run the benchmark against a live test server."""
+
+    def test_benchmark_run(self):
+        """Test every operation of the workload succeeds."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            call_command(
+                'benchmark',
+                base_url=self.live_server_url,
+                duration=3,
+                warmup=0,
+                concurrency=2,
+                recipes=3,
+                output=output,
+                stdout=StringIO(),
+            )
+            with open(output) as results_file:
+                report = json.load(results_file)
+
+        for recipe in Recipe.objects.exclude(image=''):
+            recipe.image.delete()
+        results = report['results']
+        self.assertGreater(results['overall']['count'], 0)
+        self.assertEqual(results['overall']['errors'], 0)
+        self.assertIn('p95_ms', results['operations']['recipe_list'])
+
+    def test_benchmark_worker_failure(self):
+        """Test a crashed worker fails the command."""
+        with patch.dict(benchmark.WORKLOAD, {'recipe_list': 1}, clear=True), \
+                patch.object(
+                    benchmark.Workload, 'recipe_list',
+                    side_effect=KeyError('id'),
+                ), \
+                self.assertRaisesRegex(CommandError, 'worker failed'):
+            call_command(
+                'benchmark',
+                base_url=self.live_server_url,
+                duration=1,
+                warmup=0,
+                concurrency=2,
+                recipes=1,
+                stdout=StringIO(),
+            )
+
+
+class ProfileImportsTests(SimpleTestCase):
+    """Test profiling the imports of a cold start."""
+
+    def test_parse_importtime(self):
+        """Test -X importtime output is parsed per module."""
+        output = (
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |     _io\n'
+            'import time:      2500 |       2620 |   app.wsgi\n'
+        )
+
+        self.assertEqual(
+            parse_importtime(output),
+            [('_io', 120, 120), ('app.wsgi', 2500, 2620)],
+        )
+
+    def test_startup_skips_heavy_imports(self):
+        """Test starting a worker doesn't import Pillow or numpy."""
+        out = StringIO()
+        call_command(
+            'profile_imports', '--forbid', 'PIL', '--forbid', 'numpy',
+            stdout=out,
+        )
+
+        self.assertIn('app.wsgi', out.getvalue())
+
+    def test_startup_without_docs_skips_drf_spectacular(self):
+        """Test workers without the docs don't import drf_spectacular."""
+        with patch.dict(os.environ, {'ENABLE_API_DOCS': '0'}):
+            call_command(
+                'profile_imports', '--forbid', 'drf_spectacular',
+                stdout=StringIO(),
+            )
+
+    def test_startup_slower_than_max_total_fails(self):
+        """Test starting slower than --max-total is an error."""
+        call_command(
+            'profile_imports', '--max-total', '60000', stdout=StringIO()
+        )
+
+        with self.assertRaisesRegex(CommandError, 'more than 1ms'):
+            call_command(
+                'profile_imports', '--max-total', '1', stdout=StringIO()
+            )
+
+    def test_forbidden_import_fails(self):
+        """Test importing a forbidden module is an error."""
+        with self.assertRaises(CommandError):
+            call_command(
+                'profile_imports', '--forbid', 'django', stdout=StringIO()
+            )
@@ -0,0 +1,115 @@
+"""
+Tests for the read replica database router.
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    force_authenticate,
+)
+from rest_framework.views import APIView
+
+from core.db_router import (
+    ReplicaReadMixin,
+    ReplicaRouter,
+    pin_to_primary,
+    replica_for,
+)
+from core.models import Recipe
+
+
+def make_request(method, user):
+    """Create a request for the given user."""
+    request = getattr(APIRequestFactory(), method)('/')
+    request.user = user
+    return request
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    """Test routing decisions."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model()(pk=1, email='user@example.com')
+
+    def test_reads_default_without_replica(self):
+        """Test reads use the default database outside replica requests."""
+        self.assertIsNone(ReplicaRouter().db_for_read(Recipe))
+
+    def test_writes_use_primary(self):
+        """Test writes always go to the primary."""
+        self.assertEqual(ReplicaRouter().db_for_write(Recipe), 'default')
+
+    def test_no_replica_configured(self):
+        """Test safe requests stay on the primary without replicas."""
+        self.assertIsNone(replica_for(make_request('get', self.user)))
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_safe_request_uses_replica(self):
+        """Test safe requests read from a replica."""
+        request = make_request('get', self.user)
+
+        self.assertEqual(replica_for(request), 'replica_0')
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_unsafe_request_uses_primary(self):
+        """Test writes are not routed to a replica."""
+        self.assertIsNone(replica_for(make_request('post', self.user)))
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_recent_writer_pinned_to_primary(self):
+        """Test a user who just wrote reads from the primary."""
+        pin_to_primary(self.user)
+
+        self.assertIsNone(replica_for(make_request('get', self.user)))
+
+
+# 'default' stands in for a replica so the test database is reachable.
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicaReadViewTests(TestCase):
+    """Test views using read replicas."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_write_pins_user_to_primary(self):
+        """Test creating a recipe keeps the user on the primary."""
+        payload = {
+            'title': 'Sample recipe',
+            'time_minutes': 30,
+            'price': Decimal('5.99'),
+        }
+        self.assertEqual(
+            replica_for(make_request('get', self.user)),
+            'default',
+        )
+
+        self.client.post(reverse('recipe:recipe-list'), payload)
+
+        self.assertIsNone(replica_for(make_request('get', self.user)))
+
+    def test_failing_view_releases_replica(self):
+        """Test a view raising doesn't leave later reads on the replica."""
+        class FailingView(ReplicaReadMixin, APIView):
+            def get(self, request):
+                raise RuntimeError('failed')
+
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, self.user)
+
+        with self.assertRaises(RuntimeError):
+            FailingView.as_view()(request)
+
+        self.assertIsNone(ReplicaRouter().db_for_read(Recipe))
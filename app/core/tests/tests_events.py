@@ -0,0 +1,126 @@
+"""
+Tests for streaming change events.
+"""
+import json
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from app.asgi import application
+from core import events
+from core.models import Tag
+
+
+def scope(token=None, method='GET'):
+    headers = []
+    if token is not None:
+        headers.append((b'authorization', f'Token {token}'.encode()))
+    return {
+        'type': 'http',
+        'method': method,
+        'path': events.PATH,
+        'query_string': b'',
+        'headers': headers,
+    }
+
+
+# Notifications are sent on commit, which TestCase never does.
+class EventStreamTests(TransactionTestCase):
+    """Test the event stream served through ASGI."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('user@example.com')
+        self.token = Token.objects.create(user=self.user).key
+        # A broker is bound to the event loop it started listening in.
+        broker = patch.object(events, 'broker', events.Broker())
+        broker.start()
+        self.addCleanup(broker.stop)
+
+    async def open_stream(self):
+        communicator = ApplicationCommunicator(
+            application, scope(self.token)
+        )
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(timeout=5)
+        self.assertEqual(start['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream'), start['headers']
+        )
+        retry = await communicator.receive_output(timeout=5)
+        self.assertEqual(retry['body'], b'retry: 5000\n\n')
+        return communicator
+
+    async def close_stream(self, communicator):
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=5)
+        events.broker.close()
+
+    def test_served_next_to_change_feed(self):
+        """Test the stream is served under the URL of the change feed."""
+        self.assertEqual(events.PATH, '/api/recipes/events/')
+
+    def test_token_required(self):
+        """Test streams are refused without a valid token."""
+        async def request(token):
+            communicator = ApplicationCommunicator(application, scope(token))
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(timeout=5)
+
+        for token in (None, 'wrong'):
+            start = async_to_sync(request)(token)
+
+            self.assertEqual(start['status'], 401)
+
+    def test_changes_pushed(self):
+        """Test committed writes notify the streams of their user."""
+        other = get_user_model().objects.create_user('other@example.com')
+
+        async def run():
+            communicator = await self.open_stream()
+            await sync_to_async(Tag.objects.create)(user=other, name='Own')
+            await sync_to_async(Tag.objects.create)(
+                user=self.user, name='Quick'
+            )
+
+            message = await communicator.receive_output(timeout=5)
+            await self.close_stream(communicator)
+            return message['body'].decode()
+
+        body = async_to_sync(run)()
+
+        event, data = body.strip().split('\n')
+        self.assertEqual(event, 'event: changes')
+        self.assertEqual(
+            json.loads(data[len('data: '):]), {'kinds': ['tag']}
+        )
+
+    @override_settings(EVENTS_HEARTBEAT_SECONDS=0.05)
+    def test_heartbeat(self):
+        """Test idle streams get comments to keep them open."""
+        async def run():
+            communicator = await self.open_stream()
+            message = await communicator.receive_output(timeout=5)
+            await self.close_stream(communicator)
+            return message['body']
+
+        self.assertEqual(async_to_sync(run)(), b': ping\n\n')
+
+    def test_other_paths_served_by_django(self):
+        """Test requests to other paths reach Django."""
+        async def request():
+            communicator = ApplicationCommunicator(application, {
+                **scope(),
+                'path': '/api/health/live/',
+                'headers': [(b'host', b'testserver')],
+            })
+            await communicator.send_input({'type': 'http.request'})
+            return await communicator.receive_output(timeout=5)
+
+        start = async_to_sync(request)()
+
+        self.assertEqual(start['status'], 200)
@@ -0,0 +1,98 @@
+"""
+Tests for the background job queue.
+"""
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+
+calls = []
+
+
+@jobs.task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.task(name='tests.fail')
+def fail():
+    raise ValueError('Broken job')
+
+
+class JobQueueTests(TestCase):
+    """Test enqueueing, claiming and running jobs."""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_run_job(self):
+        """Test a claimed job runs once and is then deleted."""
+        jobs.enqueue(record, value=3)
+
+        job = jobs.claim()
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(jobs.run(job), 'done')
+
+        self.assertEqual(calls, [3])
+        self.assertFalse(Job.objects.exists())
+        self.assertIsNone(jobs.claim())
+
+    def test_claim_skips_future_jobs(self):
+        """Test jobs aren't claimed before they are due."""
+        jobs.enqueue(record, delay=60, value=1)
+
+        self.assertIsNone(jobs.claim())
+
+    def test_failed_job_retried_with_backoff(self):
+        """Test a failing job is queued again for later."""
+        jobs.enqueue(fail, max_attempts=2)
+
+        result = jobs.run(jobs.claim())
+
+        job = Job.objects.get()
+        self.assertEqual(result, 'retried')
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('Broken job', job.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(jobs.run(jobs.claim()), 'failed')
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+        self.assertIsNone(jobs.claim())
+
+    def test_unknown_job_fails(self):
+        """Test jobs without a registered function fail right away."""
+        jobs.enqueue('tests.missing')
+
+        self.assertEqual(jobs.run(jobs.claim()), 'failed')
+
+    def test_retry_delay_grows(self):
+        """Test retries back off exponentially up to a limit."""
+        self.assertLessEqual(jobs.retry_delay(1), jobs.RETRY_BASE_DELAY)
+        self.assertGreaterEqual(jobs.retry_delay(4), jobs.RETRY_BASE_DELAY * 4)
+        self.assertLessEqual(jobs.retry_delay(30), jobs.RETRY_MAX_DELAY)
+
+    def test_requeue_stale(self):
+        """Test jobs of vanished workers are queued again."""
+        jobs.enqueue(record, value=1)
+        jobs.claim()
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(jobs.requeue_stale(600), 1)
+        self.assertIsNotNone(jobs.claim())
+
+    def test_heartbeat_keeps_long_job(self):
+        """Test jobs still running aren't requeued however long they take."""
+        job = jobs.enqueue(record, value=1)
+        jobs.claim()
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(jobs.heartbeat([job.pk]), 1)
+
+        self.assertEqual(jobs.requeue_stale(600), 0)
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
@@ -0,0 +1,198 @@
+"""
+Tests for the app middleware.
+"""
+import gzip
+import json
+import os
+import tempfile
+
+import brotli
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.compression import choose_encoding
+from core.middleware import CompressionMiddleware
+from core.models import Recipe
+from core.storage import CompressedStaticFilesStorage
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def timing_settings(**overrides):
+    """Return SERVER_TIMING settings with overrides applied."""
+    return {**settings.SERVER_TIMING, **overrides}
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    """Test Server-Timing instrumentation."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price='4.50',
+        )
+
+    @override_settings(SERVER_TIMING=timing_settings(SAMPLE_RATE=1.0))
+    def test_server_timing_header(self):
+        """Test sampled requests report their timings."""
+        res = self.client.get(RECIPES_URL)
+
+        header = res['Server-Timing']
+        for metric in ['db;dur=', 'ser;dur=', 'render;dur=', 'total;dur=']:
+            self.assertIn(metric, header)
+        self.assertRegex(header, r'desc="[1-9]\d* queries"')
+
+    @override_settings(SERVER_TIMING=timing_settings(SAMPLE_RATE=0.0))
+    def test_unsampled_request(self):
+        """Test requests that are not sampled carry no header."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertFalse(res.has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING=timing_settings(
+        SAMPLE_RATE=1.0,
+        ENDPOINT_SAMPLE_RATES={'recipe:recipe-list': 0.0},
+    ))
+    def test_endpoint_sample_rate(self):
+        """Test a per-endpoint rate overrides the default rate."""
+        res_list = self.client.get(RECIPES_URL)
+        res_tags = self.client.get(reverse('recipe:tag-list'))
+
+        self.assertFalse(res_list.has_header('Server-Timing'))
+        self.assertTrue(res_tags.has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING=timing_settings(
+        SAMPLE_RATE=1.0,
+        LOG=True,
+    ))
+    def test_timing_log(self):
+        """Test timings are logged as JSON when enabled."""
+        with self.assertLogs('core.timing', level='INFO') as logs:
+            self.client.get(RECIPES_URL)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'recipe:recipe-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['sql_count'], 0)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test compressing responses."""
+
+    body = json.dumps([{'title': 'Recipe', 'id': i} for i in range(200)])
+
+    def respond(self, response, path='/api/recipe/recipes/', **headers):
+        request = RequestFactory().get(path, **headers)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_choose_encoding(self):
+        """Test negotiating the encoding from Accept-Encoding."""
+        self.assertEqual(choose_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(choose_encoding('gzip'), 'gzip')
+        self.assertEqual(choose_encoding('br;q=0.5, gzip'), 'gzip')
+        self.assertEqual(choose_encoding('*'), 'br')
+        self.assertIsNone(choose_encoding('br;q=0, identity'))
+        self.assertIsNone(choose_encoding(''))
+
+    def test_compress_brotli(self):
+        """Test large JSON is compressed with brotli when accepted."""
+        response = self.respond(
+            HttpResponse(self.body, content_type='application/json'),
+            HTTP_ACCEPT_ENCODING='gzip, br',
+        )
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(brotli.decompress(response.content).decode(),
+                         self.body)
+        self.assertEqual(int(response['Content-Length']),
+                         len(response.content))
+
+    def test_compress_gzip(self):
+        """Test gzip is used for clients without brotli."""
+        response = self.respond(
+            HttpResponse(self.body, content_type='application/json'),
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(),
+                         self.body)
+
+    def test_skip_small_and_compressed_bodies(self):
+        """Test small bodies and images are sent as they are."""
+        small = self.respond(
+            HttpResponse('{}', content_type='application/json'),
+            HTTP_ACCEPT_ENCODING='br',
+        )
+        image = self.respond(
+            HttpResponse(b'x' * 5000, content_type='image/jpeg'),
+            HTTP_ACCEPT_ENCODING='br',
+        )
+        static = self.respond(
+            HttpResponse(self.body, content_type='text/css'),
+            path=settings.STATIC_URL + 'app.css',
+            HTTP_ACCEPT_ENCODING='br',
+        )
+
+        for response in (small, image, static):
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_compress_streaming(self):
+        """Test streaming responses are compressed chunk by chunk."""
+        chunks = [self.body[i:i + 500] for i in range(0, len(self.body), 500)]
+        response = self.respond(
+            StreamingHttpResponse(
+                (chunk.encode() for chunk in chunks),
+                content_type='application/json',
+            ),
+            HTTP_ACCEPT_ENCODING='gzip',
+        )
+
+        content = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(content).decode(), self.body)
+
+
+class CompressedStaticFilesStorageTests(SimpleTestCase):
+    """Test precompressing static files."""
+
+    def test_post_process(self):
+        """Test compressible files get .br and .gz versions."""
+        with tempfile.TemporaryDirectory() as root:
+            storage = CompressedStaticFilesStorage(location=root)
+            with open(os.path.join(root, 'app.js'), 'w') as js:
+                js.write('console.log("recipe");\n' * 200)
+            with open(os.path.join(root, 'logo.png'), 'wb') as png:
+                png.write(b'x' * 5000)
+
+            processed = list(storage.post_process(
+                {'app.js': (storage, 'app.js'),
+                 'logo.png': (storage, 'logo.png')}
+            ))
+
+            self.assertEqual(processed, [('app.js', 'app.js', True)])
+            self.assertEqual(
+                sorted(os.listdir(root)),
+                ['app.js', 'app.js.br', 'app.js.gz', 'logo.png'],
+            )
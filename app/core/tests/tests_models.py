@@ -2,9 +2,12 @@
 Tests for models.
 """
 from unittest.mock import patch
+from datetime import timedelta
 from decimal import Decimal
 
-from django.test import TestCase
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 from core import models
@@ -107,3 +110,283 @@ class ModelTest(TestCase):
         file_path = models.recipe_image_file_path(None, 'example.jpg')
 
         self.assertEqual(file_path, f'uploads/recipe/{uuid}.jpg')
+
+    def test_tag_names_unique_per_user(self):
+        """Test a user can't have two tags differing only in case."""
+        user = create_user()
+        models.Tag.objects.create(user=user, name='Vegan')
+
+        with self.assertRaises(IntegrityError):
+            models.Tag.objects.create(user=user, name='vegan')
+
+    def test_upsert(self):
+        """Test upsert returns existing objects and creates missing ones."""
+        user = create_user()
+        other = create_user(email='other@example.com')
+        salt = models.Ingredient.objects.create(user=user, name='Salt')
+        models.Ingredient.objects.create(user=other, name='Pepper')
+
+        ingredients = models.Ingredient.objects.upsert(
+            user, ['SALT', 'Pepper', 'pepper']
+        )
+
+        self.assertEqual(
+            sorted((obj.id, obj.name) for obj in ingredients),
+            sorted([
+                (salt.id, 'Salt'),
+                (models.Ingredient.objects.get(user=user, name='Pepper').id,
+                 'Pepper'),
+            ]),
+        )
+        self.assertEqual(models.Ingredient.objects.count(), 3)
+
+
+class RecipeCountTests(TestCase):
+    """Test recipe_count of tags and ingredients is maintained."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.recipe = models.Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+        self.tag = models.Tag.objects.create(user=self.user, name='Vegan')
+        self.other = models.Tag.objects.create(user=self.user, name='Quick')
+
+    def assertCount(self, obj, expected):
+        obj.refresh_from_db()
+        self.assertEqual(obj.recipe_count, expected)
+
+    def test_add_and_remove(self):
+        """Test adding and removing links updates the counts."""
+        self.recipe.tags.add(self.tag, self.other)
+        # Adding an existing link doesn't count twice.
+        self.recipe.tags.add(self.tag)
+        self.assertCount(self.tag, 1)
+
+        self.recipe.tags.remove(self.tag)
+        self.recipe.tags.remove(self.tag)
+        self.assertCount(self.tag, 0)
+        self.assertCount(self.other, 1)
+
+    def test_clear_and_set(self):
+        """Test clearing and setting links updates the counts."""
+        self.recipe.tags.add(self.tag)
+
+        self.recipe.tags.set([self.other])
+        self.assertCount(self.tag, 0)
+        self.assertCount(self.other, 1)
+
+        self.recipe.tags.clear()
+        self.assertCount(self.other, 0)
+
+    def test_reverse_add_and_remove(self):
+        """Test changes made from the tag side update its count."""
+        second = models.Recipe.objects.create(
+            user=self.user,
+            title='Second recipe',
+            time_minutes=5,
+            price=Decimal('5.50'),
+        )
+
+        self.tag.recipe_set.add(self.recipe, second)
+        self.assertCount(self.tag, 2)
+
+        self.tag.recipe_set.remove(second)
+        self.assertCount(self.tag, 1)
+
+        self.tag.recipe_set.clear()
+        self.assertCount(self.tag, 0)
+
+    def test_recipe_deleted(self):
+        """Test deleting a recipe releases its tags and ingredients."""
+        ingredient = models.Ingredient.objects.create(
+            user=self.user, name='Salt'
+        )
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(ingredient)
+
+        self.recipe.delete()
+
+        self.assertCount(self.tag, 0)
+        self.assertCount(ingredient, 0)
+
+    def test_recount(self):
+        """Test counts can be recomputed from the links."""
+        self.recipe.tags.add(self.tag)
+        models.Tag.objects.update(recipe_count=7)
+
+        models.Tag.objects.filter(user=self.user).recount()
+
+        self.assertCount(self.tag, 1)
+        self.assertCount(self.other, 0)
+
+
+class RecipeStatsTests(TestCase):
+    """Test the per-user recipe statistics."""
+
+    def setUp(self):
+        self.user = create_user()
+
+    def create_recipe(self, price, time_minutes):
+        return models.Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=time_minutes,
+            price=Decimal(price),
+        )
+
+    def test_record_removing_extreme(self):
+        """Test removing the cheapest recipe looks up the next one."""
+        cheap = self.create_recipe('1.00', 5)
+        self.create_recipe('3.00', 200)
+
+        cheap.delete()
+
+        stats = models.RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.price_min, Decimal('3.00'))
+        self.assertEqual(stats.time_histogram, [0] * 7 + [1])
+
+    def test_rebuild(self):
+        """Test stats can be recomputed from the recipes."""
+        self.create_recipe('2.50', 10)
+        self.create_recipe('3.50', 10)
+        models.RecipeStats.objects.update(recipe_count=9)
+
+        models.RecipeStats.objects.rebuild(users=[self.user])
+
+        stats = models.RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(stats.price_avg, Decimal('3.00'))
+        self.assertEqual(stats.price_max, Decimal('3.50'))
+        self.assertEqual(stats.time_histogram, [0, 2, 0, 0, 0, 0, 0, 0])
+
+    def test_stats_follow_orm_writes(self):
+        """Test writes made outside the API update the stats."""
+        recipe = self.create_recipe('2.00', 5)
+        self.create_recipe('6.00', 50)
+
+        recipe.price = Decimal('4.00')
+        recipe.save()
+        models.Recipe.objects.filter(time_minutes=50).delete()
+
+        stats = models.RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.price_total, Decimal('4.00'))
+        self.assertEqual(stats.price_max, Decimal('4.00'))
+        self.assertEqual(stats.time_histogram, [1, 0, 0, 0, 0, 0, 0, 0])
+
+    def test_stats_follow_unloaded_recipe(self):
+        """Test saving a recipe built by hand moves it out of the stats."""
+        recipe = self.create_recipe('2.00', 5)
+
+        models.Recipe(
+            pk=recipe.pk, user=self.user, title='Stew',
+            time_minutes=95, price=Decimal('8.00'),
+        ).save(force_update=True)
+
+        stats = models.RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.price_min, Decimal('8.00'))
+        self.assertEqual(stats.time_histogram, [0] * 6 + [1, 0])
+
+    def test_stats_follow_stale_instances(self):
+        """Test saving instances loaded before another write counts once."""
+        recipe = self.create_recipe('5.00', 5)
+        first = models.Recipe.objects.get(pk=recipe.pk)
+        second = models.Recipe.objects.get(pk=recipe.pk)
+
+        first.price = Decimal('10.00')
+        first.save()
+        second.price = Decimal('20.00')
+        second.save()
+
+        stats = models.RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.price_total, Decimal('20.00'))
+        self.assertEqual(stats.price_min, Decimal('20.00'))
+        self.assertEqual(stats.price_max, Decimal('20.00'))
+
+
+class ChangeLogTests(TestCase):
+    """Test the change log of synced clients."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.recipe = models.Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=Decimal('1'),
+        )
+
+    def changes(self):
+        return list(models.Change.objects.filter(
+            user=self.user
+        ).order_by('seq').values_list('seq', 'kind', 'object_id', 'deleted'))
+
+    def test_writes_logged_then_sealed(self):
+        """Test writes are logged unnumbered, reading numbers them."""
+        tag = models.Tag.objects.create(user=self.user, name='Quick')
+        self.recipe.tags.add(tag)
+        self.assertFalse(
+            models.Change.objects.filter(seq__isnull=False).exists()
+        )
+
+        state = models.Change.objects.seal(self.user.id)
+
+        self.assertEqual(state.seq, 3)
+        self.assertEqual(self.changes(), [
+            (1, 'recipe', self.recipe.id, False),
+            (2, 'tag', tag.id, False),
+            (3, 'recipe', self.recipe.id, False),
+        ])
+
+    def test_compact(self):
+        """Test only the last change of an object and new tombstones stay."""
+        tag = models.Tag.objects.create(user=self.user, name='Quick')
+        self.recipe.save()
+        tag_id = tag.id
+        tag.delete()
+        models.Change.objects.seal(self.user.id)
+        # Left unnumbered until read.
+        self.recipe.save()
+
+        deleted = models.Change.objects.compact(
+            self.user.id, timezone.now() - timedelta(days=1)
+        )
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(self.changes(), [
+            (3, 'recipe', self.recipe.id, False),
+            (4, 'tag', tag_id, True),
+            (None, 'recipe', self.recipe.id, False),
+        ])
+
+        models.Change.objects.compact(self.user.id, timezone.now())
+
+        self.assertEqual(len(self.changes()), 2)
+        self.user.sync_state.refresh_from_db()
+        self.assertEqual(self.user.sync_state.horizon, 4)
+
+
+class UserDeleteTests(TransactionTestCase):
+    """Test deleting a user along with their content."""
+
+    def test_delete_user_with_content(self):
+        """Test nothing logged for a deleted user outlives the commit."""
+        user = create_user()
+        recipe = models.Recipe.objects.create(
+            user=user, title='Soup', time_minutes=5, price=Decimal('1'),
+        )
+        recipe.tags.add(models.Tag.objects.create(user=user, name='Quick'))
+        recipe.ingredients.add(
+            models.Ingredient.objects.create(user=user, name='Salt')
+        )
+
+        # Outside a test transaction, so foreign keys are checked on commit.
+        user.delete()
+
+        self.assertFalse(models.Recipe.objects.exists())
+        self.assertFalse(models.Change.objects.exists())
+        self.assertFalse(models.RecipeStats.objects.exists())
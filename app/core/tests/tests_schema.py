@@ -0,0 +1,127 @@
+"""
+Tests for the cached OpenAPI schema.
+"""
+import gzip
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import schema
+
+
+SCHEMA_URL = reverse('api-schema')
+
+
+class CachedSchemaTests(TestCase):
+    """Test generating, storing and serving the schema."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(
+            SCHEMA_CACHE_DIR=directory.name, APP_VERSION='test-1'
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        schema.clear()
+        self.addCleanup(schema.clear)
+        self.client = APIClient()
+
+    def test_schema_generated_once(self):
+        """Test the schema is generated on the first request only."""
+        with patch('core.schema.generate', wraps=schema.generate) as generate:
+            res = self.client.get(SCHEMA_URL)
+            self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'openapi:', res.content)
+        self.assertEqual(generate.call_count, 1)
+        self.assertTrue((self.directory / 'schema-test-1-en-us.yaml').exists())
+
+    def test_etag_not_modified(self):
+        """Test a request with the current ETag gets 304 Not Modified."""
+        res = self.client.get(SCHEMA_URL)
+        etag = res['ETag']
+
+        res = self.client.get(SCHEMA_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b'')
+        self.assertEqual(res['ETag'], etag)
+
+    def test_json_format(self):
+        """Test the schema is served as JSON when asked for."""
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('openapi', json.loads(res.content))
+
+    def test_compressed_once(self):
+        """Test compressed schemas have their own ETag."""
+        plain = self.client.get(SCHEMA_URL)
+        res = self.client.get(SCHEMA_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.content), plain.content)
+        self.assertNotEqual(res['ETag'], plain['ETag'])
+
+    def test_file_reused_by_new_process(self):
+        """Test a built schema file is served without generating."""
+        call_command('build_schema', stdout=StringIO())
+        schema.clear()
+
+        with patch('core.schema.generate') as generate:
+            res = self.client.get(SCHEMA_URL)
+
+        self.assertEqual(res.status_code, 200)
+        generate.assert_not_called()
+
+    def test_new_version_regenerates(self):
+        """Test a new code version gets its own schema file."""
+        call_command('build_schema', '--format', 'yaml', stdout=StringIO())
+
+        with override_settings(APP_VERSION='test-2'):
+            call_command('build_schema', '--format', 'yaml', stdout=StringIO())
+
+        self.assertEqual(
+            sorted(path.name for path in self.directory.iterdir()),
+            ['schema-test-1-en-us.yaml', 'schema-test-2-en-us.yaml'],
+        )
+
+    def test_unknown_language_served_default(self):
+        """Test ?lang= can't name files outside the cache directory."""
+        with override_settings(SCHEMA_CACHE_DIR=self.directory / 'cache'):
+            res = self.client.get(SCHEMA_URL, {'lang': '/../../escaped'})
+            self.client.get(SCHEMA_URL, {'lang': 'xx'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            sorted(str(path.relative_to(self.directory))
+                   for path in self.directory.rglob('*')),
+            ['cache', 'cache/schema-test-1-en-us.yaml'],
+        )
+
+    def test_change_feed_described(self):
+        """Test the change feed is in the schema with its response."""
+        res = self.client.get(SCHEMA_URL, {'format': 'json'})
+        content = json.loads(res.content)
+
+        self.assertIn('/api/recipes/changes/', content['paths'])
+        self.assertIn('Changes', content['components']['schemas'])
+
+    def test_generated_without_warnings(self):
+        """Test every view and field is described, none guessed."""
+        with tempfile.NamedTemporaryFile(suffix='.yaml') as schema_file:
+            call_command(
+                'spectacular', '--fail-on-warn', '--file', schema_file.name,
+                stderr=StringIO(),
+            )
@@ -0,0 +1,123 @@
+"""
+Tests for the token bucket throttle.
+"""
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import BucketStore, parse_rate, reset_throttles
+
+
+TOKEN_URL = reverse('user:token')
+
+
+def throttle_rates(**rates):
+    """Return REST_FRAMEWORK settings with the given throttle rates."""
+    return {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': rates,
+    }
+
+
+@patch('core.throttling.time.time')
+class BucketStoreTests(SimpleTestCase):
+    """Test the mmap'd bucket table."""
+
+    def test_bucket_refills(self, patched_time):
+        """Test tokens run out and come back over time."""
+        patched_time.return_value = 100.0
+        store = BucketStore(slots=16)
+        capacity, refill = parse_rate('2/min')
+
+        self.assertEqual(store.take('a', capacity, refill), (True, 0.0))
+        self.assertEqual(store.take('a', capacity, refill), (True, 0.0))
+        allowed, wait = store.take('a', capacity, refill)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 30.0)
+
+        patched_time.return_value = 130.0
+        self.assertTrue(store.take('a', capacity, refill)[0])
+        # Other keys have their own bucket.
+        self.assertTrue(store.take('b', capacity, refill)[0])
+
+    def test_file_store_shared(self, patched_time):
+        """Test stores mapping the same file share their buckets."""
+        patched_time.return_value = 100.0
+        capacity, refill = parse_rate('1/hour')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'throttle')
+            first = BucketStore(slots=16, path=path)
+            second = BucketStore(slots=16, path=path)
+
+            self.assertTrue(first.take('a', capacity, refill)[0])
+            self.assertFalse(second.take('a', capacity, refill)[0])
+
+    def test_colliding_keys_share_bucket(self, patched_time):
+        """Test a key hashing to a used slot doesn't get a full bucket."""
+        patched_time.return_value = 100.0
+        store = BucketStore(slots=1)
+        capacity, refill = parse_rate('1/hour')
+
+        self.assertTrue(store.take('a', capacity, refill)[0])
+        self.assertFalse(store.take('b', capacity, refill)[0])
+        self.assertFalse(store.take('a', capacity, refill)[0])
+
+
+class ThrottleAPITests(TestCase):
+    """Test throttling of the API."""
+
+    def setUp(self):
+        reset_throttles()
+        self.client = APIClient()
+
+    def tearDown(self):
+        reset_throttles()
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(auth='2/min'))
+    def test_auth_throttled_with_retry_after(self):
+        """Test exceeding the auth rate returns 429 with Retry-After."""
+        payload = {'email': 'user@example.com', 'password': 'wrong'}
+        for _ in range(2):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(auth='1/min'))
+    def test_forwarded_for_ignored_without_proxies(self):
+        """Test clients can't get new buckets by faking their address."""
+        self.client.post(TOKEN_URL, {}, HTTP_X_FORWARDED_FOR='10.0.0.1')
+
+        res = self.client.post(TOKEN_URL, {}, HTTP_X_FORWARDED_FOR='10.0.0.2')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK={
+        **throttle_rates(auth='1/min'), 'NUM_PROXIES': 1,
+    })
+    def test_forwarded_for_read_behind_proxy(self):
+        """Test the address added by a trusted proxy tells clients apart."""
+        self.client.post(TOKEN_URL, {}, HTTP_X_FORWARDED_FOR='10.0.0.1')
+
+        res = self.client.post(
+            TOKEN_URL, {}, HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.2'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(REST_FRAMEWORK=throttle_rates(auth=None))
+    def test_scope_without_rate_not_throttled(self):
+        """Test scopes without a rate are not throttled."""
+        for _ in range(3):
+            res = self.client.post(TOKEN_URL, {})
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,69 @@
+"""
+Tests for warming up a worker.
+"""
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from core import schema, warmup
+from core.models import Recipe, RecipeStats, Tag
+
+
+class WarmUpTests(TestCase):
+    """Test the warm-up steps."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(SCHEMA_CACHE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        schema.clear()
+        self.addCleanup(schema.clear)
+
+    def test_warm_up_runs_every_step(self):
+        """Test every step runs without failing."""
+        with patch('core.warmup.logger.exception') as log_exception:
+            timings = warmup.warm_up()
+
+        log_exception.assert_not_called()
+        self.assertEqual(
+            list(timings), [step.__name__ for step in warmup.STEPS]
+        )
+
+    def test_warm_views_queries_without_writing(self):
+        """Test list routes are called, leaving no rows behind."""
+        with CaptureQueriesContext(connection) as queries:
+            warmup.warm_views()
+
+        self.assertGreater(len(queries), 0)
+        self.assertFalse(get_user_model().objects.exists())
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(RecipeStats.objects.exists())
+
+    def test_failing_step_skipped(self):
+        """Test a failing step doesn't stop the others."""
+        def fail():
+            raise RuntimeError('unreachable')
+
+        steps = [fail, warmup.compile_urls]
+        with patch.object(warmup, 'STEPS', steps), \
+                self.assertLogs('core.warmup', 'ERROR'):
+            timings = warmup.warm_up()
+
+        self.assertEqual(list(timings), ['fail', 'compile_urls'])
+
+    def test_warm_up_command(self):
+        """Test the command reports the time of each step."""
+        out = StringIO()
+
+        call_command('warm_up', stdout=out)
+
+        self.assertIn('warm_views:', out.getvalue())
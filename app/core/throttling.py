@@ -0,0 +1,165 @@
+"""
+Token bucket throttling shared by the worker processes of a host.
+
+Buckets live in a fixed table of slots in an mmap. A key hashes to one
+slot, so a check costs the same however many clients there are. Keys
+sharing a slot share its bucket too: resetting it for the newer one would
+let clients whose keys collide, by chance or on purpose, past the rate.
+
+With THROTTLE_STORE_PATH set the table is a file every worker maps, and
+slots are guarded by fcntl record locks. Otherwise each process keeps
+its own anonymous table.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only the process-local table works.
+    fcntl = None
+
+from django.conf import settings
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+
+
+# Hash of the last key, tokens left and time of the last refill.
+SLOT = struct.Struct('<Qdd')
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return (capacity, tokens per second) of a rate like '10/min'."""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def key_hash(key):
+    # Zero marks an empty slot.
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class BucketStore:
+    """A table of token buckets in an mmap."""
+
+    def __init__(self, slots, path=None):
+        self.slots = slots
+        self.size = slots * SLOT.size
+        # fcntl locks belong to the process, so threads of one process
+        # still need their own lock.
+        self._lock = threading.Lock()
+        self._fd = None
+        if path is None:
+            self._map = mmap.mmap(-1, self.size)
+            return
+
+        if fcntl is None:
+            raise RuntimeError('THROTTLE_STORE_PATH needs fcntl.')
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < self.size:
+            os.ftruncate(self._fd, self.size)
+        self._map = mmap.mmap(self._fd, self.size)
+
+    def take(self, key, capacity, refill):
+        """Take a token for key, returning (allowed, seconds to wait)."""
+        hashed = key_hash(key)
+        offset = (hashed % self.slots) * SLOT.size
+        with self._lock:
+            if self._fd is not None:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, offset)
+            try:
+                return self._take(offset, hashed, capacity, refill)
+            finally:
+                if self._fd is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+    def _take(self, offset, hashed, capacity, refill):
+        now = time.time()
+        owner, tokens, updated = SLOT.unpack_from(self._map, offset)
+        if not owner:
+            tokens = capacity
+        else:
+            # max() guards against the clock going backwards.
+            elapsed = max(0.0, now - updated)
+            tokens = min(capacity, tokens + elapsed * refill)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        SLOT.pack_into(self._map, offset, hashed, tokens, now)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / refill
+
+    def clear(self):
+        with self._lock:
+            self._map[:] = bytes(self.size)
+
+
+# Opened lazily so every forked worker maps the table for itself.
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            _store = BucketStore(
+                settings.THROTTLE_SLOTS, settings.THROTTLE_STORE_PATH
+            )
+            _store_pid = os.getpid()
+
+        return _store
+
+
+def reset_throttles():
+    """Refill every bucket."""
+    get_store().clear()
+
+
+class ScopedTokenBucketThrottle(BaseThrottle):
+    """Throttle by the throttle_scope of the view, per user or per IP.
+
+    Rates come from DEFAULT_THROTTLE_RATES, e.g. {'auth': '10/min'}. A
+    client may burst up to the whole rate, then gets tokens back evenly
+    over the period. Views without a scope or rate aren't throttled.
+
+    Anonymous clients are told apart by address. X-Forwarded-For is only
+    read behind as many proxies as the NUM_PROXIES setting, as clients
+    can send any value themselves.
+    """
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if rate is None:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+
+        capacity, refill = parse_rate(rate)
+        allowed, self._wait = get_store().take(
+            f'{self.scope}:{ident}', capacity, refill
+        )
+        if not allowed:
+            metrics.THROTTLED_REQUESTS.labels(self.scope).inc()
+
+        return allowed
+
+    # DRF turns this into the Retry-After header of the 429 response.
+    def wait(self):
+        return self._wait
@@ -0,0 +1,79 @@
+"""
+Per-request performance timings.
+"""
+import time
+from contextvars import ContextVar, Token
+
+
+# Timings of the request being served, if it was sampled.
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Time spent in each phase of a request, in seconds."""
+    __slots__ = (
+        'start',
+        'sql_count',
+        'sql_time',
+        'serialize_time',
+        'render_time',
+        '_serialize_depth',
+    )
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self._serialize_depth = 0
+
+    # Installed with connection.execute_wrapper() while the request runs.
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.sql_count += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def current():
+    """Return the timings of the current request, or None."""
+    return _current.get()
+
+
+def activate(timings):
+    """Make timings current, returning a token for deactivate()."""
+    return _current.set(timings)
+
+
+def deactivate(token):
+    # Under ASGI, Django runs the hooks of sync middleware in copies of the
+    # context, where reset() refuses a token made in another one.
+    old = token.old_value
+    _current.set(None if old is Token.MISSING else old)
+
+
+class TimedSerializerMixin:
+    """Record how long a serializer takes to build its representation.
+
+    Nested serializers are only counted once, by the outermost one.
+    Lazy queries made while serializing are also counted as SQL time.
+    """
+
+    def to_representation(self, instance):
+        timings = _current.get()
+        if timings is None or timings._serialize_depth:
+            return super().to_representation(instance)
+
+        timings._serialize_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serialize_time += time.perf_counter() - start
+            timings._serialize_depth -= 1
@@ -0,0 +1,43 @@
+"""
+Views shared by the whole API.
+"""
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from drf_spectacular.views import SpectacularAPIView
+
+from core import compression, schema
+
+
+class CachedSchemaView(SpectacularAPIView):
+    """OpenAPI schema served from the file built for this code version.
+
+    Clients revalidate with the ETag, which answers 304 Not Modified until
+    the next deploy.
+    """
+
+    def _get_schema_response(self, request):
+        fmt = request.accepted_renderer.format
+        cached = schema.get_schema(fmt)
+        encoding = compression.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        # Every representation has its own ETag.
+        etag = cached.etag
+        if encoding:
+            etag = f'{etag}-{encoding}'
+        etag = f'"{etag}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                cached.encoded(encoding),
+                content_type=request.accepted_media_type,
+            )
+            if encoding:
+                response['Content-Encoding'] = encoding
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
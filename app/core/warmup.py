@@ -0,0 +1,175 @@
+"""
+Warming up a worker before it takes traffic.
+
+The first requests a process serves pay for compiling the URL patterns,
+importing what DRF settings name, building serializer fields, connecting
+to the databases and generating the schema. Warming up does all of that
+once, with requests made internally for a user that doesn't exist.
+"""
+import io
+import logging
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import NoReverseMatch, URLResolver, get_resolver, reverse
+
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.serializers import ListSerializer, Serializer
+
+from core import throttling
+
+
+logger = logging.getLogger(__name__)
+
+# Namespaces of the routes exercised.
+NAMESPACES = ('recipe', 'user')
+
+_finished = threading.Event()
+
+
+def _routes():
+    """Yield (name, pattern) of every route in NAMESPACES."""
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from walk(
+                    pattern.url_patterns, pattern.namespace or namespace
+                )
+            elif namespace in NAMESPACES and pattern.name:
+                yield f'{namespace}:{pattern.name}', pattern
+
+    return walk(get_resolver().url_patterns, None)
+
+
+def _build_fields(serializer):
+    """Build the fields of a serializer and of the ones it nests."""
+    for field in serializer.fields.values():
+        if isinstance(field, ListSerializer):
+            field = field.child
+        if isinstance(field, Serializer):
+            _build_fields(field)
+
+
+def _request(path, user):
+    """Return a GET request for path, authenticated as user."""
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    request = WSGIRequest(environ)
+    # Read by DRF instead of authenticating.
+    request._force_auth_user = user
+    return request
+
+
+def connect():
+    """Open a connection to every database."""
+    for alias in connections:
+        connections[alias].ensure_connection()
+
+
+def compile_urls():
+    """Compile the URL patterns and the lookup tables of reverse()."""
+    for name, _ in _routes():
+        try:
+            reverse(name)
+        except NoReverseMatch:
+            # Detail routes need arguments, their namespace is built now.
+            pass
+
+
+def warm_views():
+    """Build serializers of every route and call the ones listing data."""
+    # Never saved, so the views only find an empty account.
+    user = get_user_model()(email='warmup@example.com', is_active=True)
+    seen = set()
+    for name, pattern in _routes():
+        view = pattern.callback
+        cls = getattr(view, 'cls', None)
+        if cls is None or view in seen:
+            continue
+        seen.add(view)
+
+        actions = getattr(view, 'actions', None) or {'get': None}
+        for action in set(actions.values()):
+            instance = cls(**view.initkwargs)
+            instance.action = action
+            instance.request = instance.format_kwarg = None
+            instance.kwargs = {}
+            if hasattr(instance, 'get_serializer_class'):
+                _build_fields(instance.get_serializer_class()())
+
+        # Only views turning anonymous users away before throttling them
+        # are called, others would use up the rate limit of real clients.
+        needs_user = any(
+            issubclass(permission, IsAuthenticated)
+            for permission in cls.permission_classes
+        )
+        if 'get' in actions and needs_user:
+            try:
+                path = reverse(name)
+            except NoReverseMatch:
+                continue
+            response = view(_request(path, user))
+            response.render()
+
+
+def fill_caches():
+    """Fill the caches of this process."""
+    throttling.get_store()
+    if settings.ENABLE_API_DOCS:
+        # Imported here, drf_spectacular slows down starting a worker.
+        from core import compression, schema
+
+        for fmt in schema.RENDERERS:
+            cached = schema.get_schema(fmt)
+            for encoding in compression.available_encodings():
+                cached.encoded(encoding)
+
+
+STEPS = [connect, compile_urls, warm_views, fill_caches]
+
+
+def warm_up():
+    """Run every step, returning how many seconds each one took.
+
+    A failing step is logged and skipped, a worker which didn't warm up
+    can still serve.
+    """
+    timings = {}
+    try:
+        for step in STEPS:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception:
+                logger.exception('Warm-up step %s failed.', step.__name__)
+            timings[step.__name__] = time.perf_counter() - start
+    finally:
+        _finished.set()
+
+    logger.info('Warmed up in %.0fms.', sum(timings.values()) * 1000)
+    return timings
+
+
+def is_warm():
+    """Return whether the process is ready, it warms up first if asked to."""
+    return not settings.WARMUP_ON_STARTUP or _finished.is_set()
@@ -0,0 +1,82 @@
+"""
+Tests for the health check APIs.
+"""
+import threading
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from monitoring.views import reset_probe
+
+
+LIVE_URL = reverse('monitoring:live')
+READY_URL = reverse('monitoring:ready')
+
+
+class HealthAPITests(TestCase):
+    """Test the liveness and readiness endpoints."""
+
+    def setUp(self):
+        reset_probe()
+        self.client = APIClient()
+
+    def test_liveness(self):
+        """Test liveness answers without touching the database."""
+        with self.assertNumQueries(0):
+            res = self.client.get(LIVE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_readiness(self):
+        """Test readiness reports available databases."""
+        res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['databases'], {'default': True})
+
+    def test_readiness_probe_cached(self):
+        """Test repeated readiness probes reuse the cached result."""
+        self.client.get(READY_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(HEALTH_CHECK_CACHE_SECONDS=0)
+    def test_readiness_probe_expires(self):
+        """Test the database is probed again once the TTL has passed."""
+        self.client.get(READY_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(READY_URL)
+
+    @patch('monitoring.views._check_database')
+    def test_readiness_database_down(self, patched_check):
+        """Test readiness fails while a database is unavailable."""
+        patched_check.return_value = False
+
+        res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res.data['status'], 'unavailable')
+
+    @override_settings(WARMUP_ON_STARTUP=True)
+    def test_readiness_waits_for_warm_up(self):
+        """Test a worker warming up on startup isn't ready before that."""
+        finished = threading.Event()
+        with patch('core.warmup._finished', finished):
+            res = self.client.get(READY_URL)
+            self.assertEqual(
+                res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+            self.assertEqual(res.data['status'], 'warming up')
+
+            finished.set()
+            res = self.client.get(READY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
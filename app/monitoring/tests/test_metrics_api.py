@@ -0,0 +1,127 @@
+"""
+Tests for the metrics API.
+"""
+import tempfile
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+
+METRICS_URL = reverse('monitoring:metrics')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def sample(name, **labels):
+    """Return the current value of a metric sample."""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsAPITests(TestCase):
+    """Test the Prometheus metrics endpoint."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email='user@example.com',
+            password='testpass123',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_request_metrics_labeled_by_action(self):
+        """Test requests are counted by viewset and action."""
+        labels = {'view': 'RecipeViewSet', 'action': 'list'}
+        before = sample(
+            'api_requests_total', method='GET', status='200', **labels
+        )
+        observed = sample('api_request_duration_seconds_count', **labels)
+
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            sample('api_requests_total', method='GET', status='200', **labels),
+            before + 1,
+        )
+        self.assertEqual(
+            sample('api_request_duration_seconds_count', **labels),
+            observed + 1,
+        )
+        self.assertGreater(sample('api_request_db_queries_sum', **labels), 0)
+
+    @override_settings(
+        SERVER_TIMING={**settings.SERVER_TIMING, 'SAMPLE_RATE': 0.0}
+    )
+    def test_unsampled_request_not_instrumented(self):
+        """Test requests out of the Server-Timing sample are only timed."""
+        labels = {'view': 'RecipeViewSet', 'action': 'list'}
+        observed = sample('api_request_duration_seconds_count', **labels)
+        queries = sample('api_request_db_queries_count', **labels)
+
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            sample('api_request_duration_seconds_count', **labels),
+            observed + 1,
+        )
+        self.assertEqual(
+            sample('api_request_db_queries_count', **labels), queries
+        )
+
+    def test_metrics_exposition(self):
+        """Test metrics are served in the Prometheus text format."""
+        self.client.get(RECIPES_URL)
+
+        res = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer secret'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        self.assertIn(
+            b'api_request_duration_seconds_bucket{action="list"',
+            res.content,
+        )
+
+    def test_metrics_require_token(self):
+        """Test metrics are refused without the scraper token."""
+        for header in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            res = APIClient().get(METRICS_URL, **header)
+
+            self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_metrics_closed_without_token_set(self):
+        """Test metrics are served to nobody when no token is set."""
+        res = APIClient().get(METRICS_URL, HTTP_AUTHORIZATION='Bearer ')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_image_upload_size_recorded(self):
+        """Test the size of uploaded images is observed."""
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample recipe',
+            time_minutes=5,
+            price='4.50',
+        )
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+        before = sample('recipe_image_upload_bytes_count')
+
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            self.client.post(url, {'image': image_file}, format='multipart')
+
+        recipe.refresh_from_db()
+        recipe.image.delete()
+        self.assertEqual(sample('recipe_image_upload_bytes_count'), before + 1)
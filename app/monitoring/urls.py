@@ -0,0 +1,15 @@
+"""
+URL mappings for the monitoring API.
+"""
+from django.urls import path
+
+from monitoring import views
+
+
+app_name = 'monitoring'
+
+urlpatterns = [
+    path('health/live/', views.LivenessView.as_view(), name='live'),
+    path('health/ready/', views.ReadinessView.as_view(), name='ready'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+]
@@ -0,0 +1,136 @@
+"""
+Views for the monitoring API.
+"""
+import hmac
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.utils import DatabaseError
+from django.http import HttpResponse
+
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+
+from core import warmup
+from core.metrics import record_cache
+from core.openapi import extend_schema
+
+
+# The last database probe, shared by every thread of the process.
+_probe_lock = threading.Lock()
+_probe = {'checked_at': None, 'databases': {}}
+
+
+def _check_database(alias):
+    """Return whether the database behind alias answers a query."""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError:
+        return False
+
+    return True
+
+
+def probe_databases():
+    """Return availability of every database, cached for a short TTL."""
+    ttl = settings.HEALTH_CHECK_CACHE_SECONDS
+    # Probes arriving while another one runs wait for its result
+    # instead of issuing their own queries.
+    with _probe_lock:
+        checked_at = _probe['checked_at']
+        expired = checked_at is None or time.monotonic() - checked_at >= ttl
+        record_cache('health_probe', not expired)
+        if expired:
+            _probe['databases'] = {
+                alias: _check_database(alias) for alias in settings.DATABASES
+            }
+            _probe['checked_at'] = time.monotonic()
+
+        return dict(_probe['databases'])
+
+
+def reset_probe():
+    """Forget the cached probe result."""
+    with _probe_lock:
+        _probe['checked_at'] = None
+        _probe['databases'] = {}
+
+
+# Probes come from the orchestrator, which has no credentials.
+@extend_schema(exclude=True)
+class LivenessView(APIView):
+    """Report the process is able to serve requests."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return Response({'status': 'ok'})
+
+
+@extend_schema(exclude=True)
+class ReadinessView(APIView):
+    """Report the process is warmed up and can reach its databases."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        if not warmup.is_warm():
+            return Response(
+                {'status': 'warming up'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        databases = probe_databases()
+        if all(databases.values()):
+            return Response({'status': 'ok', 'databases': databases})
+
+        return Response(
+            {'status': 'unavailable', 'databases': databases},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """Allow requests bearing settings.METRICS_TOKEN."""
+
+    def has_permission(self, request, view):
+        token = settings.METRICS_TOKEN
+        if not token:
+            return False
+
+        expected = f'Bearer {token}'.encode()
+        given = request.META.get('HTTP_AUTHORIZATION', '').encode()
+        return hmac.compare_digest(given, expected)
+
+
+# Metrics tell about traffic and jobs, only scrapers may read them.
+@extend_schema(exclude=True)
+class MetricsView(APIView):
+    """Expose metrics in the Prometheus text format."""
+    authentication_classes = []
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request):
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            # Aggregate the files written by every worker process.
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        return HttpResponse(
+            generate_latest(registry),
+            content_type=CONTENT_TYPE_LATEST,
+        )
@@ -0,0 +1,194 @@
+"""
+Pagination for the recipe APIs.
+"""
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_ordering(queryset):
+    """Return (fields, descending) if pages of queryset can resume after a row.
+
+    That is when it is sorted in one direction and the id breaks ties.
+    """
+    ordering = queryset.query.order_by
+    if not ordering or ordering[-1] not in ('id', '-id'):
+        return None
+    if not all(isinstance(field, str) for field in ordering):
+        return None
+
+    descending = ordering[-1].startswith('-')
+    if any(field.startswith('-') != descending for field in ordering):
+        return None
+    return [field.lstrip('-') for field in ordering], descending
+
+
+def rows_after(queryset, fields, values, descending):
+    """Filter queryset to the rows sorted after the one holding values."""
+    lookup = 'lt' if descending else 'gt'
+    after = Q()
+    for index, field in enumerate(fields):
+        equal = dict(zip(fields[:index], values[:index]))
+        after |= Q(**equal, **{f'{field}__{lookup}': values[index]})
+
+    # The bound on the first field alone is one an index scan can start
+    # at, the rest are checked on the rows it finds.
+    return queryset.filter(after, **{f'{fields[0]}__{lookup}e': values[0]})
+
+
+def planner_estimate(queryset):
+    """Return the number of rows PostgreSQL expects queryset to return."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPagination(LimitOffsetPagination):
+    """Limit/offset pagination which only counts small results exactly.
+
+    Pagination is opt-in: without ?limit= the whole list is returned as
+    before. Counts above PAGINATION_EXACT_COUNT_THRESHOLD come from a
+    counter kept by the view, or else from the query planner, and the
+    response marks them with count_exact: false.
+
+    When the list is sorted with the id breaking ties, next links carry a
+    ?cursor= holding the sort keys of the last row instead of an offset,
+    so deep pages are found through an index instead of skipping rows.
+    Pages reached by cursor have no previous link.
+    """
+    max_limit = 100
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'Where to resume, from the next link.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.request = request
+        self.count, self.count_exact = self.get_count(queryset, view)
+        keyset = keyset_ordering(queryset)
+        cursor = request.query_params.get(self.cursor_query_param)
+        self.resumed = bool(keyset and cursor)
+        if self.resumed:
+            values = self.decode_cursor(cursor, queryset.model, keyset[0])
+            queryset = rows_after(queryset, keyset[0], values, keyset[1])
+            self.offset = 0
+
+        # One extra row tells whether there is a next page, which an
+        # estimated count can't.
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        self.next_cursor = None
+        if keyset and self.has_next:
+            last = rows[self.limit - 1]
+            self.next_cursor = self.encode_cursor(
+                [getattr(last, field) for field in keyset[0]]
+            )
+        if self.template is not None:
+            self.display_page_controls = self.has_next or self.offset > 0
+
+        return rows[:self.limit]
+
+    def encode_cursor(self, values):
+        """Return the cursor of a row from its sort keys."""
+        data = json.dumps(values, default=str, separators=(',', ':'))
+        return urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, model, fields):
+        """Return the sort keys held by a cursor, as Python values."""
+        try:
+            data = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(data)
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(fields, values)
+            ]
+        except (binascii.Error, ValueError, ValidationError):
+            raise NotFound('Invalid cursor.')
+
+    def get_count(self, queryset, view=None):
+        """Return (count, whether the count is exact)."""
+        threshold = settings.PAGINATION_EXACT_COUNT_THRESHOLD
+        # Counting stops after threshold + 1 rows.
+        count = queryset[:threshold + 1].count()
+        if count <= threshold:
+            return count, True
+
+        estimate = None
+        if hasattr(view, 'maintained_count'):
+            estimate = view.maintained_count()
+        if estimate is None:
+            estimate = planner_estimate(queryset)
+
+        # We know there are more rows than the threshold.
+        return max(estimate, threshold + 1), False
+
+    def get_next_link(self):
+        # Decided by the extra row fetched, as the count may be estimated.
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        if self.next_cursor is not None:
+            url = remove_query_param(url, self.offset_query_param)
+            return replace_query_param(
+                url, self.cursor_query_param, self.next_cursor
+            )
+
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+    def get_previous_link(self):
+        if self.resumed:
+            # Going back from a cursor would need the list sorted the
+            # other way.
+            return None
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('count_exact', self.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_exact'] = {
+            'type': 'boolean',
+            'example': True,
+        }
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': self.cursor_query_description,
+            'schema': {'type': 'string'},
+        })
+        return parameters
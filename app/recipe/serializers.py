@@ -1,32 +1,123 @@
 """
 Serializers for recipe APIs.
 """
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
-from core.models import Recipe, Tag, Ingredient
+from core.models import (
+    Change,
+    Recipe,
+    RecipeStats,
+    Tag,
+    Ingredient,
+    TIME_BUCKETS,
+)
+from core.openapi import extend_schema_field
+from core.timing import TimedSerializerMixin
+
+
+def name_taken(model):
+    return f'A {model._meta.verbose_name} with this name exists.'
+
+
+def validate_unique_name(serializer, name):
+    """Reject renaming to a name the user has, in any case, already."""
+    # Nested in a recipe, existing names are reused instead.
+    if serializer.instance is not None:
+        model = serializer.Meta.model
+        taken = model.objects.filter(
+            user=serializer.instance.user_id, name__iexact=name,
+        ).exclude(id=serializer.instance.id)
+        if taken.exists():
+            raise serializers.ValidationError(name_taken(model))
+
+    return name
+
+
+@contextmanager
+def unique_name_saved(model):
+    """Turn a name taken after validation into the same validation error."""
+    try:
+        # A savepoint keeps the transaction usable after the error.
+        with transaction.atomic():
+            yield
+    except IntegrityError as error:
+        # The unique index on (user_id, lower(name)), see migration 0011.
+        constraint = getattr(error.__cause__, 'diag', None)
+        if not getattr(constraint, 'constraint_name', '').endswith(
+            '_user_lower_name_uniq'
+        ):
+            raise
+        raise serializers.ValidationError({'name': [name_taken(model)]})
 
 
 # We have to move TagSerializer here because we're going to
 # add nested serializer into RecipeSerializer
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for tags."""
 
     class Meta:
         model = Tag
-        fields = ['id', 'name']
-        read_only_fields = ['id']
+        # recipe_count lets clients sort by popularity.
+        fields = ['id', 'name', 'recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+    def validate_name(self, value):
+        return validate_unique_name(self, value)
+
+    # Another request can take the name between validating and saving.
+    def update(self, instance, validated_data):
+        with unique_name_saved(Tag):
+            return super().update(instance, validated_data)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Ingredients."""
 
     class Meta:
         model = Ingredient
-        fields = ['id', 'name']
-        read_only_fields = ['id']
+        # recipe_count lets clients sort by popularity.
+        fields = ['id', 'name', 'recipe_count']
+        read_only_fields = ['id', 'recipe_count']
+
+    def validate_name(self, value):
+        return validate_unique_name(self, value)
+
+    def update(self, instance, validated_data):
+        with unique_name_saved(Ingredient):
+            return super().update(instance, validated_data)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+# Bounds the work a single bulk request can ask for.
+MAX_BULK_IDS = 1000
+
+
+def id_list():
+    return serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_IDS,
+    )
+
+
+class MergeSerializer(serializers.Serializer):
+    """Serializer for merging tags or ingredients into another one."""
+    sources = id_list()
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    """Serializer for deleting many tags or ingredients."""
+    ids = id_list()
+
+
+class AssignSerializer(serializers.Serializer):
+    """Serializer for (un)assigning a tag or ingredient to recipes."""
+    recipes = id_list()
+
+
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for recipes."""
     # many=True because tags would be a list of tags
     # By default, nested serializer is read only,
@@ -49,29 +140,22 @@ class RecipeSerializer(serializers.ModelSerializer):
         # The context is passed to the serializer by the view
         # when you're using the serializer for that particular view.
         auth_user = self.context['request'].user
-        for tag in tags:
-            # get_or_create is a helper method that's available for
-            # the model manager.
-            tag_obj, created = Tag.objects.get_or_create(
-                user=auth_user,
-                # We can use name=tag['name'].
-                # However, using **tag enables our codes to
-                # add new attrs in tag and make them passed in as well.
-                **tag
-            )
-            recipe.tags.add(tag_obj)
+        # upsert gets or creates every tag with one INSERT ... ON CONFLICT,
+        # which unlike get_or_create can't race with other requests.
+        tag_objs = Tag.objects.upsert(auth_user, [tag['name'] for tag in tags])
+        recipe.tags.add(*tag_objs)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed."""
         auth_user = self.context['request'].user
-        for ingredient in ingredients:
-            ing_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user,
-                **ingredient
-            )
-            recipe.ingredients.add(ing_obj)
+        ing_objs = Ingredient.objects.upsert(
+            auth_user, [ingredient['name'] for ingredient in ingredients]
+        )
+        recipe.ingredients.add(*ing_objs)
 
     # Override original create method
+    # The recipe, its links and the stats of its owner change together.
+    @transaction.atomic
     def create(self, validated_data):
         """Create a recipe."""
         # If tags exists in validated_data,
@@ -86,6 +170,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update recipe."""
         tags = validated_data.pop('tags', None)
@@ -102,6 +187,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
 
         instance.save()
+
         return instance
 
 
@@ -116,7 +202,7 @@ class RecipeDetailSerializer(RecipeSerializer):
 
 # We doing this as a separate API. The reason is that
 # it's best practice to only upload one type of data to an API
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for uploading images to recipes."""
 
     class Meta:
@@ -125,3 +211,131 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         fields = ['id', 'image']
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
+
+
+class TimeBucketSerializer(serializers.Serializer):
+    """Serializer for a bucket of the time_minutes histogram."""
+    min_minutes = serializers.IntegerField()
+    # Null for the last bucket, which has no upper bound.
+    max_minutes = serializers.IntegerField(allow_null=True)
+    count = serializers.IntegerField()
+
+
+class RecipeStatsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Serializer for the recipe statistics of a user."""
+    price_avg = serializers.DecimalField(
+        max_digits=5, decimal_places=2, read_only=True
+    )
+    time_distribution = serializers.SerializerMethodField()
+    top_tags = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RecipeStats
+        fields = [
+            'recipe_count', 'price_avg', 'price_min', 'price_max',
+            'time_distribution', 'top_tags',
+        ]
+        read_only_fields = fields
+
+    @extend_schema_field(TimeBucketSerializer(many=True))
+    def get_time_distribution(self, obj):
+        """Label each histogram bucket with its range in minutes."""
+        lowers = (0,) + TIME_BUCKETS
+        uppers = TIME_BUCKETS + (None,)
+        return [
+            {'min_minutes': lower, 'max_minutes': upper, 'count': count}
+            for lower, upper, count in zip(
+                lowers, uppers, obj.time_histogram
+            )
+        ]
+
+    # recipe_count is maintained on tags, so this is an index scan.
+    @extend_schema_field(TagSerializer(many=True))
+    def get_top_tags(self, obj):
+        tags = Tag.objects.filter(
+            user_id=obj.user_id, recipe_count__gt=0
+        ).order_by('-recipe_count', 'name')[:5]
+        return TagSerializer(tags, many=True).data
+
+
+class RecipeFilterSerializer(serializers.Serializer):
+    """Serializer for the range filters and ordering of recipe lists."""
+    # Sorting by price or time uses the recipe id to break ties.
+    ORDERINGS = [
+        'id', '-id', 'price', '-price', 'time_minutes', '-time_minutes',
+    ]
+
+    price_min = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False
+    )
+    price_max = serializers.DecimalField(
+        max_digits=5, decimal_places=2, required=False
+    )
+    time_max = serializers.IntegerField(required=False)
+    ordering = serializers.ChoiceField(choices=ORDERINGS, default='-id')
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of the change feed."""
+    since = serializers.IntegerField(min_value=0, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=500)
+
+
+class ChangeSerializer(serializers.Serializer):
+    """Serializer for a changed object in the change feed."""
+    seq = serializers.IntegerField()
+    type = serializers.ChoiceField(choices=Change.KIND_CHOICES)
+    id = serializers.IntegerField()
+    deleted = serializers.BooleanField()
+    # As the endpoint of its type serves it, null once deleted.
+    data = serializers.DictField(allow_null=True)
+
+
+class ChangesSerializer(serializers.Serializer):
+    """Serializer for a page of the change feed."""
+    cursor = serializers.IntegerField()
+    more = serializers.BooleanField()
+    changes = ChangeSerializer(many=True)
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """Serializer for a recipe with its similarity to another one."""
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['similarity']
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of similar recipes."""
+    metric = serializers.ChoiceField(
+        choices=['jaccard', 'cosine'], default='jaccard'
+    )
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+
+class PantryRecipeSerializer(RecipeSerializer):
+    """Serializer for a recipe with the share of its ingredients owned."""
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ['coverage']
+
+
+class PantryQuerySerializer(serializers.Serializer):
+    """Serializer for the query parameters of cooking from a pantry."""
+    ingredients = serializers.CharField()
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate_ingredients(self, value):
+        """Return the comma separated IDs as a list of integers."""
+        try:
+            ids = [int(str_id) for str_id in value.split(',')]
+        except ValueError:
+            ids = []
+        # IDs are bigints in the database, larger ones overflow the query.
+        if not ids or not all(1 <= id_ <= 2**63 - 1 for id_ in ids):
+            raise serializers.ValidationError(
+                'Expected comma separated ingredient IDs.'
+            )
+        return ids
@@ -0,0 +1,246 @@
+"""
+Similarity of recipes by their tags and ingredients.
+
+The tags and ingredients of a user's recipes are held in memory as a
+sparse matrix, kept both by recipe (CSR) and by feature (CSC). Ranking
+every recipe against one counts the shared features through the posting
+lists of its own features, in a few vectorized passes. Ranking them by
+the ingredients of a pantry reads the posting lists of those ingredients
+the same way.
+
+Building the matrix reads every link of the user, so it is kept between
+requests. Writes log the recipes whose links changed in the change log of
+synced clients, see core.models.Change, and only their rows are read
+again to patch the matrix. The log is in the database, so every process
+sees the writes of the others.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from core.metrics import record_cache
+from core.models import Change, Recipe
+
+
+# Past as many changed recipes, the index is built again instead.
+MAX_PATCHED = 1000
+
+# Indexes are kept across requests, so they are read from the primary. A
+# lagging replica would leave them stale until the recipes change again.
+DATABASE = DEFAULT_DB_ALIAS
+
+
+def _links(user_id, recipe_ids=None):
+    """Return arrays of (recipe id, feature) of the links of a user."""
+    recipes = []
+    features = []
+    # Tags and ingredients share one feature space, told apart by the
+    # parity of their codes. Codes are unsigned, as twice a bigint id
+    # overflows int64.
+    links = (
+        (Recipe.tags.through, 'tag_id', 0),
+        (Recipe.ingredients.through, 'ingredient_id', 1),
+    )
+    for through, column, parity in links:
+        queryset = through.objects.using(DATABASE).filter(
+            recipe__user_id=user_id
+        )
+        if recipe_ids is not None:
+            queryset = queryset.filter(recipe_id__in=recipe_ids)
+        rows = list(queryset.values_list('recipe_id', column))
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        recipes.append(rows[:, 0])
+        features.append(rows[:, 1].astype(np.uint64) * 2 + parity)
+
+    return np.concatenate(recipes), np.concatenate(features)
+
+
+def _groups(values):
+    """Return the distinct values of a sorted array and where each starts.
+
+    Like the indptr of a sparse matrix, the last offset is the length.
+    """
+    starts = np.flatnonzero(np.diff(values)) + 1
+    if len(values):
+        starts = np.concatenate(([0], starts))
+    return values[starts], np.append(starts, len(values))
+
+
+class SimilarityIndex:
+    """Tag and ingredient sets of the recipes of one user."""
+
+    def __init__(self, recipes, features):
+        """Index the (recipe id, feature) pairs in two arrays."""
+        # By recipe: row i holds the features of recipe_ids[i].
+        order = np.argsort(recipes, kind='stable')
+        self.features = features[order]
+        self.recipe_ids, self.indptr = _groups(recipes[order])
+        self.sizes = np.diff(self.indptr)
+
+        # By feature: the posting list of codes[j] holds row numbers.
+        rows = np.repeat(np.arange(len(self.sizes)), self.sizes)
+        self.ingredient_counts = np.bincount(
+            rows[self.features % 2 == 1], minlength=len(self.sizes)
+        )
+        order = np.argsort(self.features)
+        self.postings = rows[order]
+        self.codes, self.postptr = _groups(self.features[order])
+
+    @classmethod
+    def build(cls, user_id):
+        """Index every recipe of a user."""
+        return cls(*_links(user_id))
+
+    def patched(self, user_id, recipe_ids):
+        """Return a new index with the rows of recipe_ids read again."""
+        recipes = np.repeat(self.recipe_ids, self.sizes)
+        keep = ~np.isin(recipes, list(recipe_ids))
+        new_recipes, new_features = _links(user_id, recipe_ids)
+        return type(self)(
+            np.concatenate((recipes[keep], new_recipes)),
+            np.concatenate((self.features[keep], new_features)),
+        )
+
+    def _row(self, recipe_id):
+        row = np.searchsorted(self.recipe_ids, recipe_id)
+        if row < len(self.recipe_ids) and self.recipe_ids[row] == recipe_id:
+            return row
+        return None
+
+    def _counts(self, codes):
+        """Return how many of the features in codes each row holds."""
+        columns = np.searchsorted(self.codes, codes)
+        postings = [
+            self.postings[self.postptr[column]:self.postptr[column + 1]]
+            for column, code in zip(columns, codes)
+            if column < len(self.codes) and self.codes[column] == code
+        ]
+        # Rows found in n posting lists hold n of the features.
+        return np.bincount(
+            np.concatenate(postings or [np.empty(0, dtype=np.int64)]),
+            minlength=len(self.sizes),
+        )
+
+    def _top(self, counts, scores_of, limit):
+        """Return [(recipe id, score)] of the best rows with a count.
+
+        Ties go to the newer recipe.
+        """
+        candidates = np.flatnonzero(counts)
+        scores = scores_of(candidates, counts[candidates])
+        if len(candidates) > limit:
+            # Only the top ones need sorting. Ties at the cut are kept, so
+            # the newer recipes can win them.
+            cut = np.partition(scores, len(scores) - limit)[-limit]
+            keep = scores >= cut
+            candidates, scores = candidates[keep], scores[keep]
+
+        ids = self.recipe_ids[candidates]
+        order = np.lexsort((-ids, -scores))[:limit]
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def similar(self, recipe_id, metric='jaccard', limit=10):
+        """Return [(recipe id, score)] of the recipes most like recipe_id.
+
+        Recipes sharing nothing with it are left out. Ties go to the
+        newer recipe.
+        """
+        row = self._row(recipe_id)
+        if row is None:
+            # No tags nor ingredients, nothing is like it.
+            return []
+
+        query = self.features[self.indptr[row]:self.indptr[row + 1]]
+        intersection = self._counts(query)
+        intersection[row] = 0
+
+        def scores_of(candidates, common):
+            sizes = self.sizes[candidates]
+            if metric == 'cosine':
+                return common / np.sqrt(len(query) * sizes)
+            return common / (len(query) + sizes - common)
+
+        return self._top(intersection, scores_of, limit)
+
+    def pantry(self, ingredient_ids, limit=10):
+        """Return [(recipe id, coverage)] of the recipes best covered.
+
+        The coverage of a recipe is the share of its ingredients found in
+        ingredient_ids. Recipes using none of them are left out. Ties go
+        to the newer recipe.
+        """
+        codes = np.unique(np.array(ingredient_ids, dtype=np.uint64)) * 2 + 1
+        owned = self._counts(codes)
+
+        def scores_of(candidates, owned):
+            return owned / self.ingredient_counts[candidates]
+
+        return self._top(owned, scores_of, limit)
+
+
+# (last change applied, index) of the users last asked for, by user id,
+# least recent first.
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def _store(user_id, seq, index):
+    with _lock:
+        _indexes[user_id] = (seq, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > settings.SIMILARITY_CACHE_USERS:
+            _indexes.popitem(last=False)
+
+
+def _changed_recipes(user_id, since, seq):
+    """Return the ids of recipes changed after change since, up to seq.
+
+    Past MAX_PATCHED of them the rest are left out.
+    """
+    if since == seq:
+        return set()
+
+    # Compacting the log keeps the last change of every recipe.
+    changes = Change.objects.using(DATABASE).filter(
+        user_id=user_id, kind='recipe', seq__gt=since, seq__lte=seq,
+    )
+    return set(changes.values_list(
+        'object_id', flat=True
+    ).order_by().distinct()[:MAX_PATCHED + 1])
+
+
+def get_index(user_id):
+    """Return the up to date index of a user's recipes."""
+    # Writes log the recipes they change, see core.signals. Numbering the
+    # committed changes tells which ones the index hasn't seen.
+    state = Change.objects.db_manager(DATABASE).seal(user_id)
+    with _lock:
+        cached = _indexes.get(user_id)
+        if cached is not None:
+            _indexes.move_to_end(user_id)
+
+    # Before the horizon, deleted recipes may have left no trace.
+    if cached is not None and cached[0] >= state.horizon:
+        since, index = cached
+        changed = _changed_recipes(user_id, since, state.seq)
+        if len(changed) <= MAX_PATCHED:
+            record_cache('similarity_index', True)
+            if changed:
+                index = index.patched(user_id, changed)
+                _store(user_id, state.seq, index)
+            return index
+
+    record_cache('similarity_index', False)
+    # Numbered first, so changes made while building are applied again.
+    index = SimilarityIndex.build(user_id)
+    _store(user_id, state.seq, index)
+    return index
+
+
+def clear():
+    """Forget every index of this process."""
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,56 @@
+"""
+Background jobs for the recipe APIs.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from core.jobs import task
+from core.models import Change, Recipe
+
+
+@task
+def process_recipe_image(recipe_id, name):
+    """Rotate an uploaded image upright and shrink it to a sane size."""
+    # Pillow is only needed by workers, keep it out of web processes.
+    from PIL import Image, ImageOps
+
+    recipe = Recipe.objects.filter(id=recipe_id, image=name).first()
+    if recipe is None:
+        # The recipe was deleted or got another image since.
+        return
+
+    with recipe.image.open('rb') as image_file:
+        image = Image.open(image_file)
+        image_format = image.format
+        limit = settings.RECIPE_IMAGE_MAX_SIZE
+        # 0x0112 is the EXIF orientation tag, 1 meaning upright.
+        rotated = image.getexif().get(0x0112, 1) != 1
+        if not rotated and max(image.size) <= limit:
+            return
+
+        upright = ImageOps.exif_transpose(image)
+        upright.thumbnail((limit, limit))
+
+        buffer = io.BytesIO()
+        upright.save(buffer, format=image_format, quality=85)
+
+    storage = recipe.image.storage
+    new_name = storage.save(
+        recipe_image_name(name), ContentFile(buffer.getvalue())
+    )
+    # Only swap if the image didn't change while we were working.
+    if Recipe.objects.filter(id=recipe_id, image=name).update(image=new_name):
+        # update() sends no signals, so log the change for synced clients.
+        Change.objects.record(Recipe, recipe.user_id, [recipe_id])
+        storage.delete(name)
+    else:
+        storage.delete(new_name)
+
+
+def recipe_image_name(name):
+    """Return the name of the processed version of an image."""
+    root, ext = os.path.splitext(name)
+    return f'{root}-processed{ext}'
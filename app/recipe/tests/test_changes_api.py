@@ -0,0 +1,148 @@
+"""
+Tests for the change feed API.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Change, Recipe, Tag
+
+
+CHANGES_URL = reverse('recipe:changes')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def create_user(email='user@example.com', password='testpass123'):
+    """Create and return a user."""
+    return get_user_model().objects.create_user(email=email, password=password)
+
+
+class PublicChangesAPITests(TestCase):
+    """Test unauthenticated API requests."""
+
+    def test_auth_required(self):
+        """Test auth is required to read changes."""
+        res = APIClient().get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateChangesAPITests(TestCase):
+    """Test reading the changes of an authenticated user."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user()
+        self.client.force_authenticate(self.user)
+        self.cursor = self.client.get(CHANGES_URL).data['cursor']
+
+    def changes_since(self, cursor, **params):
+        res = self.client.get(CHANGES_URL, {'since': cursor, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def summary(self, data):
+        return [
+            (change['type'], change['id'], change['deleted'])
+            for change in data['changes']
+        ]
+
+    def test_cursor_without_since(self):
+        """Test only a cursor is returned without ?since=."""
+        self.assertEqual(self.cursor, 0)
+        self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': Decimal('1.00'),
+        })
+
+        res = self.client.get(CHANGES_URL)
+
+        self.assertEqual(res.data['changes'], [])
+        self.assertGreater(res.data['cursor'], self.cursor)
+
+    def test_created_and_updated_listed_once(self):
+        """Test each changed object is listed once, with current data."""
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Soup', 'time_minutes': 5, 'price': Decimal('1.00'),
+            'tags': [{'name': 'Quick'}],
+        }, format='json')
+        recipe_id = res.data['id']
+        tag = Tag.objects.get(user=self.user)
+        self.client.patch(
+            reverse('recipe:recipe-detail', args=[recipe_id]),
+            {'title': 'Stew'},
+        )
+
+        data = self.changes_since(self.cursor)
+
+        self.assertEqual(self.summary(data), [
+            ('tag', tag.id, False),
+            ('recipe', recipe_id, False),
+        ])
+        self.assertEqual(data['changes'][1]['data']['title'], 'Stew')
+        self.assertFalse(data['more'])
+        self.assertEqual(self.changes_since(data['cursor'])['changes'], [])
+
+    def test_deletions_leave_tombstones(self):
+        """Test deleted objects are listed as deleted."""
+        recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=Decimal('1'),
+        )
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        recipe.tags.add(tag)
+        cursor = self.changes_since(self.cursor)['cursor']
+        self.client.post(
+            reverse('recipe:tag-bulk-delete'), {'ids': [tag.id]},
+            format='json',
+        )
+
+        data = self.changes_since(cursor)
+
+        self.assertEqual(self.summary(data), [
+            ('tag', tag.id, True),
+            ('recipe', recipe.id, False),
+        ])
+        self.assertIsNone(data['changes'][0]['data'])
+        self.assertEqual(data['changes'][1]['data']['tags'], [])
+
+    def test_pages(self):
+        """Test following the cursor through pages of changes."""
+        for index in range(3):
+            Tag.objects.create(user=self.user, name=f'Tag {index}')
+
+        seen = []
+        cursor = self.cursor
+        while True:
+            data = self.changes_since(cursor, limit=2)
+            seen += [change['id'] for change in data['changes']]
+            cursor = data['cursor']
+            if not data['more']:
+                break
+
+        tags = Tag.objects.order_by('id').values_list('id', flat=True)
+        self.assertEqual(seen, list(tags))
+
+    def test_compacted_cursor_gone(self):
+        """Test cursors behind compacted tombstones must start over."""
+        Tag.objects.create(user=self.user, name='Quick').delete()
+        self.changes_since(self.cursor)
+        Change.objects.compact(self.user.id, timezone.now() + timedelta(1))
+
+        res = self.client.get(CHANGES_URL, {'since': self.cursor})
+
+        self.assertEqual(res.status_code, status.HTTP_410_GONE)
+
+    def test_changes_limited_to_user(self):
+        """Test changes of other users aren't listed."""
+        other = create_user(email='other@example.com')
+        Tag.objects.create(user=other, name='Quick')
+
+        data = self.changes_since(self.cursor)
+
+        self.assertEqual(data['changes'], [])
@@ -106,6 +106,8 @@ class PrivateIngredientsApiTests(TestCase):
             user=self.user,
         )
         recipe.ingredients.add(in1)
+        # Pick up the recipe_count updated by the add.
+        in1.refresh_from_db()
 
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
@@ -137,3 +139,22 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_merge_ingredients(self):
+        """Test merging ingredients keeps their recipes."""
+        target = Ingredient.objects.create(user=self.user, name='Salt')
+        dupe = Ingredient.objects.create(user=self.user, name='Sea salt')
+        recipe = Recipe.objects.create(
+            title='Fries',
+            time_minutes=20,
+            price=Decimal('2.00'),
+            user=self.user,
+        )
+        recipe.ingredients.add(dupe)
+        url = reverse('recipe:ingredient-merge', args=[target.id])
+
+        res = self.client.post(url, {'sources': [dupe.id]}, format='json')
+
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(list(recipe.ingredients.all()), [target])
+        self.assertFalse(Ingredient.objects.filter(id=dupe.id).exists())
@@ -2,25 +2,33 @@
 Test for recipe APIs.
 """
 from decimal import Decimal
+import io
 import tempfile
 import os
+from unittest.mock import patch
 
 # PIL is the Pillow lib we installed
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core import jobs
+from core.models import Change, Job, Recipe, RecipeStats, Tag, Ingredient
 
+from recipe import similarity
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 
 RECIPES_URL = reverse('recipe:recipe-list')
+STATS_URL = reverse('recipe:recipe-stats')
+PANTRY_URL = reverse('recipe:recipe-pantry')
+UPLOAD_IMAGES_URL = reverse('recipe:recipe-upload-images')
 
 
 def detail_url(recipe_id):
@@ -30,6 +38,11 @@ def detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
+def similar_url(recipe_id):
+    """Create and return the URL of recipes similar to a recipe."""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
 def image_upload_url(recipe_id):
     """Create and return an image upload URL."""
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
@@ -271,6 +284,27 @@ class PrivateRecipeAPITests(TestCase):
             ).exists()
             self.assertTrue(exists)
 
+    def test_create_recipe_tags_match_case_insensitively(self):
+        """Test tag names differing only in case are the same tag."""
+        tag = Tag.objects.create(user=self.user, name='Indian')
+        payload = {
+            'title': 'Dal',
+            'time_minutes': 40,
+            'price': Decimal('3.00'),
+            'tags': [{'name': 'INDIAN'}, {'name': 'Lentils'},
+                     {'name': 'lentils'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(
+            sorted(recipe.tags.values_list('name', flat=True)),
+            ['Indian', 'Lentils'],
+        )
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+
     def test_create_tag_on_update(self):
         """Test creating tag when updating a recipe."""
         recipe = create_recipe(user=self.user)
@@ -437,6 +471,382 @@ class PrivateRecipeAPITests(TestCase):
         self.assertNotIn(s3.data, res.data)
 
 
+class RecipeStatsAPITests(TestCase):
+    """Test the recipe statistics API."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+
+    def test_stats_without_recipes(self):
+        """Test stats of a user without recipes."""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['price_avg'])
+        self.assertEqual(res.data['top_tags'], [])
+
+    def test_stats_follow_writes(self):
+        """Test creating, updating and deleting recipes updates stats."""
+        payload = {
+            'title': 'Curry',
+            'time_minutes': 25,
+            'price': Decimal('4.00'),
+            'tags': [{'name': 'Thai'}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        first_id = res.data['id']
+        payload.update(title='Stew', time_minutes=95, price=Decimal('8.00'))
+        res = self.client.post(RECIPES_URL, payload, format='json')
+        second_id = res.data['id']
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['price_avg'], '6.00')
+        self.assertEqual(res.data['price_min'], '4.00')
+        self.assertEqual(res.data['price_max'], '8.00')
+        counts = [b['count'] for b in res.data['time_distribution']]
+        self.assertEqual(counts, [0, 0, 1, 0, 0, 0, 1, 0])
+        self.assertEqual(res.data['top_tags'][0]['name'], 'Thai')
+        self.assertEqual(res.data['top_tags'][0]['recipe_count'], 2)
+
+        self.client.patch(detail_url(first_id), {'price': Decimal('2.00')})
+        self.client.delete(detail_url(second_id))
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(res.data['price_avg'], '2.00')
+        self.assertEqual(res.data['price_max'], '2.00')
+        counts = [b['count'] for b in res.data['time_distribution']]
+        self.assertEqual(counts, [0, 0, 1, 0, 0, 0, 0, 0])
+
+    def test_stats_limited_to_user(self):
+        """Test stats only cover the recipes of the user."""
+        other_user = create_user(email='other@example.com', password='123')
+        other = APIClient()
+        other.force_authenticate(other_user)
+        other.post(RECIPES_URL, {
+            'title': 'Pie', 'time_minutes': 5, 'price': Decimal('1.00'),
+        })
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 0)
+
+
+class RecipeRangeFilterTests(TestCase):
+    """Test filtering and sorting recipes by price and time."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.cheap = create_recipe(
+            self.user, price=Decimal('2.00'), time_minutes=40
+        )
+        self.quick = create_recipe(
+            self.user, price=Decimal('8.00'), time_minutes=5
+        )
+        self.dear = create_recipe(
+            self.user, price=Decimal('20.00'), time_minutes=15
+        )
+
+    def _ids(self, params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [r['id'] for r in res.data]
+
+    def test_filter_by_price_and_time(self):
+        """Test returning recipes within a price range and time limit."""
+        ids = self._ids({'price_min': '5', 'price_max': '20'})
+
+        self.assertEqual(ids, [self.dear.id, self.quick.id])
+
+        ids = self._ids({'time_max': 15})
+
+        self.assertEqual(ids, [self.dear.id, self.quick.id])
+
+    def test_ordering(self):
+        """Test sorting recipes by price or time."""
+        ids = self._ids({'ordering': 'price'})
+
+        self.assertEqual(ids, [self.cheap.id, self.quick.id, self.dear.id])
+
+        ids = self._ids({'ordering': '-time_minutes', 'price_max': '10'})
+
+        self.assertEqual(ids, [self.cheap.id, self.quick.id])
+
+    def test_filters_compose_with_tags(self):
+        """Test range filters apply together with tag filters."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        self.cheap.tags.add(tag)
+        self.dear.tags.add(tag)
+
+        ids = self._ids({'tags': tag.id, 'time_max': 20})
+
+        self.assertEqual(ids, [self.dear.id])
+
+    def test_invalid_filters(self):
+        """Test invalid ranges and orderings are rejected."""
+        for params in ({'price_min': 'cheap'}, {'ordering': 'title'}):
+            res = self.client.get(RECIPES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipePaginationTests(TestCase):
+    """Test paginating recipe lists."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        for index in range(3):
+            self.client.post(RECIPES_URL, {
+                'title': f'Recipe {index}',
+                'time_minutes': 10,
+                'price': Decimal('2.00'),
+            })
+
+    def test_pagination_opt_in(self):
+        """Test lists are only paginated when a limit is given."""
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 3)
+
+        res = self.client.get(RECIPES_URL, {'limit': 2})
+
+        self.assertEqual(res.data['count'], 3)
+        self.assertTrue(res.data['count_exact'])
+        self.assertEqual(len(res.data['results']), 2)
+        self.assertIn('cursor=', res.data['next'])
+
+        res = self.client.get(RECIPES_URL, {'limit': 2, 'offset': 2})
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertIsNone(res.data['next'])
+
+    def test_pages_follow_cursor(self):
+        """Test next links resume after the last row, ties included."""
+        # Every recipe has the same price, the id breaks the ties.
+        params = {'limit': 1, 'ordering': '-price'}
+        res = self.client.get(RECIPES_URL, params)
+        ids = [r['id'] for r in res.data['results']]
+        while res.data['next']:
+            res = self.client.get(res.data['next'])
+            self.assertEqual(res.data['count'], 3)
+            self.assertIsNone(res.data['previous'])
+            ids += [r['id'] for r in res.data['results']]
+
+        expected = Recipe.objects.order_by('-price', '-id')
+        self.assertEqual(ids, [recipe.id for recipe in expected])
+
+    def test_invalid_cursor(self):
+        """Test a cursor which wasn't given out is rejected."""
+        res = self.client.get(RECIPES_URL, {'limit': 2, 'cursor': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(PAGINATION_EXACT_COUNT_THRESHOLD=2)
+    def test_large_count_from_stats(self):
+        """Test counts above the threshold come from the recipe stats."""
+        RecipeStats.objects.filter(user=self.user).update(recipe_count=50)
+
+        res = self.client.get(RECIPES_URL, {'limit': 2})
+
+        self.assertEqual(res.data['count'], 50)
+        self.assertFalse(res.data['count_exact'])
+
+    @override_settings(PAGINATION_EXACT_COUNT_THRESHOLD=2)
+    def test_large_filtered_count_estimated(self):
+        """Test filtered counts above the threshold are estimated."""
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        for recipe in Recipe.objects.all():
+            recipe.tags.add(tag)
+
+        res = self.client.get(RECIPES_URL, {'limit': 1, 'tags': tag.id})
+
+        self.assertFalse(res.data['count_exact'])
+        self.assertGreaterEqual(res.data['count'], 3)
+        self.assertEqual(len(res.data['results']), 1)
+
+
+class SimilarRecipesAPITests(TestCase):
+    """Test ranking recipes by shared tags and ingredients."""
+
+    def setUp(self):
+        cache.clear()
+        similarity.clear()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        thai, quick, spicy = (
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Thai', 'Quick', 'Spicy')
+        )
+        self.rice = Ingredient.objects.create(user=self.user, name='Rice')
+        self.curry = create_recipe(self.user, title='Curry')
+        self.curry.tags.add(thai, quick)
+        self.curry.ingredients.add(self.rice)
+        self.twin = create_recipe(self.user, title='Curry again')
+        self.twin.tags.add(thai, quick)
+        self.twin.ingredients.add(self.rice)
+        self.noodles = create_recipe(self.user, title='Noodles')
+        self.noodles.tags.add(thai)
+        self.unrelated = create_recipe(self.user, title='Chili')
+        self.unrelated.tags.add(spicy)
+
+    def test_similar_ranked_by_jaccard(self):
+        """Test recipes are ranked by the Jaccard index of their sets."""
+        res = self.client.get(similar_url(self.curry.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r['id'], r['similarity']) for r in res.data],
+            [(self.twin.id, 1.0), (self.noodles.id, 1 / 3)],
+        )
+        self.assertEqual(
+            {tag['name'] for tag in res.data[0]['tags']}, {'Thai', 'Quick'}
+        )
+
+    def test_similar_cosine_and_limit(self):
+        """Test the cosine metric and limiting the results."""
+        res = self.client.get(
+            similar_url(self.noodles.id), {'metric': 'cosine', 'limit': 1}
+        )
+
+        # Both curries share Thai, the newer one wins the tie.
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['id'], self.twin.id)
+        self.assertAlmostEqual(res.data[0]['similarity'], 3 ** -0.5)
+
+    def test_similar_invalid_metric(self):
+        """Test an unknown metric is rejected."""
+        res = self.client.get(similar_url(self.curry.id), {'metric': 'l2'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_similar_other_users_recipe(self):
+        """Test recipes of other users can't be compared."""
+        other = create_user(email='other@example.com', password='test123')
+        recipe = create_recipe(other)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_index_patched_after_write(self):
+        """Test writes patch the cached index instead of rebuilding it."""
+        self.client.get(similar_url(self.curry.id))
+        self.noodles.ingredients.add(self.rice)
+        self.twin.delete()
+        # The writes are logged in the database, not in the cache of the
+        # process which made them.
+        cache.clear()
+
+        with patch.object(similarity.SimilarityIndex, 'build') as build:
+            res = self.client.get(similar_url(self.curry.id))
+
+        build.assert_not_called()
+        self.assertEqual(
+            [(r['id'], r['similarity']) for r in res.data],
+            [(self.noodles.id, 2 / 3)],
+        )
+
+
+class PantryAPITests(TestCase):
+    """Test ranking recipes by the share of their ingredients owned."""
+
+    def setUp(self):
+        cache.clear()
+        similarity.clear()
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.rice, self.egg, self.leek = (
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Rice', 'Egg', 'Leek')
+        )
+        self.fried_rice = create_recipe(self.user, title='Fried rice')
+        self.fried_rice.ingredients.add(self.rice, self.egg, self.leek)
+        self.omelette = create_recipe(self.user, title='Omelette')
+        self.omelette.ingredients.add(self.egg)
+        self.soup = create_recipe(self.user, title='Leek soup')
+        self.soup.ingredients.add(self.leek)
+
+    def _ingredients(self, *ingredients):
+        return ','.join(str(ingredient.id) for ingredient in ingredients)
+
+    def test_pantry_ranked_by_coverage(self):
+        """Test recipes are ranked by the share of ingredients owned."""
+        res = self.client.get(
+            PANTRY_URL, {'ingredients': self._ingredients(self.rice, self.egg)}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r['id'], r['coverage']) for r in res.data],
+            [(self.omelette.id, 1.0), (self.fried_rice.id, 2 / 3)],
+        )
+        self.assertEqual(len(res.data[1]['ingredients']), 3)
+
+    def test_pantry_largest_ids(self):
+        """Test ingredient ids past 2**62 are told apart."""
+        salt, pepper = (
+            Ingredient.objects.create(id=id_, user=self.user, name=name)
+            for id_, name in ((2**62 + 1, 'Salt'), (2**63 - 1, 'Pepper'))
+        )
+        self.soup.ingredients.add(salt)
+        self.omelette.ingredients.add(pepper)
+
+        res = self.client.get(PANTRY_URL, {'ingredients': str(2**62 + 1)})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(r['id'], r['coverage']) for r in res.data],
+            [(self.soup.id, 0.5)],
+        )
+        # Keyed by the code of each id, not one wrapped around.
+        codes = similarity.SimilarityIndex.build(self.user.id).codes.tolist()
+        self.assertEqual(codes[-2:], [(2**62 + 1) * 2 + 1, 2**64 - 1])
+
+    def test_pantry_limit_and_ties(self):
+        """Test limiting the results, the newer recipe wins ties."""
+        res = self.client.get(PANTRY_URL, {
+            'ingredients': self._ingredients(self.egg, self.leek),
+            'limit': 1,
+        })
+
+        self.assertEqual([r['id'] for r in res.data], [self.soup.id])
+
+    def test_pantry_ignores_other_users_ingredients(self):
+        """Test ingredients of other users match nothing."""
+        other = create_user(email='other@example.com', password='test123')
+        ingredient = Ingredient.objects.create(user=other, name='Rice')
+        create_recipe(other).ingredients.add(ingredient)
+
+        res = self.client.get(
+            PANTRY_URL, {'ingredients': self._ingredients(ingredient)}
+        )
+
+        self.assertEqual(res.data, [])
+
+    def test_pantry_invalid_ingredients(self):
+        """Test ingredients must be given as comma separated IDs."""
+        for params in (
+            {},
+            {'ingredients': '1,rice'},
+            {'ingredients': '0'},
+            {'ingredients': '100000000000000000000'},
+        ):
+            res = self.client.get(PANTRY_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
 
@@ -488,3 +898,123 @@ class ImageUploadTests(TestCase):
         res = self.client.post(url, payload, format='multipart')
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=5)
+    def test_uploaded_image_processed_in_background(self):
+        """Test uploads queue a job which shrinks the image."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
+            Image.new('RGB', (10, 10)).save(image_file, format='JPEG')
+            image_file.seek(0)
+            self.client.post(url, {'image': image_file}, format='multipart')
+        self.recipe.refresh_from_db()
+        uploaded = self.recipe.image.path
+
+        Change.objects.all().delete()
+
+        job = jobs.claim()
+        self.assertEqual(job.payload['recipe_id'], self.recipe.id)
+        self.assertEqual(jobs.run(job), 'done')
+
+        self.recipe.refresh_from_db()
+        self.assertFalse(os.path.exists(uploaded))
+        with Image.open(self.recipe.image.path) as img:
+            self.assertEqual(img.size, (5, 5))
+        self.assertFalse(Job.objects.exists())
+        # Synced clients learn about the new image.
+        self.assertTrue(Change.objects.filter(
+            kind='recipe', object_id=self.recipe.id, deleted=False
+        ).exists())
+
+
+def image_file(name='image.jpg'):
+    """Return a small JPEG image, as uploaded by a client."""
+    image = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(image, format='JPEG')
+    image.seek(0)
+    image.name = name
+    return image
+
+
+class BulkImageUploadTests(TestCase):
+    """Tests for uploading images to many recipes at once."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = create_user(email='user@example.com', password='test123')
+        self.client.force_authenticate(self.user)
+        self.recipes = [create_recipe(user=self.user) for _ in range(2)]
+
+    def tearDown(self):
+        for recipe in Recipe.objects.exclude(image=''):
+            recipe.image.delete()
+
+    def test_upload_images(self):
+        """Test every image gets its own result."""
+        foreign = create_recipe(
+            user=create_user(email='other@example.com', password='test123')
+        )
+        not_image = io.BytesIO(b'not an image')
+        not_image.name = 'image.jpg'
+        payload = {
+            str(self.recipes[0].id): image_file(),
+            str(foreign.id): image_file(),
+            str(self.recipes[1].id): not_image,
+            'title': image_file(),
+        }
+
+        res = self.client.post(UPLOAD_IMAGES_URL, payload, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [
+            self.recipes[0].id, str(foreign.id), self.recipes[1].id, 'title',
+        ])
+        self.assertIn('image', res.data[0])
+        for item in res.data[1:]:
+            self.assertIn('errors', item)
+
+        for recipe in self.recipes:
+            recipe.refresh_from_db()
+        self.assertTrue(os.path.exists(self.recipes[0].image.path))
+        self.assertFalse(self.recipes[1].image)
+        foreign.refresh_from_db()
+        self.assertFalse(foreign.image)
+        job = Job.objects.get()
+        self.assertEqual(job.payload, {
+            'recipe_id': self.recipes[0].id,
+            'name': self.recipes[0].image.name,
+        })
+
+    def test_upload_images_to_invalid_ids(self):
+        """Test field names which aren't recipe ids are reported."""
+        keys = ['\u00b2', '100000000000000000000']
+        payload = {key: image_file() for key in keys}
+
+        res = self.client.post(UPLOAD_IMAGES_URL, payload, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': key, 'errors': ['Recipe not found.']} for key in keys
+        ])
+
+    @override_settings(RECIPE_BULK_UPLOAD_MAX_BYTES=100)
+    def test_upload_too_large(self):
+        """Test requests over the size cap are refused before parsing."""
+        payload = {str(self.recipes[0].id): image_file()}
+
+        res = self.client.post(UPLOAD_IMAGES_URL, payload, format='multipart')
+
+        self.assertEqual(
+            res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        self.assertFalse(Recipe.objects.exclude(image='').exists())
+
+    @override_settings(RECIPE_BULK_UPLOAD_MAX_ITEMS=1)
+    def test_upload_too_many(self):
+        """Test sending more images than allowed is refused."""
+        payload = {str(recipe.id): image_file() for recipe in self.recipes}
+
+        res = self.client.post(UPLOAD_IMAGES_URL, payload, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.exclude(image='').exists())
@@ -2,9 +2,10 @@
 Tests for the tags API.
 """
 from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
 from rest_framework import status
@@ -23,6 +24,11 @@ def detail_url(tag_id):
     return reverse('recipe:tag-detail', args=[tag_id])
 
 
+def action_url(tag_id, action):
+    """Create and return the url of a bulk action on a tag."""
+    return reverse(f'recipe:tag-{action}', args=[tag_id])
+
+
 # Helper functions
 def create_user(email='user@example.com', password='testpass123'):
     """Create and return a user."""
@@ -112,6 +118,8 @@ class PrivateTagsAPITests(TestCase):
         )
 
         recipe.tags.add(tag1)
+        # Pick up the recipe_count updated by the add.
+        tag1.refresh_from_db()
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
@@ -143,3 +151,229 @@ class PrivateTagsAPITests(TestCase):
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_invalid_assigned_only(self):
+        """Test a flag other than 0 or 1 returns an error."""
+        res = self.client.get(TAGS_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tag_list_not_cached_by_default(self):
+        """Test lists aren't cached in the cache of a single process."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(1):
+            self.client.get(TAGS_URL)
+
+    @override_settings(LIST_CACHE_ENABLED=True)
+    def test_tag_list_cached_by_flag(self):
+        """Test spellings of the same flag share one cached list."""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL, {'assigned_only': '0'})
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL, {'assigned_only': '00'})
+        self.assertEqual(len(res.data), 1)
+
+    @override_settings(LIST_CACHE_ENABLED=True)
+    def test_tag_list_cached(self):
+        """Test tag lists are cached until a tag or its recipes change."""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(TAGS_URL)
+        self.assertEqual(res.data[0]['name'], 'Vegan')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url(tag.id), {'name': 'Plant based'})
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]['name'], 'Plant based')
+
+        recipe = Recipe.objects.create(
+            title='Salad',
+            time_minutes=5,
+            price=Decimal('3.00'),
+            user=self.user,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(tag)
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]['recipe_count'], 1)
+
+    def test_paginate_tags(self):
+        """Test tag lists are paginated with a limit."""
+        for name in ['Vegan', 'Dessert', 'Quick']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res = self.client.get(TAGS_URL, {'limit': 2})
+
+        self.assertEqual(res.data['count'], 3)
+        self.assertTrue(res.data['count_exact'])
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']], ['Vegan', 'Quick']
+        )
+
+    def test_rename_tag_to_existing_name(self):
+        """Test renaming a tag to a name in use returns an error."""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='Sweets')
+
+        res = self.client.patch(detail_url(tag.id), {'name': 'dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rename_tag_to_name_taken_meanwhile(self):
+        """Test a name taken after validation still returns an error."""
+        Tag.objects.create(user=self.user, name='Dessert')
+        tag = Tag.objects.create(user=self.user, name='Sweets')
+
+        # As if another request took the name once this one checked it.
+        with patch(
+            'recipe.serializers.validate_unique_name',
+            side_effect=lambda serializer, name: name,
+        ):
+            res = self.client.patch(detail_url(tag.id), {'name': 'dessert'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            res.data['name'], ['A tag with this name exists.']
+        )
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Sweets')
+
+    def test_tags_include_recipe_count(self):
+        """Test tags report how many recipes use them."""
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        for title in ['Eggs', 'Pancakes']:
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=10,
+                price=Decimal('2.00'),
+                user=self.user,
+            )
+            recipe.tags.add(tag)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]['recipe_count'], 2)
+
+
+class BulkTagsAPITests(TestCase):
+    """Test the bulk tag actions."""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipes = [
+            Recipe.objects.create(
+                title=f'Recipe {index}',
+                time_minutes=10,
+                price=Decimal('2.00'),
+                user=self.user,
+            )
+            for index in range(3)
+        ]
+
+    def test_merge_tags(self):
+        """Test merging moves recipes to the target and deletes sources."""
+        target = Tag.objects.create(user=self.user, name='Vegan')
+        dupe = Tag.objects.create(user=self.user, name='Plant based')
+        other = Tag.objects.create(user=self.user, name='Veggie')
+        self.recipes[0].tags.add(target, dupe)
+        self.recipes[1].tags.add(dupe)
+        self.recipes[2].tags.add(other)
+
+        res = self.client.post(
+            action_url(target.id, 'merge'),
+            {'sources': [dupe.id, other.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 3)
+        self.assertEqual(list(Tag.objects.all()), [target])
+        for recipe in self.recipes:
+            self.assertEqual(list(recipe.tags.all()), [target])
+
+    def test_merge_ignores_other_users_tags(self):
+        """Test tags of other users can't be merged."""
+        target = Tag.objects.create(user=self.user, name='Vegan')
+        other_user = create_user(email='other@example.com')
+        foreign = Tag.objects.create(user=other_user, name='Vegan')
+
+        self.client.post(
+            action_url(target.id, 'merge'),
+            {'sources': [foreign.id]},
+            format='json',
+        )
+
+        self.assertTrue(Tag.objects.filter(id=foreign.id).exists())
+
+    def test_bulk_delete(self):
+        """Test deleting many tags with a single request."""
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ['Quick', 'Cheap', 'Kept']
+        ]
+        self.recipes[0].tags.add(*tags)
+        foreign = Tag.objects.create(
+            user=create_user(email='other@example.com'), name='Quick'
+        )
+
+        res = self.client.post(
+            reverse('recipe:tag-bulk-delete'),
+            {'ids': [tags[0].id, tags[1].id, foreign.id]},
+            format='json',
+        )
+
+        self.assertEqual(res.data, {'deleted': 2})
+        self.assertEqual(list(self.recipes[0].tags.all()), [tags[2]])
+        self.assertTrue(Tag.objects.filter(id=foreign.id).exists())
+
+    def test_assign_and_unassign(self):
+        """Test (un)assigning a tag with a constant number of queries."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+        self.recipes[0].tags.add(tag)
+        foreign = Recipe.objects.create(
+            title='Not mine',
+            time_minutes=10,
+            price=Decimal('2.00'),
+            user=create_user(email='other@example.com'),
+        )
+        ids = [recipe.id for recipe in self.recipes] + [foreign.id]
+
+        res = self.client.post(
+            action_url(tag.id, 'assign'), {'recipes': ids}, format='json'
+        )
+
+        self.assertEqual(res.data['recipe_count'], 3)
+        self.assertFalse(foreign.tags.exists())
+
+        with self.assertNumQueries(5):
+            # Fetching the tag, the savepoint pair, the unassign and
+            # logging the recipes it changed for synced clients.
+            res = self.client.post(
+                action_url(tag.id, 'unassign'),
+                {'recipes': ids[:2]},
+                format='json',
+            )
+
+        tag.refresh_from_db()
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(tag.recipe_count, 1)
+        self.assertEqual(list(self.recipes[2].tags.all()), [tag])
+
+    def test_bulk_request_validated(self):
+        """Test bulk actions need a list of ids."""
+        tag = Tag.objects.create(user=self.user, name='Dinner')
+
+        res = self.client.post(
+            action_url(tag.id, 'assign'), {'recipes': []}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
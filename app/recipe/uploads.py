@@ -0,0 +1,37 @@
+"""
+Storing batches of uploaded recipe images.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django import forms
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from core.models import Recipe
+
+
+def store_image(recipe, upload):
+    """Check an uploaded image of recipe and store it, returning its name."""
+    # Both decode the image, which with writing it is the slow part.
+    forms.ImageField().clean(upload)
+    field = Recipe._meta.get_field('image')
+    name = field.generate_filename(recipe, upload.name)
+    return field.storage.save(name, upload)
+
+
+def store_images(uploads):
+    """Store the images of [(recipe, upload)] in parallel.
+
+    Returns (stored name, None) or (None, errors) for each upload, in
+    order. Threads only read files and write to storage, the database
+    is left to the caller.
+    """
+    def store(item):
+        try:
+            return store_image(*item), None
+        except ValidationError as error:
+            return None, error.messages
+
+    workers = max(1, min(settings.RECIPE_BULK_UPLOAD_WORKERS, len(uploads)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(store, uploads))
@@ -22,4 +22,6 @@ app_name = 'recipe'
 
 urlpatterns = [
     path('', include(router.urls)),
+    # Incremental sync of everything above, see ChangesView.
+    path('changes/', views.ChangesView.as_view(), name='changes'),
 ]
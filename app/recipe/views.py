@@ -1,21 +1,31 @@
 """
 Views for the recipe APIs
 """
-# We're adding feature to achieve searching by tags & ingredients
-from drf_spectacular.utils import (
-    extend_schema_view,
-    extend_schema,
-    OpenApiParameter,
-    OpenApiTypes,
-)
+from django.conf import settings
+from django.db import transaction
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
-from core.models import Recipe, Tag, Ingredient
+from core import jobs, metrics
+from core.cache import get_or_compute, list_key
+from core.db_router import ReplicaReadMixin
+from core.models import Change, Recipe, RecipeStats, Tag, Ingredient
+# We're adding feature to achieve searching by tags & ingredients
+from core.openapi import (
+    extend_schema_view,
+    extend_schema,
+    OpenApiParameter,
+    OpenApiTypes,
+)
 from recipe import serializers
+from recipe.pagination import EstimatedCountPagination
+from recipe.tasks import process_recipe_image
+from recipe.uploads import store_images
 
 
 # These are for update the documentation.
@@ -38,13 +48,35 @@ from recipe import serializers
                 'ingredients',
                 OpenApiTypes.STR,
                 description='Comma seperated list of ingredient IDs to filter',
-            )
+            ),
+            OpenApiParameter(
+                'price_min',
+                OpenApiTypes.DECIMAL,
+                description='Lowest price of the recipes listed.',
+            ),
+            OpenApiParameter(
+                'price_max',
+                OpenApiTypes.DECIMAL,
+                description='Highest price of the recipes listed.',
+            ),
+            OpenApiParameter(
+                'time_max',
+                OpenApiTypes.INT,
+                description='Longest time of the recipes listed, in minutes.',
+            ),
+            OpenApiParameter(
+                'ordering',
+                OpenApiTypes.STR,
+                enum=serializers.RecipeFilterSerializer.ORDERINGS,
+                description='Field to sort by, descending with a "-".',
+            ),
         ]
     )
 )
 # viewsets generate many endpoint,
 # use viewset when you create API with CRUD actions
-class RecipeViewSet(viewsets.ModelViewSet):
+# ReplicaReadMixin serves GET requests from a read replica when configured.
+class RecipeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     # The following texts in dots will generate in api description.
     """View for manage recipe APIs."""
     serializer_class = serializers.RecipeDetailSerializer
@@ -56,29 +88,77 @@ class RecipeViewSet(viewsets.ModelViewSet):
     authentication_classes = [TokenAuthentication]
     # Check user have to be authenticated.
     permission_classes = [IsAuthenticated]
+    # Rate limits are set in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+    throttle_scope = 'recipes'
+    # Lists are paginated when the client passes ?limit=.
+    pagination_class = EstimatedCountPagination
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers."""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _key_to_id(self, key):
+        """Return the recipe id a field name stands for, or None."""
+        # isdigit() alone also accepts digits like '²', which int() rejects.
+        if key.isascii() and key.isdigit() and int(key) <= 2**63 - 1:
+            return int(key)
+        return None
+
     def get_queryset(self):
         """Retrieve recipes for authenticated user."""
         # '-id' is used for order from high id to low id
         tags = self.request.query_params.get('tags')
         ins = self.request.query_params.get('ingredients')
         queryset = self.queryset
+        # Filtering with IN (subquery) instead of joining the link tables
+        # needs no DISTINCT, so counting and paging can stop early.
         if tags:
             tag_ids = self._params_to_ints(tags)
-            # This double underscore(__) usage is documented by Django.
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = queryset.filter(
+                id__in=Recipe.tags.through.objects.filter(
+                    tag_id__in=tag_ids
+                ).values('recipe_id')
+            )
 
         if ins:
             ins_ids = self._params_to_ints(ins)
-            queryset = queryset.filter(ingredients__id__in=ins_ids)
+            queryset = queryset.filter(
+                id__in=Recipe.ingredients.through.objects.filter(
+                    ingredient_id__in=ins_ids
+                ).values('recipe_id')
+            )
+
+        params = serializers.RecipeFilterSerializer(
+            data=self.request.query_params
+        )
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+        if 'price_min' in filters:
+            queryset = queryset.filter(price__gte=filters['price_min'])
+        if 'price_max' in filters:
+            queryset = queryset.filter(price__lte=filters['price_max'])
+        if 'time_max' in filters:
+            queryset = queryset.filter(time_minutes__lte=filters['time_max'])
+
+        # The (user, price, id) and (user, time_minutes, id) indexes serve
+        # these orderings, the id making the order stable across pages.
+        ordering = [filters['ordering']]
+        if ordering[0].lstrip('-') != 'id':
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by(*ordering)
+
+    def maintained_count(self):
+        """Return the number of listed recipes if kept up to date, or None."""
+        params = self.request.query_params
+        filters = ('tags', 'ingredients', 'price_min', 'price_max', 'time_max')
+        if any(params.get(name) for name in filters):
+            return None
+
+        stats = RecipeStats.objects.filter(user=self.request.user).first()
+        return stats.recipe_count if stats else None
 
     def get_serializer_class(self):
         """Return the serializer class for request."""
@@ -87,8 +167,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeSerializer
         # We are building a custom action.
         # ModelViewSet provides default actions such as list, delete, update.
-        elif self.action == 'upload_image':
+        elif self.action in ('upload_image', 'upload_images'):
             return serializers.RecipeImageSerializer
+        elif self.action == 'stats':
+            return serializers.RecipeStatsSerializer
+        elif self.action == 'similar':
+            return serializers.SimilarRecipeSerializer
+        elif self.action == 'pantry':
+            return serializers.PantryRecipeSerializer
 
         return self.serializer_class
 
@@ -98,6 +184,93 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe."""
         serializer.save(user=self.request.user)
 
+    # detail=False puts the action on the list URL: /recipes/stats/.
+    @action(methods=['GET'], detail=False)
+    def stats(self, request):
+        """Return statistics over the recipes of the user."""
+        # The stats are kept current on writes instead of aggregating
+        # every recipe on each request.
+        try:
+            stats = RecipeStats.objects.get(user=request.user)
+        except RecipeStats.DoesNotExist:
+            stats = RecipeStats(user=request.user)
+
+        serializer = self.get_serializer(stats)
+        return Response(serializer.data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'metric',
+                OpenApiTypes.STR, enum=['jaccard', 'cosine'],
+                description='How to compare tag and ingredient sets.',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of recipes to return, up to 100.',
+            ),
+        ],
+    )
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """List the other recipes of the user most like this one."""
+        # Imported here, numpy slows down starting a worker.
+        from recipe.similarity import get_index
+
+        recipe = self.get_object()
+        params = serializers.SimilarQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        ranked = get_index(request.user.id).similar(
+            recipe.id, **params.validated_data
+        )
+        return self._ranked_response(ranked, 'similarity')
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'ingredients',
+                OpenApiTypes.STR, required=True,
+                description='Comma seperated list of ingredient IDs owned',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of recipes to return, up to 100.',
+            ),
+        ],
+    )
+    @action(methods=['GET'], detail=False)
+    def pantry(self, request):
+        """List the recipes of the user the ingredients cover best."""
+        # Imported here, numpy slows down starting a worker.
+        from recipe.similarity import get_index
+
+        params = serializers.PantryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        # The index holds the recipes of each ingredient, so only recipes
+        # using one of them are counted instead of all of the user's.
+        ranked = get_index(request.user.id).pantry(
+            params.validated_data['ingredients'],
+            params.validated_data['limit'],
+        )
+        return self._ranked_response(ranked, 'coverage')
+
+    def _ranked_response(self, ranked, attr):
+        """Serialize the recipes of [(recipe id, score)], in order."""
+        recipes = Recipe.objects.prefetch_related(
+            'tags', 'ingredients'
+        ).in_bulk([recipe_id for recipe_id, _ in ranked])
+        found = []
+        for recipe_id, score in ranked:
+            # Unless deleted since the index was built.
+            if recipe_id in recipes:
+                setattr(recipes[recipe_id], attr, score)
+                found.append(recipes[recipe_id])
+
+        serializer = self.get_serializer(found, many=True)
+        return Response(serializer.data)
+
     # We add a custom action, action decorator is provided by Django.
     # detail=True means this action will only apply to detail endpoints.
     # url_path specify a custom URL path for our action.
@@ -108,11 +281,110 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(recipe, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            metrics.IMAGE_UPLOAD_BYTES.observe(
+                serializer.validated_data['image'].size
+            )
+            recipe = serializer.save()
+            # Resizing happens in a worker, the client needn't wait.
+            jobs.enqueue(
+                process_recipe_image,
+                recipe_id=recipe.id,
+                name=recipe.image.name,
+            )
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        request={'multipart/form-data': OpenApiTypes.OBJECT},
+        description=(
+            'Upload images to many recipes at once. Each file is sent in a '
+            'field named by the id of its recipe. Every image gets its own '
+            'result, with either the image or the errors.'
+        ),
+    )
+    @action(methods=['POST'], detail=False, url_path='upload-images')
+    def upload_images(self, request):
+        """Upload images to many recipes."""
+        # Checked before the body is read. Files past
+        # FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to disk as they come.
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > settings.RECIPE_BULK_UPLOAD_MAX_BYTES:
+            return Response(
+                {'detail': 'The images are too large for one request.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        files = request.FILES
+        if not files:
+            return Response(
+                {'detail': 'No images were sent.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(files) > settings.RECIPE_BULK_UPLOAD_MAX_ITEMS:
+            return Response(
+                {'detail': (
+                    f'At most {settings.RECIPE_BULK_UPLOAD_MAX_ITEMS} '
+                    'images can be sent at once.'
+                )},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        ids = {key: self._key_to_id(key) for key in files}
+        recipes = Recipe.objects.filter(user=request.user).in_bulk([
+            recipe_id for recipe_id in ids.values() if recipe_id is not None
+        ])
+        # Results by field name, files to store and their field names.
+        results = {}
+        uploads = []
+        keys = []
+        for key in files:
+            recipe = recipes.get(ids[key])
+            if recipe is None:
+                results[key] = {'id': key, 'errors': ['Recipe not found.']}
+            elif len(files.getlist(key)) > 1:
+                results[key] = {
+                    'id': recipe.id, 'errors': ['One image per recipe.'],
+                }
+            else:
+                keys.append(key)
+                uploads.append((recipe, files[key]))
+                metrics.IMAGE_UPLOAD_BYTES.observe(files[key].size)
+
+        stored = {}
+        for key, (recipe, _), (name, errors) in zip(
+            keys, uploads, store_images(uploads)
+        ):
+            if errors is not None:
+                results[key] = {'id': recipe.id, 'errors': errors}
+            else:
+                recipe.image = name
+                stored[key] = recipe
+
+        try:
+            with transaction.atomic():
+                Recipe.objects.bulk_update(stored.values(), ['image'])
+                Change.objects.record(Recipe, request.user.id, [
+                    recipe.id for recipe in stored.values()
+                ])
+                # Resizing happens in a worker, the client needn't wait.
+                jobs.enqueue_many(process_recipe_image, [
+                    {'recipe_id': recipe.id, 'name': recipe.image.name}
+                    for recipe in stored.values()
+                ])
+        except Exception:
+            # Files can't be rolled back with the rows.
+            for recipe in stored.values():
+                recipe.image.storage.delete(recipe.image.name)
+            raise
+
+        serializer = self.get_serializer(list(stored.values()), many=True)
+        results.update(zip(stored, serializer.data))
+        return Response([results[key] for key in files])
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -129,29 +401,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
 # cause it can override behaviors
 # Django do the favor of update, after just put in mixins.UpdataModelMixin,
 # the update operation is done.
-class BaseRecipeAttrViewSet(mixins.UpdateModelMixin,
+class BaseRecipeAttrViewSet(ReplicaReadMixin,
+                            mixins.UpdateModelMixin,
                             mixins.ListModelMixin,
                             mixins.DestroyModelMixin,
                             viewsets.GenericViewSet):
     """Base view for recipe attributes"""
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'recipes'
+    pagination_class = EstimatedCountPagination
+    # Request bodies of the bulk actions.
+    bulk_serializers = {
+        'merge': serializers.MergeSerializer,
+        'bulk_delete': serializers.BulkDeleteSerializer,
+        'assign': serializers.AssignSerializer,
+        'unassign': serializers.AssignSerializer,
+    }
+
+    def _assigned_only(self):
+        """Return whether only objects used by recipes are asked for."""
+        try:
+            # bool(1 or 0) -> True or False
+            return bool(
+                # If we don't provide assigned_only, we get default 0.
+                int(self.request.query_params.get('assigned_only', 0))
+            )
+        except ValueError:
+            raise ValidationError({'assigned_only': ['Expected 0 or 1.']})
 
     def get_queryset(self):
         """Retrieve attr for authenticated user."""
-        # bool(1 or 0) -> True or False
-        assigned_only = bool(
-            # If we don't provide assigned_only, we get default 0.
-            int(self.request.query_params.get('assigned_only', 0))
-        )
         queryset = self.queryset
-        if assigned_only:
-            # This means there is a recipe associated with the attr.
-            queryset = queryset.filter(recipe__isnull=False)
+        if self._assigned_only():
+            # recipe_count is maintained on writes, so this is an index
+            # lookup instead of a join against every recipe.
+            queryset = queryset.filter(recipe_count__gt=0)
 
         return queryset.filter(
             user=self.request.user
-        ).order_by('-name').distinct()
+        ).order_by('-name')
+
+    def get_serializer_class(self):
+        """Return the serializer class for request."""
+        return self.bulk_serializers.get(self.action, self.serializer_class)
+
+    def list(self, request, *args, **kwargs):
+        """List the objects of the user, from the cache when unchanged."""
+        paginated = self.paginator.get_limit(request) is not None
+        if paginated or not settings.LIST_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+
+        model = self.queryset.model
+        key = list_key(model, request.user.id, self._assigned_only())
+
+        def compute():
+            queryset = self.get_queryset()
+            return list(self.get_serializer(queryset, many=True).data)
+
+        # Signals in core.signals invalidate the lists on any change.
+        data = get_or_compute(f'{model._meta.model_name}_list', key, compute)
+        return Response(data)
+
+    def _validated(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    # Each bulk action is a single SQL statement, see RecipeAttrQuerySet.
+    @action(methods=['POST'], detail=True)
+    def merge(self, request, pk=None):
+        """Move the recipes of other objects to this one, then delete them."""
+        obj = self.get_object()
+        sources = self._validated(request)['sources']
+        self.queryset.merge(obj, sources)
+        return Response(self.serializer_class(obj).data)
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many objects at once."""
+        ids = self._validated(request)['ids']
+        deleted = self.queryset.bulk_delete(request.user, ids)
+        return Response({'deleted': deleted})
+
+    @action(methods=['POST'], detail=True)
+    def assign(self, request, pk=None):
+        """Add this object to many recipes of the user."""
+        obj = self.get_object()
+        self.queryset.assign(obj, self._validated(request)['recipes'])
+        return Response(self.serializer_class(obj).data)
+
+    @action(methods=['POST'], detail=True)
+    def unassign(self, request, pk=None):
+        """Remove this object from many recipes."""
+        obj = self.get_object()
+        self.queryset.unassign(obj, self._validated(request)['recipes'])
+        return Response(self.serializer_class(obj).data)
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
@@ -165,3 +510,111 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database."""
     serializer_class = serializers.IngredientSerializer
     queryset = Ingredient.objects.all()
+
+
+class ChangesView(APIView):
+    """Feed of the recipes, tags and ingredients changed since a cursor.
+
+    Clients start by taking a cursor, given without ?since=, and then
+    download everything. From then on they ask for the changes since the
+    last cursor they got, until more is false. Changes are listed in the
+    order they were made, each object once, with its current data or as
+    deleted. A 410 means changes were compacted away since the cursor,
+    the client has to start over.
+    """
+    # Not read from a replica: reading numbers the new changes.
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'recipes'
+    # How objects of each kind of change are read and serialized.
+    kinds = {
+        'recipe': (
+            Recipe.objects.prefetch_related('tags', 'ingredients'),
+            serializers.RecipeDetailSerializer,
+        ),
+        'tag': (Tag.objects.all(), serializers.TagSerializer),
+        'ingredient': (
+            Ingredient.objects.all(), serializers.IngredientSerializer,
+        ),
+    }
+
+    def _serialize(self, changes):
+        """Return the feed entries of changes, the last of each object."""
+        latest = {}
+        for change in changes:
+            key = (change.kind, change.object_id)
+            latest.pop(key, None)
+            latest[key] = change
+
+        data = {}
+        for kind, (queryset, serializer_class) in self.kinds.items():
+            ids = [
+                object_id for (k, object_id), change in latest.items()
+                if k == kind and not change.deleted
+            ]
+            if not ids:
+                continue
+            objs = queryset.filter(user=self.request.user).in_bulk(ids)
+            serializer = serializer_class(
+                list(objs.values()), many=True,
+                context={'request': self.request},
+            )
+            for obj, item in zip(objs.values(), serializer.data):
+                data[kind, obj.id] = item
+
+        return [
+            {
+                'seq': change.seq,
+                'type': kind,
+                'id': object_id,
+                # Gone since the change, its tombstone comes later.
+                'deleted': (kind, object_id) not in data,
+                'data': data.get((kind, object_id)),
+            }
+            for (kind, object_id), change in latest.items()
+        ]
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                'since',
+                OpenApiTypes.INT,
+                description='Cursor of the last page of changes read.',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Number of changes to read, up to 1000.',
+            ),
+        ],
+        responses=serializers.ChangesSerializer,
+    )
+    def get(self, request):
+        """List the changes made since a cursor."""
+        params = serializers.ChangesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        since = params.validated_data.get('since')
+        limit = params.validated_data['limit']
+
+        state = Change.objects.seal(request.user.id)
+        if since is None:
+            return Response(
+                {'cursor': state.seq, 'more': False, 'changes': []}
+            )
+        if not state.horizon <= since <= state.seq:
+            return Response(
+                {'detail': 'Changes since this cursor are gone, start over.'},
+                status=status.HTTP_410_GONE,
+            )
+
+        # Read through the (user, seq) index, a page at a time.
+        changes = list(Change.objects.filter(
+            user=request.user, seq__gt=since,
+        ).order_by('seq')[:limit + 1])
+        more = len(changes) > limit
+        changes = changes[:limit]
+        return Response({
+            'cursor': changes[-1].seq if changes else since,
+            'more': more,
+            'changes': self._serialize(changes),
+        })
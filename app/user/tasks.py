@@ -0,0 +1,98 @@
+"""
+Background jobs for the user API.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from core import jobs
+from core.models import Change, Recipe, Tag, Ingredient
+
+
+@transaction.atomic
+def delete_user(user):
+    """Deactivate a user now and purge their data in the background."""
+    user.is_active = False
+    user.deleted_at = timezone.now()
+    user.save(update_fields=['is_active', 'deleted_at'])
+    # Log the user out everywhere right away.
+    Token.objects.filter(user=user).delete()
+    jobs.enqueue(purge_user, user_id=user.pk)
+
+
+def _delete_rows(cursor, model, user_id, batch_size):
+    """Delete a batch of the user's rows of model and their links.
+
+    Returns the ids and images of the deleted rows.
+    """
+    fields = ['id', 'image'] if model is Recipe else ['id']
+    rows = list(
+        model.objects.filter(user_id=user_id).order_by().values_list(
+            *fields
+        )[:batch_size]
+    )
+    ids = [row[0] for row in rows]
+    if not ids:
+        return rows
+
+    # The links are deleted first, because of their foreign keys.
+    for field in Recipe._meta.many_to_many:
+        through = field.remote_field.through
+        if model is Recipe:
+            column = field.m2m_column_name()
+        elif field.related_model is model:
+            column = field.m2m_reverse_name()
+        else:
+            continue
+        cursor.execute(
+            f'DELETE FROM {through._meta.db_table} '
+            f'WHERE {column} = ANY(%s)',
+            [ids],
+        )
+
+    cursor.execute(
+        f'DELETE FROM {model._meta.db_table} WHERE id = ANY(%s)', [ids]
+    )
+    return rows
+
+
+def purge_batch(user_id, batch_size):
+    """Delete one batch of a user's data, returning whether any was left."""
+    # Raw deletes skip the per-object signals and cascade lookups of the
+    # ORM. Counts kept on tags and stats die with the user anyway.
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in (Recipe, Tag, Ingredient, Change):
+            rows = _delete_rows(cursor, model, user_id, batch_size)
+            if rows:
+                break
+
+    # Files can't be rolled back, so they go once the rows are gone.
+    if rows and model is Recipe:
+        storage = Recipe._meta.get_field('image').storage
+        for _, image in rows:
+            if image:
+                storage.delete(image)
+
+    return bool(rows)
+
+
+@jobs.task
+def purge_user(user_id):
+    """Delete a deleted user's data, a bounded batch per transaction."""
+    user = get_user_model().objects.filter(
+        pk=user_id, deleted_at__isnull=False
+    ).first()
+    if user is None:
+        return
+
+    for _ in range(settings.USER_PURGE_BATCHES_PER_JOB):
+        if not purge_batch(user_id, settings.USER_PURGE_BATCH_SIZE):
+            # Only a few rows remain, the ORM can cascade to them.
+            user.delete()
+            return
+
+    # Keep jobs short, so a huge account doesn't look like a dead worker.
+    jobs.enqueue(purge_user, user_id=user_id)
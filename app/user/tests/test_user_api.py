@@ -1,13 +1,22 @@
 """
 Tests for the user API
 """
-from django.test import TestCase
+import os
+from decimal import Decimal
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core import jobs
+from core.models import Job, Recipe, Tag, Ingredient
+from user.tasks import delete_user
+
 
 # These are the API URL that we're going to testing.
 # They would be used many times and would be the end points
@@ -168,3 +177,63 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_user(self):
+        """Test deleting the user deactivates it and queues the purge."""
+        Token.objects.create(user=self.user)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deleted_at)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        self.assertEqual(Job.objects.get().payload, {'user_id': self.user.id})
+
+
+# Batches of 2, and 2 batches per job, so the purge needs several jobs.
+@override_settings(USER_PURGE_BATCH_SIZE=2, USER_PURGE_BATCHES_PER_JOB=2)
+class UserPurgeTests(TestCase):
+    """Test purging the data of deleted users."""
+
+    def create_data(self, user, count):
+        for index in range(count):
+            recipe = Recipe.objects.create(
+                user=user,
+                title=f'Recipe {index}',
+                time_minutes=5,
+                price=Decimal('1.00'),
+            )
+            recipe.tags.add(Tag.objects.create(user=user, name=f'{index}'))
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=user, name=f'{index}')
+            )
+
+    def run_jobs(self):
+        while True:
+            job = jobs.claim()
+            if job is None:
+                return
+            self.assertEqual(jobs.run(job), 'done')
+
+    def test_purge_user(self):
+        """Test a deleted user's data and images are purged in batches."""
+        user = create_user(email='user@example.com', password='test123')
+        other = create_user(email='other@example.com', password='test123')
+        self.create_data(user, 5)
+        self.create_data(other, 1)
+        recipe = Recipe.objects.filter(user=user).first()
+        recipe.image.save('sample.jpg', ContentFile(b'image'))
+        image_path = recipe.image.path
+
+        delete_user(user)
+        self.run_jobs()
+
+        self.assertFalse(get_user_model().objects.filter(id=user.id).exists())
+        self.assertFalse(os.path.exists(image_path))
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertEqual(Recipe.tags.through.objects.count(), 1)
+        self.assertEqual(Recipe.ingredients.through.objects.count(), 1)
@@ -9,11 +9,13 @@ from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
 )
+from user.tasks import delete_user
 
 
 class CreateUserView(generics.CreateAPIView):
     """Create a new user in the system."""
     serializer_class = UserSerializer
+    throttle_scope = 'auth'
 
 
 class CreateTokenView(ObtainAuthToken):
@@ -22,9 +24,12 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     # Optional
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken turns throttling off, so switch it back on.
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    throttle_scope = 'auth'
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user."""
     serializer_class = UserSerializer
     authentication_classes = [authentication.TokenAuthentication]
@@ -34,3 +39,8 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         """Retrieve and return the authenticated user."""
         return self.request.user
+
+    # Deleting returns right away, however much data the user has.
+    def perform_destroy(self, instance):
+        """Deactivate the user and purge their data in the background."""
+        delete_user(instance)